@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+This script compares text output speed of per column print() calls and the buffered TextRenderer
+"""
+import contextlib
+import getopt
+import os
+import sys
+import time
+from typing import List
+
+import firmware_log_parser as parser
+
+
+def usage() -> None:
+    """
+    This function print help menu on the screen
+    :return: None
+    """
+    script_name = os.path.basename(sys.argv[0])
+
+    print('This script benchmarks firmware log text output.               ')
+    print('Syntax: ' + script_name + ' [-n] <records> [-b] <batch_size>   ')
+    print('                       -h, --help         prints help info     ')
+    print('                       -n, --records      number of records, default 200000')
+    print('                       -b, --batch        records per renderer batch, default 4096')
+    exit(1)
+
+
+def synthetic_rows(count: int) -> List[tuple]:
+    """
+    :return: described records as returned by parser.describe_records
+    """
+    return [(i & 0xF, 'HwConfig.c', 2, 'DEPTH', 3, 417, 2339142743 + 160 * i,
+             f'HW config - OTF status inconsistent {i & 1}, 0, 0x{i:x}') for i in range(count)]
+
+
+def print_per_column(rows: List[tuple]) -> None:
+    """
+    Previous output implementation: one print() call per column and one for the line end
+    """
+    columns = parser.output_customisation
+    last_timestamp = None
+
+    for seq_id, f_name, g_id, thread_name_, severity_, line_num, timestamp_, description in rows:
+        delta_timestamp_ = parser.calculate_delta_timestamp(timestamp_, last_timestamp)
+        last_timestamp = timestamp_
+
+        if columns['print_sequence_id']:
+            print('{:<10}'.format(seq_id), end='')
+        if columns['print_file_name']:
+            print('{:<30}'.format(f_name), end='')
+        if columns['print_group_id']:
+            print('{:<10}'.format(g_id), end='')
+        if columns['print_thread_name']:
+            print('{:<13}'.format(thread_name_), end='')
+        if columns['print_severity']:
+            print('{:<10}'.format(severity_), end='')
+        if columns['print_line_num']:
+            print('{:<6}'.format(line_num), end='')
+        if columns['print_timestamp']:
+            print('{:<15}'.format(timestamp_), end='')
+        if columns['print_delta_timestamp']:
+            if type(delta_timestamp_) == float:
+                print('{:<13}'.format(str(delta_timestamp_)[0: 7: 1]), end='')
+            else:
+                print('{:<13}'.format(str(delta_timestamp_)), end='')
+        if columns['print_description']:
+            print('{:<150}'.format(description), end='')
+        print('\n')
+
+
+def render_batches(rows: List[tuple], batch_size: int) -> None:
+    """
+    TextRenderer output, one write per batch
+    """
+    renderer = parser.TextRenderer()
+
+    for start in range(0, len(rows), batch_size):
+        renderer.write(rows[start:start + batch_size])
+
+
+def measure(function, *args) -> float:
+    """
+    :return: run time of the function in seconds, standard output redirected to /dev/null
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    opts = []
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:b:", longopts=['help', 'records=', 'batch='])
+    except getopt.GetoptError as err:
+        print("Error in get opt")
+        usage()
+
+    records = 200000
+    batch_size = 4096
+
+    for opt, arg in opts:
+
+        if opt in ('-h', '--help'):
+            usage()
+        elif opt in ('-n', '--records'):
+            records = int(arg)
+        elif opt in ('-b', '--batch'):
+            batch_size = int(arg)
+
+    rows = synthetic_rows(records)
+
+    per_column = measure(print_per_column, rows)
+    renderer = measure(render_batches, rows, batch_size)
+
+    print(f'per column print  {per_column:.3f} s, {records / per_column:.0f} records/s')
+    print(f'text renderer     {renderer:.3f} s, {records / renderer:.0f} records/s')
+    print(f'speedup           {per_column / renderer:.2f}x')
@@ -0,0 +1,249 @@
+"""
+Firmware log event dictionary (HWLoggerEventsDS5.xml) indexed by id
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Callable, Dict, Tuple
+from xml.etree.ElementTree import iterparse
+
+# compiled dictionary is stored beside the xml file with this suffix
+CACHE_SUFFIX = '.cache'
+CACHE_VERSION = 1
+
+FILE_NOT_FOUND = 'File not found'
+THREAD_NOT_FOUND = 'Thread not found'
+EVENT_NOT_FOUND = 'Event not found'
+
+
+def compile_description(format_str: str, number_args: int) -> Callable[[int, int, int], str]:
+    """
+    Build a function that renders event description from the record data fields
+    :param format_str: format string
+    :type format_str: str
+    :param number_args: number of arguments that string expecting
+    :type number_args: int
+    :return: function of (data1, data2, data3) returning the description string
+    :rtype: Callable
+    """
+    if number_args == 0:
+        return lambda var_1, var_2, var_3: format_str
+
+    format_ = format_str.format
+    if number_args == 1:
+        return lambda var_1, var_2, var_3: format_(var_1)
+    elif number_args == 2:
+        return lambda var_1, var_2, var_3: format_(var_1, var_2)
+    elif number_args == 3:
+        return format_
+
+    wrong_args = format_str + " (Wrong number of arguments read from the log line!)"
+    return lambda var_1, var_2, var_3: wrong_args
+
+
+def _parse_id(value: str):
+    """
+    Convert xml id attribute to int, None if the id is not a decimal number
+    """
+    return int(value) if value.isdigit() else None
+
+
+def file_hash(file_link: str) -> str:
+    """
+    :return: sha256 hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_link, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def default_file_mode() -> int:
+    """
+    :return: permissions of a file created by open() under the current umask
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def read_cache(cache_link: str):
+    """
+    Read compiled dictionary cache
+    :param cache_link: cache file link
+    :type cache_link: str
+    :return: cache content or None if the cache is missing, corrupted or has other version
+    :rtype: dict
+    """
+    try:
+        with open(cache_link, 'rb') as file:
+            cache = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, ValueError):
+        return None
+
+    if type(cache) is not dict or cache.get('version') != CACHE_VERSION:
+        return None
+
+    return cache
+
+
+def write_cache(cache_link: str, cache: dict) -> bool:
+    """
+    Atomically write compiled dictionary cache with the permissions of a regular new file,
+    so other users of the xml directory can read it. A failure to write is not an error
+    :param cache_link: cache file link
+    :type cache_link: str
+    :param cache: cache content
+    :type cache: dict
+    :return: True if the cache was written
+    :rtype: bool
+    """
+    try:
+        fd, temp_link = tempfile.mkstemp(dir=os.path.dirname(cache_link) or '.', suffix='.tmp')
+    except OSError:
+        return False
+
+    try:
+        os.fchmod(fd, default_file_mode())
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_link, cache_link)
+    except OSError:
+        if os.path.exists(temp_link):
+            os.remove(temp_link)
+        return False
+
+    return True
+
+
+class EventDictionary:
+    """
+    Events, files and threads of the firmware log dictionary, keyed by their ids.
+    Lookups are O(1), event format strings are compiled once and reused for every record.
+    """
+
+    def __init__(self, events: Dict[int, Tuple[str, int]] = None, files: Dict[int, str] = None,
+                 threads: Dict[int, str] = None):
+        """
+        :param events: event id -> (format string, number of arguments)
+        :param files: file id -> file name
+        :param threads: thread id -> thread name
+        """
+        self.events = events if events is not None else {}
+        self.files = files if files is not None else {}
+        self.threads = threads if threads is not None else {}
+        self._descriptions = {}
+
+    @classmethod
+    def from_xml(cls, file_link: str) -> 'EventDictionary':
+        """
+        Load dictionary from xml file in one streaming pass
+        :param file_link: xml link
+        :type file_link: str
+        :return: loaded dictionary
+        :rtype: EventDictionary
+        """
+        events = {}
+        files = {}
+        threads = {}
+
+        for _, element in iterparse(file_link, events=('end',)):
+            tag = element.tag
+            _id = _parse_id(element.get('id', ''))
+
+            if _id is not None:
+                if tag == 'Event':
+                    format_str = element.get('format')
+                    number_args = element.get('numberOfArguments')
+                    if _id not in events and (format_str is not None or number_args is not None):
+                        events[_id] = (format_str if format_str is not None else EVENT_NOT_FOUND,
+                                       int(number_args) if number_args is not None else 0)
+                elif tag == 'File':
+                    name = element.get('Name')
+                    if name is not None:
+                        files.setdefault(_id, name)
+                elif tag == 'Thread':
+                    name = element.get('Name')
+                    if name is not None:
+                        threads.setdefault(_id, name)
+
+            element.clear()
+
+        return cls(events, files, threads)
+
+    @classmethod
+    def load(cls, file_link: str, use_cache: bool = True) -> 'EventDictionary':
+        """
+        Load dictionary from xml file through the compiled cache stored beside it.
+        The cache is valid while xml path, modification time and size are unchanged,
+        otherwise it is reused only if the xml content hash matches, and rebuilt if not.
+        :param file_link: xml link
+        :type file_link: str
+        :param use_cache: read and update the cache
+        :type use_cache: bool
+        :return: loaded dictionary
+        :rtype: EventDictionary
+        """
+        if not use_cache:
+            return cls.from_xml(file_link)
+
+        cache_link = file_link + CACHE_SUFFIX
+        stat = os.stat(file_link)
+        key = {'path': os.path.abspath(file_link), 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+        cache = read_cache(cache_link)
+        if cache and all(cache.get(name) == value for name, value in key.items()):
+            return cls(*cache['tables'])
+
+        content_hash = file_hash(file_link)
+        if cache and cache.get('hash') == content_hash:
+            dictionary = cls(*cache['tables'])
+        else:
+            dictionary = cls.from_xml(file_link)
+
+        write_cache(cache_link, dict(key, version=CACHE_VERSION, hash=content_hash,
+                                     tables=(dictionary.events, dictionary.files, dictionary.threads)))
+
+        return dictionary
+
+    def file_name(self, file_id: int) -> str:
+        """
+        :return: file name by file id
+        """
+        return self.files.get(file_id, FILE_NOT_FOUND)
+
+    def thread_name(self, thread_id: int) -> str:
+        """
+        :return: thread name by thread id
+        """
+        return self.threads.get(thread_id, THREAD_NOT_FOUND)
+
+    def format_string(self, event_id: int) -> str:
+        """
+        :return: format string by event id
+        """
+        return self.events.get(event_id, (EVENT_NOT_FOUND, 0))[0]
+
+    def number_of_arguments(self, event_id: int) -> int:
+        """
+        :return: amount of format arguments by event id
+        """
+        return self.events.get(event_id, (EVENT_NOT_FOUND, 0))[1]
+
+    def description(self, event_id: int, data_1: int, data_2: int, data_3: int) -> str:
+        """
+        Build description string of the event from the record data fields
+        :param event_id: event id
+        :type event_id: int
+        :return: final description string
+        :rtype: str
+        """
+        describe = self._descriptions.get(event_id)
+        if describe is None:
+            describe = compile_description(*self.events.get(event_id, (EVENT_NOT_FOUND, 0)))
+            self._descriptions[event_id] = describe
+
+        return describe(data_1, data_2, data_3)
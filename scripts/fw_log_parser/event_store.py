@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+SQLite store of decoded firmware log records, indexed for repeated queries without re-parsing the log.
+Records are ingested by firmware_log_parser.py --store, this script queries the store.
+"""
+import getopt
+import os.path
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from event_dictionary import EventDictionary, file_hash
+
+STORE_VERSION = 3
+
+# stored record fields, in firmware_log_parser.RECORD_FIELDS order followed by the unwrapped time
+STORED_FIELDS = ('magic_number', 'severity', 'thread_id', 'file_id', 'group_id', 'event_id',
+                 'line_number', 'sequence', 'data1', 'data2', 'data3', 'timestamp', 'time')
+
+# fields with an index, queries filter on them
+INDEXED_FIELDS = ('event_id', 'file_id', 'thread_id', 'severity', 'time', 'source_id')
+
+# every ingested log is one source, a log file with already ingested content is not ingested again,
+# a source is complete when all its records are stored, an interrupted ingestion is repeated by the next run
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS info (version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS sources (source_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                                    hash TEXT UNIQUE, ingested REAL NOT NULL, complete INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS events (source_id INTEGER NOT NULL REFERENCES sources (source_id),
+                                   {', '.join(f'{name} INTEGER NOT NULL' for name in STORED_FIELDS)});
+CREATE TABLE IF NOT EXISTS formats (event_id INTEGER PRIMARY KEY, format TEXT NOT NULL, arguments INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS files (file_id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS threads (thread_id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+''' + ''.join(f'CREATE INDEX IF NOT EXISTS events_{name} ON events ({name});\n' for name in INDEXED_FIELDS)
+
+
+def usage() -> None:
+    """
+    This function print help menu on the screen
+    :return: None
+    """
+    script_name = os.path.basename(sys.argv[0])
+
+    print('This script queries firmware log records stored by firmware_log_parser.py --store.')
+    print('Syntax: ' + script_name + ' -s <store> [filters]                ')
+    print('                       -h, --help         prints help info     ')
+    print('                       -s, --store        event store file     ')
+    print('                       -v, --severity     severity, comma separated list')
+    print('                       -f, --file         file name or id, comma separated list')
+    print('                       -t, --thread       thread name or id, comma separated list')
+    print('                       -e, --event        event id, comma separated list')
+    print('                       -S, --source       ingested log path or source id, comma separated list')
+    print('                       --from             first time (10 us ticks of the unwrapped time column)')
+    print('                       --to               last time                ')
+    print('                       -n, --limit        maximal number of printed records')
+    print('                       --count            print only number of matching records and query time')
+    print('                       --sources          list ingested logs')
+    exit(1)
+
+
+class EventStore:
+    """
+    Decoded records in SQLite database with the event dictionary they were described with.
+    Every record refers to the source log it was ingested from, the unwrapped time of the records
+    is comparable only within one source.
+    Every filtered field has its own index, so selective queries read only the matching rows.
+    """
+
+    def __init__(self, file_link: str):
+        """
+        Open or create the store
+        :param file_link: database file, ':memory:' for in memory store
+        :type file_link: str
+        """
+        self.connection = sqlite3.connect(file_link)
+        # every ingested batch is one transaction, WAL avoids syncing the whole database on every commit
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+        version = self.connection.execute('SELECT version FROM info').fetchone()
+        if version is None:
+            with self.connection:
+                self.connection.execute('INSERT INTO info VALUES (?)', (STORE_VERSION,))
+        elif version[0] != STORE_VERSION:
+            self.connection.close()
+            raise ValueError(f'{file_link} has unsupported store version {version[0]}')
+
+        self._insert = f'INSERT INTO events VALUES ({", ".join("?" * (len(STORED_FIELDS) + 1))})'
+
+    def add_dictionary(self, event_dictionary: EventDictionary) -> None:
+        """
+        Store event formats, file and thread names, existing ids are replaced
+        """
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO formats VALUES (?, ?, ?)',
+                                        ((_id, format_str, arguments)
+                                         for _id, (format_str, arguments) in event_dictionary.events.items()))
+            self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?)',
+                                        event_dictionary.files.items())
+            self.connection.executemany('INSERT OR REPLACE INTO threads VALUES (?, ?)',
+                                        event_dictionary.threads.items())
+
+    def add_source(self, name: str, content_hash: str = None, replace: bool = False) -> Optional[int]:
+        """
+        Register a log before its records are ingested, complete_source marks the end of the ingestion
+        :param name: log file path or device
+        :type name: str
+        :param content_hash: hash of the log content, None for logs without a stable content, e.g. followed devices
+        :type content_hash: str
+        :param replace: records of a log with the same content are removed and the log is ingested again
+        :type replace: bool
+        :return: source id, None if a log with the same content is already completely stored and not replaced,
+                 records of an incomplete log with the same content are removed
+        :rtype: int
+        """
+        execute = self.connection.execute
+        with self.connection:
+            if content_hash is not None:
+                stored = execute('SELECT source_id, complete FROM sources WHERE hash = ?', (content_hash,)).fetchone()
+                if stored is not None:
+                    source_id, complete = stored
+                    if complete and not replace:
+                        return None
+                    execute('DELETE FROM events WHERE source_id = ?', (source_id,))
+                    execute('DELETE FROM sources WHERE source_id = ?', (source_id,))
+
+            return execute('INSERT INTO sources (name, hash, ingested) VALUES (?, ?, ?)',
+                           (name, content_hash, time.time())).lastrowid
+
+    def add_log_file(self, file_link: str, replace: bool = False) -> Optional[int]:
+        """
+        Register a log file identified by its content hash, see add_source
+        """
+        return self.add_source(file_link, file_hash(file_link), replace)
+
+    def complete_source(self, source_id: int) -> None:
+        """
+        Mark a log as completely ingested, called after its last batch
+        :param source_id: log returned by add_source
+        :type source_id: int
+        """
+        with self.connection:
+            self.connection.execute('UPDATE sources SET complete = 1 WHERE source_id = ?', (source_id,))
+
+    def sources(self) -> List[tuple]:
+        """
+        :return: (source id, name, content hash, ingest time, complete, number of records) of every ingested log
+        """
+        return self.connection.execute('SELECT sources.*, (SELECT COUNT(*) FROM events '
+                                       'WHERE events.source_id = sources.source_id) '
+                                       'FROM sources ORDER BY source_id').fetchall()
+
+    def add(self, source_id: int, records, times: Sequence[int] = None) -> int:
+        """
+        Ingest one batch of decoded records in one transaction
+        :param source_id: log the records come from, returned by add_source
+        :type source_id: int
+        :param records: list of record tuples or array returned by firmware_log_parser.decode_log
+        :param times: unwrapped time of every record, the record timestamp is used if not given
+        :type times: Sequence[int]
+        :return: number of ingested records
+        :rtype: int
+        """
+        if hasattr(records, 'tolist'):
+            records = records.tolist()
+        if times is None:
+            rows = ((source_id,) + record + (record[-1],) for record in records)
+        else:
+            if hasattr(times, 'tolist'):
+                times = times.tolist()
+            rows = ((source_id,) + record + (time_,) for record, time_ in zip(records, times))
+
+        with self.connection:
+            self.connection.executemany(self._insert, rows)
+
+        return len(records)
+
+    def dictionary(self) -> EventDictionary:
+        """
+        :return: event dictionary stored with the records
+        """
+        execute = self.connection.execute
+        return EventDictionary({_id: (format_str, arguments)
+                                for _id, format_str, arguments in execute('SELECT * FROM formats')},
+                               dict(execute('SELECT * FROM files')),
+                               dict(execute('SELECT * FROM threads')))
+
+    def resolve_ids(self, table: str, values: Sequence[str]) -> List[int]:
+        """
+        Convert file, thread or source names to ids, decimal values are taken as ids
+        :param table: files, threads or sources
+        :type table: str
+        :param values: names or ids
+        :type values: Sequence[str]
+        :return: ids, unknown names are omitted
+        :rtype: List[int]
+        """
+        ids = []
+
+        for value in values:
+            if value.isdigit():
+                ids.append(int(value))
+            else:
+                ids += [_id for _id, in self.connection.execute(f'SELECT {table[:-1]}_id FROM {table} WHERE name = ?',
+                                                                (value,))]
+
+        return ids
+
+    @staticmethod
+    def where(filters: Dict[str, Sequence[int]], first_time: int = None, last_time: int = None):
+        """
+        Build WHERE clause of a query
+        :param filters: indexed field -> accepted values
+        :type filters: Dict[str, Sequence[int]]
+        :param first_time: minimal time, inclusive
+        :type first_time: int
+        :param last_time: maximal time, inclusive
+        :type last_time: int
+        :return: clause and its parameters
+        """
+        conditions = []
+        parameters = []
+
+        for name, values in filters.items():
+            if name not in INDEXED_FIELDS:
+                raise ValueError(f'unknown filter {name}')
+            conditions.append(f'{name} IN ({", ".join("?" * len(values))})')
+            parameters += values
+        if first_time is not None:
+            conditions.append('time >= ?')
+            parameters.append(first_time)
+        if last_time is not None:
+            conditions.append('time <= ?')
+            parameters.append(last_time)
+
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+    def query(self, filters: Dict[str, Sequence[int]] = None, first_time: int = None, last_time: int = None,
+              limit: int = None) -> Iterator[tuple]:
+        """
+        Select stored records in ingest order
+        :param filters: indexed field -> accepted values, records must match all fields
+        :type filters: Dict[str, Sequence[int]]
+        :param first_time: minimal time, inclusive
+        :type first_time: int
+        :param last_time: maximal time, inclusive
+        :type last_time: int
+        :param limit: maximal number of records
+        :type limit: int
+        :return: records as tuples of STORED_FIELDS
+        :rtype: Iterator[tuple]
+        """
+        clause, parameters = self.where(filters or {}, first_time, last_time)
+        clause += ' ORDER BY rowid'
+        if limit is not None:
+            clause += ' LIMIT ?'
+            parameters.append(limit)
+
+        return self.connection.execute(f'SELECT {", ".join(STORED_FIELDS)} FROM events{clause}', parameters)
+
+    def count(self, filters: Dict[str, Sequence[int]] = None, first_time: int = None, last_time: int = None) -> int:
+        """
+        :return: number of stored records matching the filters, see query
+        """
+        clause, parameters = self.where(filters or {}, first_time, last_time)
+        return self.connection.execute(f'SELECT COUNT(*) FROM events{clause}', parameters).fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def parse_list(text: str) -> List[str]:
+    """
+    :return: non-empty items of comma separated list
+    """
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+
+def parse_ids(text: str) -> List[int]:
+    """
+    :return: ids of comma separated list
+    """
+    items = parse_list(text)
+    if not all(item.isdigit() for item in items):
+        raise ValueError(f'wrong id list {text}')
+
+    return [int(item) for item in items]
+
+
+if __name__ == '__main__':
+
+    import firmware_log_parser as parser
+
+    opts = []
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hs:v:f:t:e:S:n:",
+                                   longopts=['help', 'store=', 'severity=', 'file=', 'thread=', 'event=', 'source=',
+                                             'from=', 'to=', 'limit=', 'count', 'sources'])
+    except getopt.GetoptError as err:
+        print("Error in get opt")
+        usage()
+
+    store_link = ''
+    filters = {}
+    names = {}
+    first_time = None
+    last_time = None
+    limit = None
+    count_only = False
+    list_sources = False
+
+    try:
+        for opt, arg in opts:
+
+            if opt in ('-h', '--help'):
+                usage()
+            elif opt in ('-s', '--store'):
+                store_link = arg
+            elif opt in ('-v', '--severity'):
+                filters['severity'] = parse_ids(arg)
+            elif opt in ('-e', '--event'):
+                filters['event_id'] = parse_ids(arg)
+            elif opt in ('-f', '--file'):
+                names['files'] = parse_list(arg)
+            elif opt in ('-t', '--thread'):
+                names['threads'] = parse_list(arg)
+            elif opt in ('-S', '--source'):
+                names['sources'] = parse_list(arg)
+            elif opt == '--from':
+                first_time = int(arg)
+            elif opt == '--to':
+                last_time = int(arg)
+            elif opt in ('-n', '--limit'):
+                limit = int(arg)
+            elif opt == '--count':
+                count_only = True
+            elif opt == '--sources':
+                list_sources = True
+    except ValueError as err:
+        print(f'Error: {err}')
+        exit(1)
+
+    if not os.path.isfile(store_link):
+        print(f'Error: store {store_link} not found')
+        exit(1)
+
+    try:
+        store = EventStore(store_link)
+    except (sqlite3.Error, ValueError) as err:
+        print(f'Error: {err}')
+        exit(1)
+
+    for table, values in names.items():
+        filters[table[:-1] + '_id'] = store.resolve_ids(table, values)
+
+    start = time.perf_counter()
+
+    if list_sources:
+        for source_id, name, content_hash, ingested, complete, count in store.sources():
+            print(f'{source_id:<6}{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ingested))}  '
+                  f'{count:>10} records  {name}{"" if complete else "  (incomplete)"}')
+    elif count_only:
+        count = store.count(filters, first_time, last_time)
+        print(f'{count} records in {(time.perf_counter() - start) * 1000:.1f} ms')
+    else:
+        renderer = parser.TextRenderer()
+        renderer.write_header()
+        records = [record[:-1] for record in store.query(filters, first_time, last_time, limit)]
+        renderer.write(parser.describe_records(records, store.dictionary()))
+
+    store.close()
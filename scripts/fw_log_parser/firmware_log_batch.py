@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+This script parse many firmware logs in parallel
+"""
+import getopt
+import glob
+import multiprocessing
+import os.path
+import sys
+import time
+from typing import List, Tuple
+
+import firmware_log_parser as parser
+from event_dictionary import EventDictionary
+
+# per process decode settings, set by init_worker
+_worker = {}
+
+# width of the source log column of merged text output
+SOURCE_WIDTH = 30
+
+
+def usage() -> None:
+    """
+    This function print help menu on the screen
+    :return: None
+    """
+    script_name = os.path.basename(sys.argv[0])
+
+    print('This script parse many firmware logs in parallel.              ')
+    print('Syntax: ' + script_name + ' [-x] <xml_file> [options] <log_dir_or_glob> ...')
+    print('                       -h, --help         prints help info     ')
+    print('                       -x, --xml-events   xml file             ')
+    print('                       -o, --output-dir   write one parsed file per log into the directory, default .')
+    print('                       -m, --merge        write all records into one file ordered by time, with their source log')
+    print('                       -j, --jobs         number of worker processes, default number of cores')
+    print('                       -e, --engine       decode engine: numpy (default) or ctypes')
+    print('                       --compare-serial   decode again in one process and report the speedup')
+    exit(1)
+
+
+def worker_count(jobs: int = None) -> int:
+    """
+    :return: number of worker processes, one per core by default
+    """
+    return jobs or os.cpu_count() or 1
+
+
+def find_log_files(patterns: List[str]) -> List[str]:
+    """
+    Expand directories and glob patterns to log files
+    :param patterns: directories, files or glob patterns
+    :type patterns: List[str]
+    :return: sorted unique list of files
+    :rtype: List[str]
+    """
+    file_links = set()
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        file_links.update(link for link in glob.glob(pattern) if os.path.isfile(link))
+
+    return sorted(file_links)
+
+
+def init_worker(event_dictionary: EventDictionary, engine: str) -> None:
+    """
+    Process pool initializer, the event dictionary is sent once per worker and used read only
+    """
+    _worker['event_dictionary'] = event_dictionary
+    _worker['engine'] = engine
+
+
+def decode_file(file_link: str) -> List[tuple]:
+    """
+    Decode one log file
+    :param file_link: log file
+    :type file_link: str
+    :return: records returned by parser.describe_records
+    :rtype: List[tuple]
+    """
+    rows = []
+
+    with open(file_link, 'rb') as file:
+        for log_bytes in parser.read_log_records(file):
+            rows += parser.describe_records(parser.decode_log(log_bytes, _worker['engine']),
+                                            _worker['event_dictionary'])
+
+    return rows
+
+
+def base_dir(file_links: List[str]) -> str:
+    """
+    :return: deepest directory containing all log files
+    """
+    return os.path.commonpath([os.path.dirname(os.path.abspath(link)) for link in file_links]) if file_links else ''
+
+
+def source_name(file_link: str, base: str) -> str:
+    """
+    :return: log file path relative to the base directory, unique among logs of the same base
+    """
+    return os.path.relpath(os.path.abspath(file_link), base) if base else os.path.basename(file_link)
+
+
+def output_file_link(file_link: str, output_dir: str, base: str = '') -> str:
+    """
+    Parsed output file of the log file, logs of different directories below base are written
+    into the same subdirectories of output_dir so logs with equal names do not overwrite each other
+    """
+    return os.path.join(output_dir, source_name(file_link, base) + '.txt')
+
+
+def write_log(file_link: str, rows: List[tuple]) -> None:
+    """
+    Write described records as log text with headers
+    """
+    with open(file_link, 'w', encoding='utf-8') as file:
+        renderer = parser.TextRenderer(file)
+        file.write(renderer.header())
+        file.write(renderer.render(rows))
+
+
+def parse_file(args: Tuple[str, str, str]) -> Tuple[str, int]:
+    """
+    Decode one log file into its parsed output file
+    :param args: log file, output directory and base directory of all logs
+    :return: log file and number of records
+    """
+    file_link, output_dir, base = args
+    rows = decode_file(file_link)
+    output_link = output_file_link(file_link, output_dir, base)
+    os.makedirs(os.path.dirname(output_link) or '.', exist_ok=True)
+    write_log(output_link, rows)
+
+    return file_link, len(rows)
+
+
+def unwrap_times(rows: List[tuple]) -> List[int]:
+    """
+    Monotonic time of the records of one log in timestamp ticks, 32-bit counter wraps are unwrapped
+    from the first record of the log by log_timeline.Timeline
+    :param rows: records returned by describe_records
+    :type rows: List[tuple]
+    :return: time of every record
+    :rtype: List[int]
+    """
+    timestamp_index = parser.DESCRIBED_FIELDS.index('timestamp')
+    timestamps = [row[timestamp_index] for row in rows]
+
+    if parser.np is not None:
+        import log_timeline
+        sequence_index = parser.DESCRIBED_FIELDS.index('sequence')
+        return log_timeline.Timeline().update(timestamps, [row[sequence_index] for row in rows])['time'].tolist()
+
+    # numpy is optional, the same signed 32-bit steps are accumulated without it
+    times = []
+    last = None
+    for timestamp in timestamps:
+        if last is None:
+            time_ = timestamp
+        else:
+            time_ += (timestamp - last + parser.TIMESTAMP_HALF_RANGE) % (2 * parser.TIMESTAMP_HALF_RANGE) \
+                     - parser.TIMESTAMP_HALF_RANGE
+        last = timestamp
+        times.append(time_)
+
+    return times
+
+
+def merge_logs(results: List[List[tuple]], sources: List[str]) -> List[Tuple[str, int, tuple]]:
+    """
+    Merge records of many logs ordered by their unwrapped time, records with equal time keep the order of the logs
+    :param results: records of every log
+    :type results: List[List[tuple]]
+    :param sources: name of every log
+    :type sources: List[str]
+    :return: merged (source name, time, record)
+    :rtype: List[Tuple[str, int, tuple]]
+    """
+    return sorted(((source, time_, row) for source, rows in zip(sources, results)
+                   for time_, row in zip(unwrap_times(rows), rows)), key=lambda merged: merged[1])
+
+
+def write_merged_log(file_link: str, merged: List[Tuple[str, int, tuple]]) -> None:
+    """
+    Write merged records as log text with a source log column before the record columns,
+    delta timestamp is taken between consecutive merged records
+    """
+    with open(file_link, 'w', encoding='utf-8') as file:
+        renderer = parser.TextRenderer(file)
+        file.write('{:<{}}'.format('Source', SOURCE_WIDTH) + renderer.header())
+        last_time = None
+        for source, time_, row in merged:
+            delta = parser.calculate_delta_timestamp(time_, last_time)
+            last_time = time_
+            file.write('{:<{}}'.format(source, SOURCE_WIDTH) + renderer.render([row], [delta]))
+
+
+def parse_files(file_links: List[str], event_dictionary: EventDictionary, engine: str = 'numpy', jobs: int = None,
+                output_dir: str = None, merge_link: str = None) -> int:
+    """
+    Decode log files in a process pool, one worker per core by default.
+    With output_dir every log is written into its own parsed file, logs of different directories keep their paths
+    relative to the common directory of all logs. With merge_link all records are written into one file
+    ordered by their unwrapped time.
+    :param file_links: log files
+    :type file_links: List[str]
+    :param event_dictionary: event dictionary
+    :type event_dictionary: EventDictionary
+    :param engine: decode engine
+    :type engine: str
+    :param jobs: number of worker processes, 1 decodes in the calling process
+    :type jobs: int
+    :param output_dir: directory for per log output files
+    :type output_dir: str
+    :param merge_link: combined output file
+    :type merge_link: str
+    :return: number of decoded records
+    :rtype: int
+    """
+    jobs = worker_count(jobs)
+    base = base_dir(file_links)
+
+    if jobs == 1:
+        init_worker(event_dictionary, engine)
+        pool = None
+        map_ = map
+    else:
+        pool = multiprocessing.Pool(jobs, init_worker, (event_dictionary, engine))
+        map_ = pool.imap
+
+    try:
+        if merge_link:
+            results = list(map_(decode_file, file_links))
+            write_merged_log(merge_link, merge_logs(results, [source_name(link, base) for link in file_links]))
+            return sum(len(rows) for rows in results)
+
+        return sum(count for _, count in map_(parse_file, [(link, output_dir or '.', base) for link in file_links]))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def print_throughput(name: str, records: int, elapsed: float) -> float:
+    """
+    Print throughput report line
+    :return: records per second
+    """
+    rate = records / elapsed if elapsed > 0 else 0.0
+    print(f'{name:<10}{records} records in {elapsed:.3f} s, {rate:.0f} records/s')
+
+    return rate
+
+
+if __name__ == '__main__':
+
+    opts = []
+    args = []
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hx:o:m:j:e:",
+                                   longopts=['help', 'xml-events=', 'output-dir=', 'merge=', 'jobs=', 'engine=',
+                                             'compare-serial'])
+    except getopt.GetoptError as err:
+        print("Error in get opt")
+        usage()
+
+    xml_file_link = ''
+    output_dir = '.'
+    merge_link = ''
+    jobs = None
+    decode_engine = 'numpy' if parser.np is not None else 'ctypes'
+    compare_serial = False
+
+    for opt, arg in opts:
+
+        if opt in ('-h', '--help'):
+            usage()
+        elif opt in ('-x', '--xml-events'):
+            xml_file_link = arg
+        elif opt in ('-o', '--output-dir'):
+            output_dir = arg
+        elif opt in ('-m', '--merge'):
+            merge_link = arg
+        elif opt in ('-j', '--jobs'):
+            if not arg.isdigit() or int(arg) < 1:
+                print(f'Error: wrong number of jobs {arg}')
+                exit(1)
+            jobs = int(arg)
+        elif opt in ('-e', '--engine'):
+            decode_engine = arg
+        elif opt == '--compare-serial':
+            compare_serial = True
+
+    if decode_engine not in parser.DECODE_ENGINES or decode_engine == 'numpy' and parser.np is None:
+        print(f'Error: decode engine {decode_engine} is not available')
+        exit(1)
+
+    log_files = find_log_files(args)
+    if not log_files:
+        print('Error: no log files found')
+        exit(1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    event_dictionary = parser.read_xml_file(xml_file_link)
+    jobs = worker_count(jobs)
+
+    try:
+        start = time.perf_counter()
+        count = parse_files(log_files, event_dictionary, decode_engine, jobs, output_dir, merge_link)
+        parallel_rate = print_throughput(f'{jobs} jobs', count, time.perf_counter() - start)
+
+        if compare_serial:
+            start = time.perf_counter()
+            count = parse_files(log_files, event_dictionary, decode_engine, 1, output_dir, merge_link)
+            serial_rate = print_throughput('serial', count, time.perf_counter() - start)
+            if serial_rate:
+                print(f'speedup   {parallel_rate / serial_rate:.2f}x')
+    except (OSError, ValueError) as err:
+        print(f'Error: {err}')
+        exit(1)
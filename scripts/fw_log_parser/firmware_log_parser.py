@@ -4,15 +4,113 @@ This script parse firmware log
 """
 import ctypes
 import getopt
+import io
 import os.path
 import re
+import subprocess
 import sys
+import time
+from collections import deque
 from ctypes import Structure, c_uint16, c_uint32
 
-from typing import List, Any
-
-from xml.dom.minidom import parse
-import xml.dom.minidom
+from typing import BinaryIO, Callable, Iterable, Iterator, List, TextIO, Tuple
+
+from event_dictionary import EventDictionary
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the ctypes engine is used without it
+    np = None
+
+# size of one firmware log record in bytes (five double words)
+RECORD_SIZE = 20
+
+# names of the decoded record fields, in the order both decode engines return them
+RECORD_FIELDS = ('magic_number', 'severity', 'thread_id', 'file_id', 'group_id', 'event_id',
+                 'line_number', 'sequence', 'data1', 'data2', 'data3', 'timestamp')
+
+# fields of records with resolved names, as returned by describe_records
+DESCRIBED_FIELDS = ('sequence', 'file_name', 'group_id', 'thread_name', 'severity', 'line_number', 'timestamp',
+                    'description')
+
+# half of the 32-bit timestamp counter range
+TIMESTAMP_HALF_RANGE = 1 << 31
+
+SEQUENCE_INDEX = RECORD_FIELDS.index('sequence')
+TIMESTAMP_INDEX = RECORD_FIELDS.index('timestamp')
+
+DECODE_ENGINES = ('numpy', 'ctypes')
+
+# number of bytes at the beginning of the log before the first record
+LOG_HEADER_SIZE = 4
+
+EMPTY_RECORD = bytes(RECORD_SIZE)
+
+# maximal number of input bytes read at once
+CHUNK_SIZE = 64 * 1024
+
+NUMBER_PATTERN = re.compile(rb'[0-9]+')
+DIGITS = b'0123456789'
+
+# columns printed by default, in output order
+DEFAULT_COLUMNS = ('sequence', 'file_name', 'group_id', 'thread_name', 'severity', 'line_number', 'timestamp',
+                   'delta_timestamp', 'description')
+
+# all columns that can be selected, columns not in DEFAULT_COLUMNS are not available in text output
+COLUMNS = DEFAULT_COLUMNS + ('magic_number', 'thread_id', 'file_id', 'event_id', 'data1', 'data2', 'data3',
+                             'time', 'dropped')
+
+OUTPUT_FORMATS = ('text', 'csv', 'jsonl', 'parquet', 'arrow', 'npz')
+
+# default set of printed columns, change the print value to False/True to Hide/Show the column
+output_customisation = {'print_sequence_id': True,
+                        'print_file_name': True,
+                        'print_group_id': True,
+                        'print_thread_name': True,
+                        'print_severity': True,
+                        'print_line_num': True,
+                        'print_timestamp': True,
+                        'print_delta_timestamp': True,
+                        'print_description': True}
+
+# text output column widths, in output order
+COLUMN_WIDTHS = {'print_sequence_id': 10,
+                 'print_file_name': 30,
+                 'print_group_id': 10,
+                 'print_thread_name': 13,
+                 'print_severity': 10,
+                 'print_line_num': 6,
+                 'print_timestamp': 15,
+                 'print_delta_timestamp': 13,
+                 'print_description': 150}
+
+LOG_HEADERS = ('Sequence', 'File name', 'Group id', 'Thread name', 'Severity',
+               'Line', 'Timestamp', '\u0394 timestamp', 'Description')
+
+# follow mode: default poll interval in seconds and number of remembered records
+FOLLOW_INTERVAL = 1.0
+FOLLOW_WINDOW = 4096
+
+if np is not None:
+    # raw view over the byte stream: one item per 20 byte record
+    RAW_RECORD_DTYPE = np.dtype([('dword1', '<u4'),
+                                 ('dword2', '<u4'),
+                                 ('dword3', '<u4'),
+                                 ('dword4', '<u4'),
+                                 ('dword5', '<u4')])
+
+    RECORD_DTYPE = np.dtype([('magic_number', np.uint8),
+                             ('severity', np.uint8),
+                             ('thread_id', np.uint8),
+                             ('file_id', np.uint16),
+                             ('group_id', np.uint8),
+                             ('event_id', np.uint16),
+                             ('line_number', np.uint16),
+                             ('sequence', np.uint8),
+                             ('data1', np.uint16),
+                             ('data2', np.uint16),
+                             ('data3', np.uint32),
+                             ('timestamp', np.uint32)])
 
 
 class Dword1(Structure):
@@ -75,47 +173,83 @@ def usage() -> None:
     script_name = os.path.basename(sys.argv[0])
 
     print('This script parse firmware log.                                ')
-    print('In the output_customisation dictionary you can customize output')
+    print('Use --columns or the output_customisation dictionary to customize output')
     print('Syntax: ' + script_name + ' [-f] <firmware_log> [-x] <xml_file>')
     print('OR                                                             ')
     print('Syntax: output | ' + script_name + ' [-x] <xml_file>           ')
     print('                       -h, --help         prints help info     ')
     print('                       -f, --log-file     firmware log file    ')
     print('                       -x, --xml-events   xml file             ')
+    print('                       -e, --engine       decode engine: numpy (default) or ctypes')
+    print('                       -d, --device       read logger snapshot from video device, e.g. /dev/video0')
+    print('                       --follow           keep polling device or log file, print only new records')
+    print('                       -i, --interval     follow mode poll interval in seconds, default 1.0')
+    print('                       -F, --format       output format: text (default), csv, jsonl, parquet, arrow, npz')
+    print('                       -o, --output       output file, standard output for text, csv and jsonl by default')
+    print('                       -c, --columns      comma separated output columns, default:')
+    print('                                          ' + ','.join(DEFAULT_COLUMNS))
+    print('                                          other columns: ' + ','.join(COLUMNS[len(DEFAULT_COLUMNS):]))
+    print('                       --no-cache         do not use compiled xml cache')
+    print('                       --store            ingest records into event store file instead of output,')
+    print('                                          query it with event_store.py')
     exit(1)
 
 
-def read_log_file(file_link: str) -> str:
+def parse_columns(text: str) -> Tuple[str, ...]:
+    """
+    Parse comma separated column names
+    :param text: e.g. 'sequence,timestamp,description'
+    :type text: str
+    :return: column names
+    :rtype: Tuple[str, ...]
+    """
+    columns = tuple(name.strip() for name in text.split(',') if name.strip())
+    unknown = [name for name in columns if name not in COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f'unknown columns {", ".join(unknown)}, available columns: {", ".join(COLUMNS)}')
+
+    return columns
+
+
+def text_columns(columns: Tuple[str, ...]) -> dict:
+    """
+    Convert column names to the text output customisation
+    :param columns: selected columns from DEFAULT_COLUMNS
+    :type columns: Tuple[str, ...]
+    :return: dictionary in output_customisation format
+    :rtype: dict
     """
-    Read all data from log file
+    return {key: name in columns for name, key in zip(DEFAULT_COLUMNS, output_customisation)}
+
+
+def open_log_file(file_link: str) -> BinaryIO:
+    """
+    Open log file for reading
     :param file_link: link to the file with a log
     :type file_link: str
-    :return: all read log
-    :rtype: str
+    :return: file opened in binary mode
+    :rtype: BinaryIO
     """
     if type(file_link) is not str or not os.path.exists(file_link) or not os.path.isfile(file_link):
         print(f'Error: file {file_link} not found')
         exit(1)
 
-    with open(file_link, 'r') as file:
-        data = file.read()
+    return open(file_link, 'rb')
 
-    return data
 
-
-def read_xml_file(file_link: str):
+def read_xml_file(file_link: str, use_cache: bool = True) -> EventDictionary:
     """
     This function read xml file with parsing rules
     :param file_link: xml link
     :type file_link: str
-    :return: object with tree xml data
-    """
-    # Open XML document using minidom parser
-    if xml_file_link and type(xml_file_link) is str and os.path.exists(xml_file_link) and os.path.isfile(xml_file_link):
-        if xml_file_link.endswith('.xml'):
-            dom_tree = xml.dom.minidom.parse(xml_file_link)
-            data = dom_tree.documentElement
-            return data
+    :param use_cache: use compiled dictionary cache stored beside the xml file
+    :type use_cache: bool
+    :return: event dictionary indexed by ids
+    :rtype: EventDictionary
+    """
+    if file_link and type(file_link) is str and os.path.exists(file_link) and os.path.isfile(file_link):
+        if file_link.endswith('.xml'):
+            return EventDictionary.load(file_link, use_cache)
         else:
             print(f'Error: file {file_link} has wrong format')
             exit(1)
@@ -124,313 +258,529 @@ def read_xml_file(file_link: str):
         exit(1)
 
 
-def read_pipe_input():
+def read_chunks(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
     """
-    This function read input from pipe
-    :return: input from pipe
-    :rtype: str
+    Read input by chunks, returning data as soon as it is available
+    :param file: file or pipe opened in binary mode
+    :type file: BinaryIO
+    :param chunk_size: maximal size of one chunk
+    :type chunk_size: int
+    :return: generator of read chunks
+    :rtype: Iterator[bytes]
     """
-    lines = ''
-    for log_line in sys.stdin:
-        lines += log_line
+    read = getattr(file, 'read1', file.read)
 
-    return lines
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
 
 
-def remove_lines_containing_only_zeros(matrix: List[list]):
+def tokenize_log(chunks: Iterable[bytes]) -> Iterator[bytes]:
     """
-    This function remove line with zeros from a matrix
-    :param matrix: List that contains List of strings
-    :type matrix: List[list] str
-    :return: new List that contains List of strings
-    :rtype: List[list] str
+    Parse decimal numbers of the log text into bytes. Number split between two chunks
+    is kept until the next chunk arrives.
+    :param chunks: log text chunks
+    :type chunks: Iterable[bytes]
+    :return: generator of parsed log bytes, one block per chunk
+    :rtype: Iterator[bytes]
     """
-    new_matrix = []
+    tail = b''
+
+    for chunk in chunks:
+        text = tail + chunk
+
+        end = len(text)
+        while end and text[end - 1] in DIGITS:
+            end -= 1
+        tail = text[end:]
 
-    for line in matrix:
-        if not all(num == '0' for num in line) and len(line) > 0:
-            new_matrix.append(line)
+        yield bytes(int(number) for number in NUMBER_PATTERN.findall(text, 0, end))
 
-    return new_matrix
+    if tail:
+        yield bytes([int(tail)])
 
 
-def remove_first_bytes(log: list, number_bytes: int) -> list:
+def drop_zero_records(records: bytes) -> bytes:
     """
-    This function remove first N given nodes from a list.
-    :param log: list with strings
-    :type log: list
-    :param number_bytes: numer of first nodes that needs remove
-    :type number_bytes: int
-    :return: edited list
-    :rtype: list
+    Remove records containing only zeros
+    :param records: complete log records
+    :type records: bytes
+    :return: records without empty ones
+    :rtype: bytes
     """
-    if log and type(log) is list and type(number_bytes) is int and 0 < number_bytes < len(log):
-        for i in range(number_bytes):
-            log.pop(0)
+    if EMPTY_RECORD not in records:
+        return records
 
-    return log
+    return b''.join(records[offset:offset + RECORD_SIZE] for offset in range(0, len(records), RECORD_SIZE)
+                    if records[offset:offset + RECORD_SIZE] != EMPTY_RECORD)
 
 
-def split_log(log: list, length_of_list: int = 20) -> List[List[Any]]:
+def split_records(blocks: Iterable[bytes], header_size: int = LOG_HEADER_SIZE) -> Iterator[bytes]:
     """
-    This function splits one list to list with length length_of_list size.
-    :param log: list of data
-    :type log: list
-    :param length_of_list: size of small list
-    :type length_of_list: int
-    :return: list of list
-    :rtype: list
+    Skip log header and group log bytes into complete records.
+    Incomplete record is kept until the rest of its bytes arrive, empty records are removed.
+    :param blocks: log bytes
+    :type blocks: Iterable[bytes]
+    :param header_size: number of log header bytes to skip
+    :type header_size: int
+    :return: generator of complete records, many records per item
+    :rtype: Iterator[bytes]
     """
-    bytes_in_log_line = 20
+    pending = bytearray()
+
+    for block in blocks:
+        if header_size:
+            skipped = min(header_size, len(block))
+            block = block[skipped:]
+            header_size -= skipped
 
-    if log and type(log) is list and type(length_of_list) is int:
-        return [log[i:i + bytes_in_log_line] for i in range(0, len(log), length_of_list)]
+        pending += block
+        complete = len(pending) - len(pending) % RECORD_SIZE
+        if complete:
+            records = drop_zero_records(bytes(pending[:complete]))
+            del pending[:complete]
+            if records:
+                yield records
 
 
-def print_log_headers() -> None:
+def read_log_records(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
     """
-    Print headers to a console
-    :return: None
+    Streaming input pipeline: read log text by chunks and return complete records
+    as soon as they are available, memory usage does not depend on the input size
+    :param file: file or pipe opened in binary mode
+    :type file: BinaryIO
+    :param chunk_size: maximal size of one read chunk
+    :type chunk_size: int
+    :return: generator of complete records, many records per item
+    :rtype: Iterator[bytes]
+    """
+    return split_records(tokenize_log(read_chunks(file, chunk_size)))
+
+
+def read_device_logger(device: str) -> bytes:
+    """
+    Read one logger snapshot from the camera
+    :param device: video device, e.g. /dev/video0
+    :type device: str
+    :return: v4l2-ctl output with the logger control
+    :rtype: bytes
     """
-    print_format_log_line('Sequence', 'File name', 'Group id', 'Thread name', 'Severity',
-                          'Line', 'Timestamp', '\u0394 timestamp', 'Description')
+    return subprocess.run(['v4l2-ctl', '-d', device, '-C', 'logger'], check=True, capture_output=True).stdout
 
 
-def get_file_name_from_xml(_id: str) -> str:
+class LogFileFollower:
     """
-    This function get file name from xml data by file id
-    :param _id: file id number
-    :type _id: str
-    :return: file name
-    :rtype: str
+    Return complete lines appended to a log file since the previous call.
+    The file is read from the beginning again when it is replaced or rewritten.
     """
-    global xml_data
 
-    if type(_id) is str:
-        files = xml_data.getElementsByTagName('File')
+    def __init__(self, file_link: str):
+        self.file_link = file_link
+        self.offset = 0
+        self.inode = None
+        self.mtime = None
 
-        for f in files:
-            if f.hasAttribute('id') and f.hasAttribute('Name'):
-                file_id_xml = f.getAttribute('id')
-                if file_id_xml == _id:
-                    return f.getAttribute('Name')
+    def __call__(self) -> bytes:
+        try:
+            stat = os.stat(self.file_link)
+        except FileNotFoundError:
+            return b''
 
-    return 'File not found'
+        rewritten = stat.st_mtime_ns != self.mtime and stat.st_size <= self.offset
+        if stat.st_ino != self.inode or stat.st_size < self.offset or rewritten:
+            self.offset = 0
+        self.inode = stat.st_ino
+        self.mtime = stat.st_mtime_ns
 
+        with open(self.file_link, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read()
 
-def get_thread_name_from_xml(thread_id: int) -> str:
-    """
-    Scan xml for thread name according given thread id
-    :param tread_id: thread id
-    :type tread_id: int
-    :return: thread name
-    :rtype str
-    """
-    global xml_data
+        # the last line may be still in writing
+        end = data.rfind(b'\n') + 1
+        self.offset += end
 
-    if type(thread_id) is int:
-        threads = xml_data.getElementsByTagName('Thread')
+        return data[:end]
 
-        for t in threads:
-            if t.hasAttribute('id') and t.hasAttribute('Name'):
-                thread_id_xml = t.getAttribute('id')
-                if thread_id_xml == str(thread_id):
-                    return t.getAttribute('Name')
 
-    return 'Thread not found'
+def parse_snapshots(data: bytes) -> bytes:
+    """
+    Parse logger snapshots, one snapshot per line, each snapshot starts with its own log header
+    :param data: lines of v4l2-ctl logger output
+    :type data: bytes
+    :return: complete non empty records of all snapshots
+    :rtype: bytes
+    """
+    return b''.join(records for line in data.splitlines() if line.strip()
+                    for records in split_records(tokenize_log([line])))
 
 
-def get_format_string_from_xml(_id: str) -> str:
+class RecordDeduplicator:
     """
-    This function get format string from xml data by event id
-    :param _id: event id
-    :type _id: str
-    :return: format string
-    :rtype: str
+    Drop records already returned from previous reads, records are identified by timestamp and sequence.
+    Only the last `window` records are remembered.
     """
-    global xml_data
 
-    if type(_id) is str:
-        events = xml_data.getElementsByTagName('Event')
+    def __init__(self, window: int = FOLLOW_WINDOW):
+        self.window = window
+        self.keys = deque()
+        self.seen = set()
 
-        for event in events:
-            if event.hasAttribute('id') and event.hasAttribute('format'):
-                id_xml = event.getAttribute('id')
-                if id_xml == _id:
-                    return event.getAttribute('format')
+    def new_records(self, records: List[tuple]) -> List[tuple]:
+        """
+        :param records: decoded records of one snapshot
+        :type records: List[tuple]
+        :return: records not seen in previous snapshots
+        :rtype: List[tuple]
+        """
+        fresh = [record for record in records if (record[TIMESTAMP_INDEX], record[SEQUENCE_INDEX]) not in self.seen]
 
-    return 'Event not found'
+        for record in fresh:
+            key = (record[TIMESTAMP_INDEX], record[SEQUENCE_INDEX])
+            if key not in self.seen:
+                self.seen.add(key)
+                self.keys.append(key)
 
+        while len(self.keys) > self.window:
+            self.seen.discard(self.keys.popleft())
 
-def get_number_of_arguments_from_xml(_id: str) -> int:
+        return fresh
+
+
+def follow_log(read_snapshot: Callable[[], bytes], engine: str = 'numpy', interval: float = FOLLOW_INTERVAL,
+               max_polls: int = None) -> Iterator[List[tuple]]:
     """
-    This function get amount of arguments in format by event id from xml file
-    :param: event_id: event id
-    :type: event_id: str
-    :return: amount of parameters
-    :rtype: int
+    Poll logger snapshots and return only new decoded records
+    :param read_snapshot: function returning new logger output, e.g. LogFileFollower or read_device_logger
+    :type read_snapshot: Callable[[], bytes]
+    :param engine: decode engine
+    :type engine: str
+    :param interval: poll interval in seconds
+    :type interval: float
+    :param max_polls: stop after this number of polls, None to poll forever
+    :type max_polls: int
+    :return: generator of new records, one list per poll that found new records
+    :rtype: Iterator[List[tuple]]
     """
-    global xml_data
+    deduplicator = RecordDeduplicator()
+    polls = 0
+    next_poll = time.monotonic()
 
-    if type(_id) is str:
-        events = xml_data.getElementsByTagName('Event')
+    while max_polls is None or polls < max_polls:
+        records = deduplicator.new_records(decode_log(parse_snapshots(read_snapshot()), engine))
+        polls += 1
+        if records:
+            yield records
 
-        for event in events:
-            if event.hasAttribute('id') and event.hasAttribute('numberOfArguments'):
-                id_xml = event.getAttribute('id')
-                if id_xml == _id:
-                    return int(event.getAttribute('numberOfArguments'))
+        if max_polls is None or polls < max_polls:
+            next_poll += interval
+            time.sleep(max(0.0, next_poll - time.monotonic()))
 
-    return 0
 
-
-def get_double_word(bytes_: list) -> int:
+def get_double_word(bytes_: bytes, byte_pointer: int) -> int:
     """
     This function return double word
     :param bytes_: bytes in row log
-    :type bytes_: list
+    :type bytes_: bytes
+    :param byte_pointer: index of the first byte of the double word
+    :type byte_pointer: int
     :return: double word
     :rtype: int
     """
-    global byte_pointer
     size_of_byte = 8
     bytes_in_dword = 4
 
     dword = 0
 
     for i in range(bytes_in_dword):
-        byte = int(bytes_[byte_pointer])
+        byte = int(bytes_[byte_pointer + i])
         byte <<= i * size_of_byte
         dword |= byte
 
-        byte_pointer += 1
-
     return dword
 
 
-def get_description_string(format_str: str, number_args: int, var_1, var_2, var_3) -> str:
-    """
-    This function build description string
-    :param format_str: format string
-    :type format_str: str
-    :param number_args: number of arguments that string expecting
-    :type number_args: int
-    :param var_1:
-    :type var_1:
-    :param var_2:
-    :type var_2:
-    :param var_3:
-    :type var_3:
-    :return: final description string
-    :rtype: int
+def decode_log_ctypes(log_bytes: bytes) -> List[tuple]:
     """
-    if number_args == 0:
-        string = format_str
-        return string
-    elif number_args == 1:
-        string = format_str.format(var_1)
-        return string
-    elif number_args == 2:
-        string = format_str.format(var_1, var_2)
-        return string
-    elif number_args == 3:
-        string = format_str.format(var_1, var_2, var_3)
-        return string
-    else:
-        return format_str + " (Wrong number of arguments read from the log line!)"
+    Reference decode engine: decodes every record with the ctypes double word unions.
+    Records that contain only zeros are skipped, trailing incomplete record is ignored.
+    :param log_bytes: raw log bytes, without the log header
+    :type log_bytes: bytes
+    :return: decoded records, one tuple per record with values in RECORD_FIELDS order
+    :rtype: List[tuple]
+    """
+    records = []
+
+    for offset in range(0, len(log_bytes) - RECORD_SIZE + 1, RECORD_SIZE):
+        row_bytes = log_bytes[offset:offset + RECORD_SIZE]
+        if not any(row_bytes):
+            continue
+
+        dword1 = Dword1Union()
+        dword1.as_byte = get_double_word(row_bytes, 0)
+
+        dword2 = Dword2Union()
+        dword2.as_byte = get_double_word(row_bytes, 4)
+
+        dword3 = Dword3Union()
+        dword3.as_byte = get_double_word(row_bytes, 8)
+
+        dword4 = Dword4Union()
+        dword4.as_byte = get_double_word(row_bytes, 12)
+
+        dword5 = Dword5Union()
+        dword5.as_byte = get_double_word(row_bytes, 16)
+
+        records.append((dword1.bytes.magic_number,
+                        dword1.bytes.severity,
+                        dword1.bytes.thread_id,
+                        dword1.bytes.field_id,
+                        dword1.bytes.group_id,
+                        dword2.bytes.event_id,
+                        dword2.bytes.line_number,
+                        dword2.bytes.sequence,
+                        dword3.bytes.data1,
+                        dword3.bytes.data2,
+                        dword4.bytes.data3,
+                        dword5.bytes.timestamp))
+
+    return records
 
 
-def print_format_log_line(seq_id, f_name, g_id, thread_name_, severity_, line_num,
-                          timestamp_, delta_timestamp_, description) -> None:
+def decode_log_numpy(log_bytes: bytes):
     """
-    Prints string of parsed log line according format
-    :param seq_id: sequence id
-    :param f_name: file name
-    :param g_id: group id
-    :param thread_name_: thread name
-    :param severity_: severity
-    :param line_num: line number
-    :param timestamp_: timestamp
-    :param delta_timestamp_: delta timestamp
-    :param description: error description
+    Vectorized decode engine: views the whole byte stream as an array of records
+    and extracts all bit fields with shifts and masks.
+    Records that contain only zeros are skipped, trailing incomplete record is ignored.
+    :param log_bytes: raw log bytes, without the log header
+    :type log_bytes: bytes
+    :return: decoded records
+    :rtype: numpy.ndarray of RECORD_DTYPE
     """
-    global output_customisation
+    count = len(log_bytes) // RECORD_SIZE
+    raw = np.frombuffer(log_bytes, dtype=RAW_RECORD_DTYPE, count=count)
 
-    if output_customisation['print_sequence_id']:
-        print('{:<10}'.format(seq_id), end='')
+    # drop records with all bytes zero
+    not_empty = np.frombuffer(log_bytes, dtype=np.uint8, count=count * RECORD_SIZE).reshape(count, RECORD_SIZE).any(axis=1)
+    raw = raw[not_empty]
 
-    if output_customisation['print_file_name']:
-        print('{:<30}'.format(f_name), end='')
+    dword1 = raw['dword1']
+    dword2 = raw['dword2']
+    dword3 = raw['dword3']
 
-    if output_customisation['print_group_id']:
-        print('{:<10}'.format(g_id), end='')
+    records = np.empty(len(raw), dtype=RECORD_DTYPE)
 
-    if output_customisation['print_thread_name']:
-        print('{:<13}'.format(thread_name_), end='')
+    # double word 1 scope
+    records['magic_number'] = dword1 & 0xFF
+    records['severity'] = (dword1 >> 8) & 0x1F
+    records['thread_id'] = (dword1 >> 13) & 0x07
+    records['file_id'] = (dword1 >> 16) & 0x7FF
+    records['group_id'] = (dword1 >> 27) & 0x1F
 
-    if output_customisation['print_severity']:
-        print('{:<10}'.format(severity_), end='')
+    # double word 2 scope
+    records['event_id'] = dword2 & 0xFFFF
+    records['line_number'] = (dword2 >> 16) & 0xFFF
+    records['sequence'] = (dword2 >> 28) & 0x0F
 
-    if output_customisation['print_line_num']:
-        print('{:<6}'.format(line_num), end='')
+    # double word 3 scope
+    records['data1'] = dword3 & 0xFFFF
+    records['data2'] = dword3 >> 16
 
-    if output_customisation['print_timestamp']:
-        print('{:<15}'.format(timestamp_), end='')
+    # double word 4 and 5 scope
+    records['data3'] = raw['dword4']
+    records['timestamp'] = raw['dword5']
 
-    if output_customisation['print_delta_timestamp']:
-        if type(delta_timestamp_) == float:
-            print('{:<13}'.format(str(delta_timestamp_)[0: 7: 1]), end='')
-        else:
-            print('{:<13}'.format(str(delta_timestamp_)), end='')  # print header
+    return records
 
-    if output_customisation['print_description']:
-        print('{:<150}'.format(description), end='')
 
-    print('\n')
+def decode_log(log_bytes: bytes, engine: str = 'numpy', as_array: bool = False) -> List[tuple]:
+    """
+    Decode raw log bytes with the selected engine
+    :param log_bytes: raw log bytes, without the log header
+    :type log_bytes: bytes
+    :param engine: 'numpy' or 'ctypes'
+    :type engine: str
+    :param as_array: return numpy array of RECORD_DTYPE, requires numpy for both engines
+    :type as_array: bool
+    :return: decoded records, one tuple per record with values in RECORD_FIELDS order
+    :rtype: List[tuple]
+    """
+    if engine == 'numpy':
+        records = decode_log_numpy(log_bytes)
+        return records if as_array else records.tolist()
+
+    records = decode_log_ctypes(log_bytes)
+    return as_record_array(records) if as_array else records
+
+
+def as_record_array(records):
+    """
+    Convert decoded records to numpy array
+    :param records: list of record tuples or array of RECORD_DTYPE
+    :return: array of RECORD_DTYPE
+    :rtype: numpy.ndarray
+    """
+    if isinstance(records, np.ndarray):
+        return records
+
+    return np.array(records, dtype=RECORD_DTYPE)
 
 
 def calculate_delta_timestamp(timestamp, last_timestamp) -> int:
     """
-    Calculates delta timestamp between previous and current timestamp
+    Calculates delta timestamp between previous and current timestamp.
+    The difference is taken modulo 2^32 as signed value, so wrap of the 32-bit timestamp counter
+    gives a small positive delta and a record older than the previous one a negative delta.
     :param timestamp:
-    :type timestamp:
-    :param last_timestamp:
-    :type last_timestamp:
-    :return: delta timestamp
+    :type timestamp: int
+    :param last_timestamp: None for the first record
+    :type last_timestamp: int
+    :return: delta timestamp in seconds, 0 for the first record
     :rtype: int
     """
     timestamp_factor = 0.00001
 
-    if not last_timestamp:
+    if last_timestamp is None:
         return 0
     else:
-        return (timestamp - last_timestamp) * timestamp_factor
+        return ((timestamp - last_timestamp + TIMESTAMP_HALF_RANGE) % (2 * TIMESTAMP_HALF_RANGE)
+                - TIMESTAMP_HALF_RANGE) * timestamp_factor
 
 
-if __name__ == '__main__':
+def timeline_deltas(times: dict, first: bool) -> list:
+    """
+    Delta timestamps of a timeline batch in calculate_delta_timestamp format
+    :param times: batch returned by log_timeline.Timeline.update
+    :type times: dict
+    :param first: the batch starts with the very first record
+    :type first: bool
+    :return: list of deltas, int 0 for the very first record
+    :rtype: list
+    """
+    deltas = times['delta'].tolist()
+    if first and deltas:
+        deltas[0] = 0
+
+    return deltas
+
+
+def describe_records(records: List[tuple], event_dictionary: EventDictionary) -> List[tuple]:
+    """
+    Resolve names and descriptions of decoded records
+    :param records: decoded records
+    :type records: List[tuple]
+    :param event_dictionary: event dictionary
+    :type event_dictionary: EventDictionary
+    :return: one tuple per record with values in DESCRIBED_FIELDS order
+    :rtype: List[tuple]
+    """
+    file_name = event_dictionary.file_name
+    thread_name = event_dictionary.thread_name
+    description = event_dictionary.description
+
+    return [(sequence, file_name(file_id), group_id, thread_name(thread_id), severity, line_number, timestamp,
+             description(event_id, data_1, data_2, data_3))
+            for (magic_number, severity, thread_id, file_id, group_id, event_id, line_number, sequence,
+                 data_1, data_2, data_3, timestamp) in records]
+
+
+class TextRenderer:
+    """
+    Render described records as text table. Every batch of records is formatted into one buffer
+    with a single precompiled line template and written with one write call.
+    """
+
+    def __init__(self, file: TextIO = None, columns: dict = None):
+        """
+        :param file: output text file, standard output by default
+        :param columns: printed columns, output_customisation by default
+        """
+        if columns is None:
+            columns = output_customisation
+
+        self.file = file if file is not None else sys.stdout
+        self.template = ''.join('{%d:<%d}' % (index, width)
+                                for index, (key, width) in enumerate(COLUMN_WIDTHS.items()) if columns[key]) + '\n\n'
+        self.last_timestamp = None
+
+    def header(self) -> str:
+        """
+        :return: formatted table header
+        """
+        return self.template.format(*LOG_HEADERS)
+
+    def render(self, rows: List[tuple], deltas: list = None) -> str:
+        """
+        Format described records, delta timestamp continues from the previously rendered batch
+        :param rows: records returned by describe_records
+        :type rows: List[tuple]
+        :param deltas: delta timestamps of the records, calculated from the rows if not given
+        :type deltas: list
+        :return: formatted text
+        :rtype: str
+        """
+        buffer = io.StringIO()
+        write = buffer.write
+        format_line = self.template.format
+        last_timestamp = self.last_timestamp
+
+        for index, (sequence, file_name, group_id, thread_name, severity, line_number, timestamp,
+                    description) in enumerate(rows):
+            if deltas is None:
+                delta_timestamp = calculate_delta_timestamp(timestamp, last_timestamp)
+            else:
+                delta_timestamp = deltas[index]
+            last_timestamp = timestamp
+
+            # delta timestamp is truncated to 7 characters
+            delta_timestamp = str(delta_timestamp)[0: 7: 1] if type(delta_timestamp) == float else str(delta_timestamp)
+            write(format_line(sequence, file_name, group_id, thread_name, severity, line_number, timestamp,
+                              delta_timestamp, description))
+
+        self.last_timestamp = last_timestamp
+
+        return buffer.getvalue()
+
+    def write_header(self) -> None:
+        self.file.write(self.header())
+        self.file.flush()
+
+    def write(self, rows: List[tuple], deltas: list = None) -> None:
+        """
+        Render and write one batch of described records
+        """
+        self.file.write(self.render(rows, deltas))
+        self.file.flush()
+
 
-    output_customisation = {'print_sequence_id': True,
-                            'print_file_name': True,
-                            'print_group_id': True,
-                            'print_thread_name': True,
-                            'print_severity': True,
-                            'print_line_num': True,
-                            'print_timestamp': True,
-                            'print_delta_timestamp': True,
-                            'print_description': True}
+if __name__ == '__main__':
 
     opts = []
     args = ""
 
     # parse command-line:
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hf:x:", longopts=['help', 'log-file', 'xml-events'])
+        opts, args = getopt.getopt(sys.argv[1:], "hf:x:e:d:i:F:o:c:",
+                                   longopts=['help', 'log-file=', 'xml-events=', 'engine=', 'device=', 'follow',
+                                             'interval=', 'format=', 'output=', 'columns=', 'no-cache',
+                                             'store='])
     except getopt.GetoptError as err:
         print("Error in get opt")
         usage()
 
     log_file_link = ''
     xml_file_link = ''
+    device = ''
+    follow = False
+    follow_interval = FOLLOW_INTERVAL
+    decode_engine = 'numpy' if np is not None else 'ctypes'
+    output_format = 'text'
+    output_link = ''
+    columns = tuple(name for name, key in zip(DEFAULT_COLUMNS, output_customisation) if output_customisation[key])
+    use_xml_cache = True
+    store_link = ''
 
     for opt, arg in opts:
 
@@ -440,74 +790,154 @@ if __name__ == '__main__':
             log_file_link = arg
         elif opt in ('-x', '--xml-events'):
             xml_file_link = arg
+        elif opt in ('-e', '--engine'):
+            decode_engine = arg
+        elif opt in ('-d', '--device'):
+            device = arg
+        elif opt == '--follow':
+            follow = True
+        elif opt in ('-i', '--interval'):
+            try:
+                follow_interval = float(arg)
+            except ValueError:
+                print(f'Error: wrong interval {arg}')
+                exit(1)
+        elif opt in ('-F', '--format'):
+            output_format = arg
+        elif opt in ('-o', '--output'):
+            output_link = arg
+        elif opt in ('-c', '--columns'):
+            try:
+                columns = parse_columns(arg)
+            except ValueError as err:
+                print(f'Error: {err}')
+                exit(1)
+        elif opt == '--no-cache':
+            use_xml_cache = False
+        elif opt == '--store':
+            store_link = arg
+
+    if decode_engine not in DECODE_ENGINES:
+        print(f'Error: unknown decode engine {decode_engine}')
+        exit(1)
+    if decode_engine == 'numpy' and np is None:
+        print('Error: numpy decode engine requires numpy to be installed')
+        exit(1)
+    if follow and not (device or log_file_link):
+        print('Error: follow mode requires device or log file')
+        exit(1)
+    if output_format not in OUTPUT_FORMATS:
+        print(f'Error: unknown output format {output_format}')
+        exit(1)
+    if output_format == 'text' and not set(columns) <= set(DEFAULT_COLUMNS):
+        print(f'Error: text output supports only columns {",".join(DEFAULT_COLUMNS)}')
+        exit(1)
+    if output_format != 'text' and np is None:
+        print(f'Error: {output_format} output requires numpy to be installed')
+        exit(1)
 
-    xml_data = read_xml_file(xml_file_link)
-    if log_file_link == '':
-        logs_str = read_pipe_input()
+    event_dictionary = read_xml_file(xml_file_link, use_xml_cache)
+
+    if np is not None:
+        import log_timeline
+
+    store = None
+    sink = None
+
+    if store_link:
+        import event_store
+        try:
+            store = event_store.EventStore(store_link)
+            store.add_dictionary(event_dictionary)
+            # a log file is identified by its content, device snapshots and followed logs are always new sources
+            if log_file_link and not follow:
+                source_id = store.add_log_file(log_file_link)
+            else:
+                source_id = store.add_source(log_file_link or device or 'stdin')
+        except (event_store.sqlite3.Error, ValueError, OSError) as err:
+            print(f'Error: {err}')
+            exit(1)
+        if source_id is None:
+            print(f'{log_file_link} is already ingested into {store_link}')
+            store.close()
+            exit(0)
+    elif output_format == 'text':
+        try:
+            sink = TextRenderer(open(output_link, 'w', encoding='utf-8') if output_link else None,
+                                text_columns(columns))
+        except OSError as err:
+            print(f'Error: {err}')
+            exit(1)
+        sink.write_header()
     else:
-        logs_str = read_log_file(log_file_link)
-
-    # remove all except numbers and ','
-    logs_str = re.sub("[^0-9,]", "", logs_str)
-
-    logs_list = logs_str.split(',')
-
-    logs_list = remove_first_bytes(logs_list, 4)
-    logs_matrix = split_log(logs_list)
-    logs_matrix = remove_lines_containing_only_zeros(logs_matrix)
-
-    last_timestamp = 0
-
-    print_log_headers()
-
-    for row_bytes in logs_matrix:
-        byte_pointer = 0
-
-        dword1 = Dword1Union()
-        dword1.as_byte = get_double_word(row_bytes)
-
-        dword2 = Dword2Union()
-        dword2.as_byte = get_double_word(row_bytes)
-
-        dword3 = Dword3Union()
-        dword3.as_byte = get_double_word(row_bytes)
-
-        dword4 = Dword4Union()
-        dword4.as_byte = get_double_word(row_bytes)
-
-        dword5 = Dword5Union()
-        dword5.as_byte = get_double_word(row_bytes)
-
-        # double word 1 scope
-        magic_number = dword1.bytes.magic_number
-        severity = dword1.bytes.severity
-        thread_id = dword1.bytes.thread_id
-        file_id = dword1.bytes.field_id
-        group_id = dword1.bytes.group_id
-
-        # double word 2 scope
-        event_id = dword2.bytes.event_id
-        line_number = dword2.bytes.line_number
-        sequence = dword2.bytes.sequence
-
-        # double word 3 scope
-        data_1 = dword3.bytes.data1
-        data_2 = dword3.bytes.data2
-
-        # double word 4 scope
-        data_3 = dword4.bytes.data3
-
-        # double word 5 scope
-        timestamp = dword5.bytes.timestamp
+        import log_sinks
+        try:
+            sink = log_sinks.open_sink(output_format, output_link, columns)
+        except (OSError, ValueError) as err:
+            print(f'Error: {err}')
+            exit(1)
 
-        file_name = get_file_name_from_xml(str(file_id))
-        thread_name = get_thread_name_from_xml(thread_id)
-        delta_timestamp = calculate_delta_timestamp(timestamp, last_timestamp)
-        last_timestamp = timestamp
+    timeline = log_timeline.Timeline() if np is not None else None
+
+    def write_records(records) -> None:
+        """
+        Write one batch of decoded records to the selected output
+        """
+        times = None
+        if timeline is not None:
+            records = as_record_array(records)
+            first = timeline.records == 0
+            times = timeline.update(records['timestamp'], records['sequence'])
+
+        if store is not None:
+            store.add(source_id, records, times['time'] if times is not None else None)
+        elif times is None:
+            sink.write(describe_records(records, event_dictionary))
+        elif output_format == 'text':
+            sink.write(describe_records(records.tolist(), event_dictionary), timeline_deltas(times, first))
+        else:
+            sink.write(log_sinks.build_columns(records, event_dictionary, columns, times))
 
-        number_arguments = get_number_of_arguments_from_xml(str(event_id))
-        format_string = get_format_string_from_xml(str(event_id))
-        description_string = get_description_string(format_string, number_arguments, data_1, data_2, data_3)
+    if device:
+        read_snapshot = lambda: read_device_logger(device)
+    else:
+        read_snapshot = LogFileFollower(log_file_link)
 
-        print_format_log_line(sequence, file_name, group_id, thread_name, severity, line_number, timestamp, delta_timestamp,
-                              description_string)
+    try:
+        if follow:
+            for new_records in follow_log(read_snapshot, decode_engine, follow_interval):
+                write_records(new_records)
+        elif device:
+            write_records(decode_log(parse_snapshots(read_snapshot()), decode_engine))
+        else:
+            if log_file_link == '':
+                log_file = sys.stdin.buffer
+            else:
+                log_file = open_log_file(log_file_link)
+
+            with log_file:
+                for log_bytes in read_log_records(log_file):
+                    write_records(decode_log(log_bytes, decode_engine, timeline is not None))
+        if store is not None:
+            store.complete_source(source_id)
+    except ValueError as err:
+        print(f'Error: wrong log format, {err}')
+        exit(1)
+    except subprocess.CalledProcessError as err:
+        print(f'Error: failed to read logger from {device}, {err}')
+        exit(1)
+    except KeyboardInterrupt:
+        # follow mode ends with Ctrl-C, an interrupted log file stays incomplete and is ingested again by the next run
+        if store is not None and follow:
+            store.complete_source(source_id)
+    finally:
+        if store is not None:
+            store.close()
+        elif output_format != 'text':
+            sink.close()
+        elif output_link:
+            sink.file.close()
+
+        if timeline is not None:
+            for line in timeline.report_lines():
+                print(line, file=sys.stderr)
@@ -0,0 +1,219 @@
+"""
+Output sinks writing decoded firmware log records in bulk: CSV, JSON Lines, Parquet, Arrow and NumPy npz
+"""
+import csv
+import json
+import sys
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from event_dictionary import EventDictionary
+from log_timeline import Timeline
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional, parquet and arrow output fall back to npz
+    pa = None
+
+
+def lookup_names(ids, lookup) -> np.ndarray:
+    """
+    Resolve names of ids, each distinct id is looked up once
+    :param ids: array of ids
+    :param lookup: function returning name of one id
+    :return: array of names
+    :rtype: numpy.ndarray
+    """
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    names = np.array([lookup(_id) for _id in unique_ids.tolist()], dtype=object)
+
+    return names[inverse.reshape(-1)]
+
+
+def build_columns(records, event_dictionary: EventDictionary, columns: Sequence[str],
+                  times: Dict[str, np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Build output columns of decoded records
+    :param records: records returned by firmware_log_parser.decode_log_numpy
+    :type records: numpy.ndarray
+    :param event_dictionary: event dictionary
+    :type event_dictionary: EventDictionary
+    :param columns: names of the built columns
+    :type columns: Sequence[str]
+    :param times: time axis of the records returned by log_timeline.Timeline.update,
+                  built from these records only if not given
+    :type times: Dict[str, numpy.ndarray]
+    :return: column name -> array
+    :rtype: Dict[str, numpy.ndarray]
+    """
+    if times is None:
+        times = Timeline().update(records['timestamp'], records['sequence'])
+
+    data = {}
+
+    for name in columns:
+        if name == 'file_name':
+            data[name] = lookup_names(records['file_id'], event_dictionary.file_name)
+        elif name == 'thread_name':
+            data[name] = lookup_names(records['thread_id'], event_dictionary.thread_name)
+        elif name == 'delta_timestamp':
+            data[name] = times['delta']
+        elif name in ('time', 'dropped'):
+            data[name] = times[name]
+        elif name == 'description':
+            description = event_dictionary.description
+            data[name] = np.array([description(*fields) for fields in zip(records['event_id'].tolist(),
+                                                                           records['data1'].tolist(),
+                                                                           records['data2'].tolist(),
+                                                                           records['data3'].tolist())],
+                                  dtype=object)
+        else:
+            data[name] = records[name]
+
+    return data
+
+
+def empty_columns(columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    Columns of zero records with the types build_columns returns
+    """
+    from firmware_log_parser import RECORD_DTYPE
+
+    return build_columns(np.empty(0, RECORD_DTYPE), EventDictionary(), columns)
+
+
+def close_file(file) -> None:
+    """
+    Close output file, standard output is only flushed
+    """
+    if file is sys.stdout:
+        file.flush()
+    else:
+        file.close()
+
+
+class CsvSink:
+    """
+    Comma separated values with a header line
+    """
+
+    def __init__(self, file, columns: Sequence[str]):
+        self.file = file
+        self.columns = columns
+        self.writer = csv.writer(file)
+        self.writer.writerow(columns)
+
+    def write(self, data: Dict[str, np.ndarray]) -> None:
+        self.writer.writerows(zip(*(data[name].tolist() for name in self.columns)))
+
+    def close(self) -> None:
+        close_file(self.file)
+
+
+class JsonLinesSink:
+    """
+    One json object per record
+    """
+
+    def __init__(self, file, columns: Sequence[str]):
+        self.file = file
+        self.columns = columns
+
+    def write(self, data: Dict[str, np.ndarray]) -> None:
+        columns = self.columns
+        dumps = json.dumps
+        self.file.write(''.join(dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+                                for row in zip(*(data[name].tolist() for name in columns))))
+
+    def close(self) -> None:
+        close_file(self.file)
+
+
+class ArrowSink:
+    """
+    Parquet or Arrow IPC file written one record batch at a time, requires pyarrow.
+    A file with the columns and no rows is written if there were no records.
+    """
+
+    def __init__(self, file_link: str, columns: Sequence[str], file_format: str = 'parquet'):
+        self.file_link = file_link
+        self.columns = columns
+        self.file_format = file_format
+        self.writer = None
+
+    def write(self, data: Dict[str, np.ndarray]) -> None:
+        table = pa.table({name: pa.array(data[name].tolist(), pa.string()) if data[name].dtype == object
+                          else pa.array(data[name]) for name in self.columns})
+
+        if self.writer is None:
+            if self.file_format == 'parquet':
+                self.writer = pyarrow.parquet.ParquetWriter(self.file_link, table.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(self.file_link, table.schema)
+
+        self.writer.write_table(table)
+
+    def close(self) -> None:
+        if self.writer is None:
+            self.write(empty_columns(self.columns))
+        self.writer.close()
+
+
+class NpzSink:
+    """
+    NumPy npz archive with one array per column, written when the sink is closed.
+    The archive is written to the given file name, numpy adds no .npz suffix to an open file.
+    """
+
+    def __init__(self, file_link: str, columns: Sequence[str]):
+        self.file_link = file_link
+        self.columns = columns
+        self.batches: List[Dict[str, np.ndarray]] = []
+
+    def write(self, data: Dict[str, np.ndarray]) -> None:
+        self.batches.append(data)
+
+    def close(self) -> None:
+        arrays = {}
+
+        for name in self.columns:
+            column = [batch[name] for batch in self.batches]
+            column = np.concatenate(column) if column else np.array([])
+            arrays[name] = column.astype(str) if column.dtype == object else column
+
+        with open(self.file_link, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+
+
+def open_sink(file_format: str, file_link: str, columns: Sequence[str]):
+    """
+    Create output sink
+    :param file_format: csv, jsonl, parquet, arrow or npz
+    :type file_format: str
+    :param file_link: output file, stdout for csv and jsonl if empty
+    :type file_link: str
+    :param columns: names of written columns
+    :type columns: Sequence[str]
+    :return: sink with write(columns) and close() methods
+    """
+    if file_format in ('csv', 'jsonl'):
+        file = open(file_link, 'w', newline='', encoding='utf-8') if file_link else sys.stdout
+        return CsvSink(file, columns) if file_format == 'csv' else JsonLinesSink(file, columns)
+
+    if not file_link:
+        raise ValueError(f'{file_format} output requires output file')
+
+    if file_format in ('parquet', 'arrow'):
+        if pa is not None:
+            return ArrowSink(file_link, columns, file_format)
+        print(f'Warning: pyarrow is not installed, writing npz archive {file_link} instead of {file_format}',
+              file=sys.stderr)
+        return NpzSink(file_link, columns)
+
+    if file_format == 'npz':
+        return NpzSink(file_link, columns)
+
+    raise ValueError(f'unknown output format {file_format}')
@@ -0,0 +1,122 @@
+"""
+Time axis of firmware log records: unwrapping of the 32-bit timestamp counter and detection of dropped records
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# duration of one timestamp tick in seconds
+TIMESTAMP_FACTOR = 0.00001
+
+TIMESTAMP_RANGE = 1 << 32
+SEQUENCE_MASK = 0xF
+
+# number of gaps kept for the report, totals are always counted
+MAX_REPORTED_GAPS = 100
+
+
+class Timeline:
+    """
+    Build 64-bit monotonic time axis of records from their 32-bit timestamps, batch by batch.
+    A step between two records is the timestamp difference modulo 2^32 taken as signed 32-bit value:
+    counter wraps give small positive steps, records out of order give negative steps.
+    Dropped records are detected from discontinuities of the 4-bit sequence of records moving forward in time,
+    so at most 15 consecutive dropped records can be recognized.
+    """
+
+    def __init__(self):
+        self.last_timestamp = None
+        self.last_time = None
+        self.last_sequence = None
+        self.first_time = None
+
+        self.records = 0
+        self.dropped = 0
+        self.out_of_order = 0
+        self.wraps = 0
+        self.gaps: List[Tuple[int, int, int]] = []
+
+    def update(self, timestamps, sequences) -> Dict[str, np.ndarray]:
+        """
+        Process next batch of records
+        :param timestamps: array of 32-bit record timestamps
+        :param sequences: array of 4-bit record sequences
+        :return: 'time' - unwrapped timestamps (int64 ticks),
+                 'delta' - delta to the previous record in seconds, 0 for the very first record,
+                 'dropped' - number of records missing before every record,
+                 'out_of_order' - True for records older than the previous one
+        :rtype: Dict[str, numpy.ndarray]
+        """
+        timestamps = np.asarray(timestamps).astype(np.int64)
+        sequences = np.asarray(sequences).astype(np.int64)
+        count = len(timestamps)
+
+        if not count:
+            return {'time': np.empty(0, np.int64), 'delta': np.empty(0, np.float64),
+                    'dropped': np.empty(0, np.int64), 'out_of_order': np.empty(0, bool)}
+
+        previous_timestamps = np.empty(count, np.int64)
+        previous_timestamps[1:] = timestamps[:-1]
+        previous_sequences = np.empty(count, np.int64)
+        previous_sequences[1:] = sequences[:-1]
+
+        if self.last_timestamp is None:
+            previous_timestamps[0] = timestamps[0]
+            previous_sequences[0] = (sequences[0] - 1) & SEQUENCE_MASK
+            start = timestamps[0]
+        else:
+            previous_timestamps[0] = self.last_timestamp
+            previous_sequences[0] = self.last_sequence
+            start = self.last_time
+
+        steps = (timestamps - previous_timestamps + TIMESTAMP_RANGE // 2) % TIMESTAMP_RANGE - TIMESTAMP_RANGE // 2
+        time = start + np.cumsum(steps)
+        out_of_order = steps < 0
+        dropped = (sequences - previous_sequences - 1) & SEQUENCE_MASK
+        dropped[out_of_order] = 0
+
+        if self.first_time is None:
+            self.first_time = int(time[0])
+        self.last_timestamp = int(timestamps[-1])
+        self.last_sequence = int(sequences[-1])
+        self.last_time = int(time[-1])
+
+        self.records += count
+        self.dropped += int(dropped.sum())
+        self.out_of_order += int(out_of_order.sum())
+        self.wraps += int(np.count_nonzero((steps > 0) & (timestamps < previous_timestamps)))
+
+        if len(self.gaps) < MAX_REPORTED_GAPS:
+            for index in np.flatnonzero(dropped)[:MAX_REPORTED_GAPS - len(self.gaps)].tolist():
+                self.gaps.append((int(time[index]), int(sequences[index]), int(dropped[index])))
+
+        return {'time': time, 'delta': steps * TIMESTAMP_FACTOR, 'dropped': dropped, 'out_of_order': out_of_order}
+
+    def report(self) -> Dict[str, object]:
+        """
+        :return: summary of all processed records
+        """
+        span = (self.last_time - self.first_time) * TIMESTAMP_FACTOR if self.records else 0.0
+
+        return {'records': self.records,
+                'dropped': self.dropped,
+                'out_of_order': self.out_of_order,
+                'wraps': self.wraps,
+                'span': span,
+                'gaps': list(self.gaps)}
+
+    def report_lines(self) -> List[str]:
+        """
+        :return: human readable report, empty if no record was dropped or out of order
+        """
+        if not self.dropped and not self.out_of_order:
+            return []
+
+        lines = [f'Timeline: {self.records} records, {self.dropped} dropped, {self.out_of_order} out of order, '
+                 f'{self.wraps} timestamp wraps']
+        lines += [f'  {dropped} records dropped before sequence {sequence}, time {time}'
+                  for time, sequence, dropped in self.gaps]
+        if self.dropped > sum(dropped for _, _, dropped in self.gaps):
+            lines.append(f'  only first {MAX_REPORTED_GAPS} gaps are listed')
+
+        return lines
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Stand-in of v4l2-ctl --stream-mmap --verbose for offline tests: frames are emulated in real time
+and written to stderr in the v4l2-ctl format. Timestamps are the scheduled capture times on the monotonic
+clock like the end of frame timestamps of a sensor, a late dequeue of the emulator does not change the intervals.
+"""
+import getopt
+import sys
+import time
+
+
+def usage():
+    print("Syntax: fake_v4l2_ctl.py -d<device> --stream-mmap --stream-count <frames> --verbose [options]")
+    print("        --fake-fps <fps>             frame rate, default 30")
+    print("        --fake-size <bytes>          bytesused of every frame, default 1843200")
+    print("        --fake-drop <seq,...>        sequence numbers of dropped frames")
+    print("        --fake-stall <seq>:<ms>      delay before the given frame, e.g. shared link stall")
+    sys.exit(1)
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "d:p:", longopts=["stream-mmap", "stream-count=", "verbose",
+                                                           "fake-fps=", "fake-size=", "fake-drop=", "fake-stall="])
+    except getopt.GetoptError as err:
+        print(f"Error: {err}", file=sys.stderr)
+        usage()
+
+    count = 0
+    fps = 30.0
+    size = 1843200
+    drop = set()
+    stalls = {}
+    for opt, arg in opts:
+        if opt == "--stream-count":
+            count = int(arg)
+        elif opt == "--fake-fps":
+            fps = float(arg)
+        elif opt == "--fake-size":
+            size = int(arg)
+        elif opt == "--fake-drop":
+            drop = {int(seq) for seq in arg.split(',') if seq}
+        elif opt == "--fake-stall":
+            seq, ms = arg.split(':')
+            stalls[int(seq)] = float(ms) / 1000
+
+    period = 1 / fps
+    due = time.monotonic()
+    last = None
+    frames = 0
+    seq = 0
+    while frames < count:
+        due += period + stalls.get(seq, 0)
+        time.sleep(max(0.0, due - time.monotonic()))
+        if seq not in drop:
+            ts = due
+            line = f"cap dqbuf: {frames % 4} seq: {seq:6d} bytesused: {size} ts: {ts:.6f}"
+            if last is not None:
+                delta = (ts - last) * 1000
+                line += f" delta: {delta:.3f} ms fps: {1000 / delta:.2f}"
+            print(line + " (ts-monotonic, ts-src-eof)", file=sys.stderr, flush=True)
+            last = ts
+            frames += 1
+        seq += 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
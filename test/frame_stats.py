@@ -0,0 +1,310 @@
+"""
+Streaming statistics of v4l2-ctl --stream-mmap --verbose capture output
+"""
+import math
+import queue
+import re
+import subprocess
+import threading
+import time
+
+DQBUF_PATTERN = re.compile(r"cap dqbuf:.*seq:\s*(\d+) bytesused:\s*(\d*)")
+DELTA_PATTERN = re.compile(r"delta:\s*(\d+\.\d+) ms")
+TIMESTAMP_PATTERN = re.compile(r"ts:\s*(\d+\.\d+)")
+
+
+class FrameKpiError(AssertionError):
+    """
+    Frame sequence or interval violates the KPI
+    """
+
+
+def percentile(values, percent):
+    """
+    Nearest rank percentile of sorted values
+    """
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, math.ceil(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class FrameStats:
+    """
+    Running statistics of captured frames, updated line by line while the capture is running.
+    With fail_fast the first KPI violation raises FrameKpiError immediately.
+    """
+
+    def __init__(self, fps, kpi=5, max_gap=2, skip=1, fail_fast=True):
+        """
+        :param fps: expected frame rate
+        :param kpi: allowed frame rate deviation of every frame interval [%]
+        :param max_gap: maximal sequence step, max_gap - 1 dropped frames in a row are tolerated
+        :param skip: number of first frame intervals not checked against the KPI
+        :param fail_fast: raise FrameKpiError on the first violation
+        """
+        self.fps = fps
+        self.kpi = kpi
+        self.max_gap = max_gap
+        self.skip = skip
+        self.fail_fast = fail_fast
+
+        self.frames = 0
+        self.dropped = 0
+        self.repeated = 0
+        self.intervals = []
+        self.violations = []
+        # capture timestamps [s] of frames with a violation, for correlation between streams
+        self.anomalies = []
+        self.bytes = 0
+        self.last_sequence = None
+        # capture timestamps [s] of the first and the last frame
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def violation(self, message):
+        self.violations.append(message)
+        self.anomalies.append(self.last_timestamp)
+        if self.fail_fast:
+            raise FrameKpiError(message)
+
+    def feed_line(self, line):
+        """
+        Process one line of the capture output
+        :return: sequence number of the dequeued frame, None for other lines
+        """
+        m = DQBUF_PATTERN.search(line)
+        if not m:
+            return None
+
+        frame = int(m.group(1))
+        bytesused = int(m.group(2) or 0)
+        m = TIMESTAMP_PATTERN.search(line)
+        timestamp = float(m.group(1)) if m else None
+        m = DELTA_PATTERN.search(line)
+        interval = float(m.group(1)) if m else None
+
+        self.add_frame(frame, timestamp, bytesused, interval)
+        return frame
+
+    def add_frame(self, frame, timestamp=None, bytesused=0, interval=None):
+        """
+        Process one dequeued frame
+        :param frame: sequence number
+        :param timestamp: capture timestamp [s]
+        :param bytesused: frame size [bytes]
+        :param interval: time since the previous frame [ms], from the timestamps when not given
+        """
+        self.frames += 1
+        self.bytes += bytesused
+        last = self.last_sequence
+        self.last_sequence = frame
+
+        if timestamp is not None:
+            if interval is None and self.last_timestamp is not None:
+                interval = (timestamp - self.last_timestamp) * 1000
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+
+        if last is not None:
+            if frame <= last:
+                self.repeated += 1
+                self.violation(f"Repeated frame: {frame}")
+            elif frame - last > 1:
+                self.dropped += frame - last - 1
+                if frame - last > self.max_gap:
+                    self.violation(f"Frames dropped between: {last} and {frame}")
+
+        if interval is not None:
+            self.intervals.append(interval)
+            if len(self.intervals) > self.skip:
+                fps = 1000 / interval if interval else float('inf')
+                if fps <= self.fps * (1 - self.kpi / 100):
+                    self.violation(f"FPS too low: {fps:.2f}/{self.fps}")
+                elif fps >= self.fps * (1 + self.kpi / 100):
+                    self.violation(f"FPS too high: {fps:.2f}/{self.fps}")
+
+    def feed(self, lines):
+        for line in lines:
+            self.feed_line(line)
+        return self
+
+    def checked_intervals(self):
+        return self.intervals[self.skip:]
+
+    def jitter(self):
+        nominal = 1000 / self.fps
+        return [abs(interval - nominal) for interval in self.checked_intervals()]
+
+    def duration(self):
+        """
+        :return: time between the first and the last frame [s], None for less than two timestamps
+        """
+        if self.first_timestamp is None or self.last_timestamp <= self.first_timestamp:
+            return None
+        return self.last_timestamp - self.first_timestamp
+
+    def summary(self):
+        """
+        :return: frames, dropped and repeated counts, interval and jitter percentiles [ms],
+                 effective fps and throughput [MB/s] over the capture timestamps
+        """
+        duration = self.duration()
+        return distribution(self.frames, self.dropped, self.repeated, len(self.violations),
+                            self.checked_intervals(), self.jitter(),
+                            (self.frames - 1) / duration if duration else None,
+                            self.bytes / duration / 1e6 if duration else None)
+
+    def report(self):
+        return format_summary(self.summary())
+
+
+def distribution(frames, dropped, repeated, violations, intervals, jitter, fps, throughput):
+    intervals = sorted(intervals)
+    jitter = sorted(jitter)
+    return {'frames': frames,
+            'dropped': dropped,
+            'repeated': repeated,
+            'interval_p50': percentile(intervals, 50),
+            'interval_p99': percentile(intervals, 99),
+            'interval_max': intervals[-1] if intervals else None,
+            'jitter_p50': percentile(jitter, 50),
+            'jitter_p99': percentile(jitter, 99),
+            'jitter_max': jitter[-1] if jitter else None,
+            'fps': fps,
+            'throughput': throughput,
+            'violations': violations}
+
+
+def format_summary(s):
+    if not s['frames']:
+        return "no frames"
+
+    def ms(value):
+        return '-' if value is None else f"{value:.3f}"
+
+    return (f"{s['frames']} frames, {s['dropped']} dropped, {s['repeated']} repeated, "
+            f"fps {ms(s['fps'])}, {ms(s['throughput'])} MB/s, "
+            f"interval p50/p99/max {ms(s['interval_p50'])}/{ms(s['interval_p99'])}/{ms(s['interval_max'])} ms, "
+            f"jitter p50/p99/max {ms(s['jitter_p50'])}/{ms(s['jitter_p99'])}/{ms(s['jitter_max'])} ms")
+
+
+def aggregate(streams):
+    """
+    Statistics of concurrent streams together
+    :param streams: {name: FrameStats}
+    :return: summary of all frames, fps and throughput are sums of the streams
+    """
+    summaries = [stats.summary() for stats in streams.values()]
+    return distribution(sum(s['frames'] for s in summaries),
+                        sum(s['dropped'] for s in summaries),
+                        sum(s['repeated'] for s in summaries),
+                        sum(s['violations'] for s in summaries),
+                        [interval for stats in streams.values() for interval in stats.checked_intervals()],
+                        [jitter for stats in streams.values() for jitter in stats.jitter()],
+                        sum(s['fps'] or 0 for s in summaries),
+                        sum(s['throughput'] or 0 for s in summaries))
+
+
+def interference(streams, window=0.1):
+    """
+    Violations of different streams close in time, e.g. frames of both links dropped by the same deserializer stall.
+    Capture timestamps of all streams are taken from the same monotonic clock.
+    :param streams: {name: FrameStats}
+    :param window: maximal distance of violations counted as coincident [s]
+    :return: [(name, other name, number of violations of name with a violation of other name within window)]
+    """
+    coincident = []
+    names = sorted(streams)
+    for idx, name in enumerate(names):
+        for other in names[idx + 1:]:
+            others = [t for t in streams[other].anomalies if t is not None]
+            count = sum(1 for t in streams[name].anomalies
+                        if t is not None and any(abs(t - o) <= window for o in others))
+            if count:
+                coincident.append((name, other, count))
+    return coincident
+
+
+def stream_frames(cmd, stats, timeout, frames=None):
+    """
+    Run capture command and feed its verbose output (stderr) to stats while it is produced.
+    The process is killed on the first KPI violation, on timeout or when the expected frames arrived.
+    :param cmd: v4l2-ctl --stream-mmap --verbose command
+    :param stats: FrameStats
+    :param timeout: maximal run time [s]
+    :param frames: expected number of frames, None waits for the command to finish
+    :raise subprocess.TimeoutExpired: timeout expired
+    :raise subprocess.CalledProcessError: command failed
+    :raise FrameKpiError: KPI violated
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    lines = queue.Queue()
+
+    def read_lines():
+        for line in process.stderr:
+            lines.put(line)
+        lines.put(None)
+
+    reader = threading.Thread(target=read_lines, daemon=True)
+    reader.start()
+    deadline = time.monotonic() + timeout
+
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            if line is None:
+                break
+            stats.feed_line(line)
+            if frames is not None and stats.frames >= frames:
+                break
+        returncode = process.wait(timeout=max(0.1, deadline - time.monotonic()))
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, cmd)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        reader.join(timeout=1)
+        if not reader.is_alive():
+            process.stderr.close()
+
+    return stats
+
+
+def stream_concurrent(streams, timeout, frames=None):
+    """
+    Start all captures at the same time, one reader thread per capture
+    :param streams: {name: (source, FrameStats)}, source is capture command run by stream_frames
+                    or callable feeding the stats, e.g. v4l2.Device.stream based capture
+    :param timeout: maximal run time of every capture [s], a callable still running after timeout is left
+                    to finish in its daemon thread and reported with TimeoutError
+    :param frames: expected number of frames per capture command
+    :return: {name: exception raised by the capture or None}
+    """
+    errors = {}
+
+    def run(name, source, stats):
+        try:
+            if callable(source):
+                source(stats)
+            else:
+                stream_frames(source, stats, timeout, frames)
+            errors[name] = None
+        except Exception as e:
+            errors[name] = e
+
+    threads = {name: threading.Thread(target=run, args=(name, source, stats), daemon=True)
+               for name, (source, stats) in streams.items()}
+    for thread in threads.values():
+        thread.start()
+    # capture commands are killed by stream_frames at the deadline, the grace covers their teardown
+    deadline = time.monotonic() + timeout + 1.0
+    for thread in threads.values():
+        thread.join(timeout=max(0.0, deadline - time.monotonic()))
+    return {name: TimeoutError(f"capture not finished within {timeout} s") if thread.is_alive() else errors.get(name)
+            for name, thread in threads.items()}
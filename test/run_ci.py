@@ -2,9 +2,15 @@
 
 '''
 This script helps running the tests using pytest.
+Tests are sharded over parallel pytest workers, one per video node or at most --jobs, tests streaming from
+several nodes run afterwards on their own. Test durations of the JUnit reports are kept in a history file, the slowest
+tests are scheduled first and tests slower than in the previous runs are reported.
 '''
 
-import sys, os, subprocess, re, getopt, time
+import sys, os, subprocess, re, getopt, time, json, statistics, contextlib, io
+import xml.etree.ElementTree as ET
+
+import pytest
 
 start_time = time.time()
 running_on_ci = False
@@ -13,9 +19,23 @@ if 'WORKSPACE' in os.environ:
 
 #logs are stored @ ./realsense_mipi_driver_platform/test/logs
 logdir = os.path.join( '/'.join(os.path.abspath( __file__ ).split( os.path.sep )[0:-1]), 'logs')
-dir_live_tests = os.path.dirname(__file__)
+dir_live_tests = os.path.dirname(os.path.abspath(__file__))
+history_file = os.path.join(logdir, 'durations.json')
+
+# timeout of one worker [s]
+TIMEOUT = 200
+# expected duration of tests without history [s]
+UNKNOWN_DURATION = 10.0
+# durations kept per test
+HISTORY_LENGTH = 20
+# a test is slower than its median of the previous runs by more than threshold and MIN_REGRESSION [s]
+MIN_REGRESSION = 1.0
 
 regex = None
+jobs = None
+runs = 5
+threshold = 50.0
+timeout = TIMEOUT
 handle = None
 test_ran = False
 
@@ -26,40 +46,234 @@ def usage():
     print( '        -h, --help      Usage help' )
     print( '        -r, --regex     Run all tests whose name matches the following regular expression' )
     print( '                        e.g.: --regex test_fw_version; -r test_fw_version')
-        
+    print( '        -j, --jobs      Maximal number of parallel workers, default one per video node,' )
+    print( '                        tests of one video node always run on the same worker, -j 1 runs all tests serially' )
+    print( '        -n, --runs      Compare test durations with the previous n runs, default 5' )
+    print( '        --threshold     Report tests slower than their median duration by more than threshold [%], default 50' )
+    print( '        -t, --timeout   Timeout of one worker [s], default 200' )
+
     sys.exit( 0 )
 
-def command(dev_name, test=None):
+def command(dev_name, test=None, tests=None, shard=None):
+    """
+    :param tests: node ids to run in the given order, all tests of dev_name by default
+    :param shard: worker name used for the report files
+    """
+    name = f'{dev_name.upper()}_{shard}' if shard else dev_name.upper()
     cmd =  ['pytest']
     cmd += ['-vs']
     cmd += ['-m', ''.join(dev_name)]
     if test:
-        cmd += ['-k', f'{test}'] 
-    cmd += [''.join(dir_live_tests)]
-    cmd += ['--debug']
-    cmd += [f'--junit-xml={logdir}/{dev_name.upper()}_pytest.xml']
+        cmd += ['-k', f'{test}']
+    if tests:
+        cmd += [os.path.join(dir_live_tests, nodeid) for nodeid in tests]
+    else:
+        cmd += [''.join(dir_live_tests)]
+    cmd += [f'--debug={logdir}/{name}_pytestdebug.log']
+    cmd += [f'--junit-xml={logdir}/{name}_pytest.xml']
     return cmd
 
-def run_test(cmd):
+class Collector:
+    """
+    pytest plugin recording the collected tests and the video nodes they use
+    """
+    def __init__(self):
+        self.tests = []
+
+    def pytest_collection_finish(self, session):
+        for item in session.items:
+            params = item.callspec.params if hasattr(item, 'callspec') else {}
+            devices = set()
+            if 'device' in params:
+                devices.add(str(params['device']))
+            if 'devices' in params:
+                devices.update(str(device) for device in params['devices'])
+            self.tests.append((item.nodeid, frozenset(devices)))
+
+def collect(dev_name, test=None):
+    """
+    :return: [(node id, video nodes used by the test)]
+    """
+    collector = Collector()
+    args = ['--collect-only', '-qq', '-p', 'no:cacheprovider', '-m', dev_name]
+    if test:
+        args += ['-k', test]
+    # the collected tests are printed only when the collection failed
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        ret = pytest.main(args + [dir_live_tests], plugins=[collector])
+    if ret not in (pytest.ExitCode.OK, pytest.ExitCode.NO_TESTS_COLLECTED):
+        print(output.getvalue())
+    return collector.tests
+
+def junit_name(nodeid):
+    """
+    Test name as reported in the JUnit XML: "dir/test_fps.py::test_fps[150-0]" -> "dir.test_fps::test_fps[150-0]"
+    """
+    parts = nodeid.split('::')
+    module = re.sub(r'\.py$', '', parts[0]).replace('/', '.')
+    return '.'.join([module] + parts[1:-1]) + '::' + parts[-1]
+
+def expected_duration(history, nodeid):
+    durations = history.get(junit_name(nodeid))
+    return statistics.median(durations) if durations else UNKNOWN_DURATION
+
+def shard(tests, history, jobs=None):
+    """
+    All tests of one video node run on the same worker, tests without a video node are balanced
+    over all workers, tests of several video nodes run separately afterwards.
+    Every worker gets its tests slowest first.
+    :param tests: [(node id, video nodes)]
+    :param jobs: maximal number of workers, default one per video node, with less workers than video nodes
+                 the video nodes are balanced over the workers
+    :return: ({worker name: [node ids]} of parallel workers, [node ids] of the tests run afterwards)
+    """
+    groups = {}
+    free = []
+    shared = []
+    for nodeid, used in sorted(tests, key=lambda test: -expected_duration(history, test[0])):
+        if len(used) > 1:
+            shared.append(nodeid)
+        elif used:
+            groups.setdefault(next(iter(used)), []).append(nodeid)
+        else:
+            free.append(nodeid)
+
+    devices = sorted(groups)
+    workers = max(jobs or 0, 1)
+    if jobs is None or workers >= len(devices):
+        names = [f'video{device}' for device in devices]
+        names += [f'worker{idx}' for idx in range(workers - len(names))]
+        assigned = {device: f'video{device}' for device in devices}
+    else:
+        names = [f'worker{idx}' for idx in range(workers)]
+        assigned = {}
+    shards = {name: [] for name in names}
+    load = dict.fromkeys(names, 0.0)
+
+    def duration(nodeids):
+        return sum(expected_duration(history, nodeid) for nodeid in nodeids)
+
+    for device in sorted(devices, key=lambda device: -duration(groups[device])):
+        name = assigned.get(device) or min(names, key=lambda name: load[name])
+        shards[name] += groups[device]
+        load[name] += duration(groups[device])
+    for nodeid in free:
+        name = min(names, key=lambda name: load[name])
+        shards[name].append(nodeid)
+        load[name] += expected_duration(history, nodeid)
+    return {name: sorted(shards[name], key=lambda nodeid: -expected_duration(history, nodeid))
+            for name in names if shards[name]}, shared
+
+def read_junit(path):
+    """
+    :return: {test name: (duration [s], 'passed', 'failed' or 'skipped')}
+    """
+    results = {}
+    for case in ET.parse(path).getroot().iter('testcase'):
+        status = 'passed'
+        if case.find('failure') is not None or case.find('error') is not None:
+            status = 'failed'
+        elif case.find('skipped') is not None:
+            status = 'skipped'
+        results[case.get('classname') + '::' + case.get('name')] = (float(case.get('time', 0)), status)
+    return results
+
+def read_history(path):
     try:
-        subprocess.run( cmd,
-                timeout=200,
-                check=True )
-    except Exception as e:
-        print("Exception occurred: {}".format( e ))
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_history(path, history):
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+
+def update_history(history, results):
+    """
+    Append durations of passed tests, only the last HISTORY_LENGTH durations are kept
+    """
+    for name, (duration, status) in results.items():
+        if status == 'passed':
+            history[name] = (history.get(name, []) + [duration])[-HISTORY_LENGTH:]
+    return history
+
+def regressions(history, results, runs=5, threshold=50.0):
+    """
+    Passed tests slower than the median of their previous runs
+    :param runs: number of previous runs compared, at least 3 are needed
+    :param threshold: allowed slowdown [%]
+    :return: [(test name, median duration [s], duration [s])]
+    """
+    slower = []
+    for name, (duration, status) in sorted(results.items()):
+        previous = history.get(name, [])[-runs:]
+        if status != 'passed' or len(previous) < min(3, runs):
+            continue
+        median = statistics.median(previous)
+        if duration > median * (1 + threshold / 100) and duration - median >= MIN_REGRESSION:
+            slower.append((name, median, duration))
+    return slower
 
+def run_workers(dev_name, shards):
+    """
+    Run workers in parallel, output of every worker is written to logs and printed when it finished
+    :param shards: {worker name: [node ids]}
+    :return: {worker name: JUnit XML path}
+    """
+    workers = {}
+    for name, tests in shards.items():
+        cmd = command(dev_name, tests=tests, shard=name)
+        log = open(os.path.join(logdir, f'{dev_name.upper()}_{name}_pytest.log'), 'w')
+        print(f"{name}: {len(tests)} tests")
+        workers[name] = (subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT), log, time.time(), cmd[-1].split('=', 1)[1])
 
-def run_tests_on_d457():     
+    reports = {}
+    for name, (process, log, started, report) in workers.items():
+        try:
+            process.wait(timeout=max(0, started + timeout - time.time()))
+        except subprocess.TimeoutExpired as e:
+            process.kill()
+            process.wait()
+            print("Exception occurred: {}".format( e ))
+        log.close()
+        with open(log.name) as f:
+            print(f.read())
+        print(f"{name} took {time.time() - started:.1f} seconds, exit code {process.returncode}")
+        if os.path.exists(report):
+            reports[name] = report
+    return reports
+
+def run_tests_on_d457():
     global logdir
 
     try:
-        os.makedirs( logdir, exist_ok=True ) 
-        device = "D457"  
-        
+        os.makedirs( logdir, exist_ok=True )
+        device = "D457"
+
         testname = regex if regex else None
 
-        cmd = command(device.lower(), testname)
-        run_test(cmd)
+        history = read_history(history_file)
+        shards, shared = shard(collect(device.lower(), testname), history, jobs)
+
+        reports = {}
+        if shards:
+            reports.update(run_workers(device.lower(), shards))
+        if shared:
+            reports.update(run_workers(device.lower(), {'shared': shared}))
+
+        results = {}
+        for report in reports.values():
+            results.update(read_junit(report))
+
+        print("Slowest tests:")
+        for name, (duration, status) in sorted(results.items(), key=lambda result: -result[1][0])[:10]:
+            print(f"  {duration:8.2f} s  {status:7}  {name}")
+        slower = regressions(history, results, runs, threshold)
+        for name, median, duration in slower:
+            print(f"Regression: {name} took {duration:.2f} s, median of previous runs {median:.2f} s")
+        write_history(history_file, update_history(history, results))
 
     finally:
         if running_on_ci:
@@ -69,18 +283,30 @@ def run_tests_on_d457():
 
 if __name__ == '__main__':
     try:
-        opts, args = getopt.getopt( sys.argv[1:], 'hr:', longopts=['help', 'regex=' ] )
+        opts, args = getopt.getopt( sys.argv[1:], 'hr:j:n:t:', longopts=['help', 'regex=', 'jobs=', 'runs=', 'threshold=', 'timeout=' ] )
     except getopt.GetoptError as err:
         print( err )
         usage()
         sys.exit ( 1 )
 
-    for opt, arg in opts:
-        if opt in ('-h', '--help'):
-            usage()
-        elif opt in ('-r', '--regex'):
-            regex = arg
-    
+    try:
+        for opt, arg in opts:
+            if opt in ('-h', '--help'):
+                usage()
+            elif opt in ('-r', '--regex'):
+                regex = arg
+            elif opt in ('-j', '--jobs'):
+                jobs = int(arg)
+            elif opt in ('-n', '--runs'):
+                runs = int(arg)
+            elif opt == '--threshold':
+                threshold = float(arg)
+            elif opt in ('-t', '--timeout'):
+                timeout = float(arg)
+    except ValueError as err:
+        print( err )
+        sys.exit( 1 )
+
     run_tests_on_d457()
 
-sys.exit( 0 )
+    sys.exit( 0 )
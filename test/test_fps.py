@@ -1,6 +1,7 @@
-import subprocess
 import pytest
-import re
+
+from frame_stats import FrameStats, aggregate, format_summary, interference, stream_concurrent
+from v4l2 import Device
 
 @pytest.mark.d457
 @pytest.mark.parametrize("frames", {150})
@@ -12,86 +13,69 @@ def test_fps(device, frames):
         for w, h in formats:
             print(f"Format: {w}x{h}")
             for FPS in formats[(w, h)]:
-                cmd = [ "v4l2-ctl",
-                       f"-d{device}",
-                       f"--set-fmt-video=width={w},height={h}",
-                       ]
-                subprocess.check_call(cmd)
                 print(f"FPS/{FPS}:", end=' ')
-                cmd = [ "v4l2-ctl",
-                       f"-d{device}",
-                       "-p",
-                       f"{FPS}",
-                       ]
-                subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
-                cmd = [ "v4l2-ctl",
-                       f"-d{device}",
-                       "--stream-mmap",
-                       "--stream-count",
-                       f"{frames}",
-                       "--verbose",
-                       ]
-                timeout = 4.0 * frames / FPS
-                output = subprocess.run(cmd,
-                                        check=True,
-                                        text=True,
-                                        capture_output=True,
-                                        timeout=timeout).stderr.splitlines()
-                last = None
-                skip = True    # skip first FPS measurement
-                kpi = 5 # [%]
-                count = 0
-                for line in output:
-                    m = re.search(r"cap dqbuf:.*seq:\s*(\d*) bytesused:", line)
-                    if m:
-                        count += 1
-                        frame = int(m.group(1))
-                        # print(f"{frame}", end='')
-                        if last:
-                            assert frame > last, f"Repeated frame: {frame}"
-                            assert (frame - last) < 3, f"Frames dropped between: {last} and {frame}"
-                        m = re.search(r"delta:\s*(\d+\.\d+) ms", line)
-                        if m:
-                            fps = 1000 / float(m.group(1))
-                            # print(f"/{fps:.2f}", end='')
-                            if not skip:
-                                assert fps > FPS * (1 - kpi/100), f"FPS too low: {fps:.2f}/{FPS}"
-                                assert fps < FPS * (1 + kpi/100), f"FPS too high: {fps:.2f}/{FPS}"
-                            else:
-                                # print('?', end='')
-                                skip = False
-                        # print(end=',')
-                        last = frame
-                print()
-                assert last, "No frames arrived"
-                assert count == frames, f"Missing frames: {count} < {frames}"
-    except subprocess.TimeoutExpired:
+                set_format(device, w, h, FPS)
+                # statistics are updated while frames arrive, the capture stops on the first KPI violation
+                stats = FrameStats(FPS, kpi=5)
+                try:
+                    capture(device, stats, frames)
+                finally:
+                    print(stats.report())
+                assert stats.frames, "No frames arrived"
+                assert stats.frames == frames, f"Missing frames: {stats.frames} < {frames}"
+    except TimeoutError:
         assert False, "No frames arrived"
 
-def get_formats(device):
-    cmd = [ "v4l2-ctl",
-           "-d" + device,
-           "--list-formats-ext",
-           ]
-    output = subprocess.run(cmd,
-                            check=True,
-                            text=True,
-                            capture_output=True
-                            ).stdout.splitlines()
-    formats = {}
-    last = None
-    for line in output:
-        m = re.search(r"\s*Size: Discrete\s*(\d+)x(\d+)", line)
-        if m:
-            w = int(m.group(1))
-            h = int(m.group(2))
-            last = (w, h)
-            if not last in formats:
-                formats[last] = set()
-            continue
-        m = re.search(r"\s*Interval: Discrete.*\((\d+\.\d+)\s+fps\)", line)
-        if m:
-            fps = float(m.group(1))
-            if last:
-                formats[last].add(fps)
-    return formats
+@pytest.mark.d457
+@pytest.mark.parametrize("frames", {150})
+@pytest.mark.parametrize("devices", [('0', '2')])
+def test_fps_concurrent(devices, frames):
+    """
+    All devices stream at the same time like with dual camera deserializers,
+    formats supported by all devices are tested
+    """
+    print(f"\nDevices: {', '.join(devices)}")
+    formats = [get_formats(device) for device in devices]
+    common = set.intersection(*[set(f) for f in formats])
+    for w, h in sorted(common):
+        print(f"Format: {w}x{h}")
+        for FPS in sorted(set.intersection(*[f[(w, h)] for f in formats])):
+            print(f"FPS/{FPS}:")
+            streams = {}
+            for device in devices:
+                set_format(device, w, h, FPS)
+                streams[device] = (lambda stats, device=device: capture(device, stats, frames),
+                                   FrameStats(FPS, kpi=5, fail_fast=False))
+            errors = stream_concurrent(streams, 4.0 * frames / FPS, frames)
+            stats = {device: streams[device][1] for device in devices}
+            for device in devices:
+                print(f"  {device}: {stats[device].report()}")
+            print(f"  all: {format_summary(aggregate(stats))}")
+            coincident = interference(stats)
+            for device, other, count in coincident:
+                print(f"  interference {device}/{other}: {count} coincident violations")
+
+            for device in devices:
+                assert errors[device] is None, f"Device {device}: {errors[device]}"
+                assert stats[device].frames == frames, f"Device {device} missing frames: {stats[device].frames} < {frames}"
+                assert not stats[device].violations, f"Device {device}: {stats[device].violations[0]}"
+            assert not coincident, f"Interference between streams: {coincident}"
+
+def set_format(device, w, h, fps, backend=None):
+    with Device(device, backend) as dev:
+        dev.set_format(w, h)
+        dev.set_fps(fps)
+
+def capture(device, stats, frames, timeout=2.0, backend=None):
+    """
+    Feed frames dequeued with VIDIOC_DQBUF to stats, kernel timestamps and sequence numbers are used directly
+    :param timeout: maximal wait for one frame [s]
+    """
+    with Device(device, backend) as dev:
+        for frame in dev.stream(frames, timeout=timeout):
+            stats.add_frame(frame.sequence, frame.timestamp, frame.bytesused)
+    return stats
+
+def get_formats(device, backend=None):
+    with Device(device, backend) as dev:
+        return dev.formats()
@@ -0,0 +1,129 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from test_fw_log_parser import EVENTS_XML, log_text
+from test_metadata_decoder import METADATA_DIR, md
+import frame_events
+from event_dictionary import EventDictionary
+
+FRAME_US = 33333
+
+
+def log_record(event_id, timestamp, sequence, data=(0, 0, 0)):
+    dword1 = 0xA0 | (1 << 8) | (1 << 13) | (10 << 16)
+    dword2 = event_id | (100 << 16) | ((sequence & 0xF) << 28)
+    return b''.join(value.to_bytes(4, 'little') for value in
+                    (dword1, dword2, data[0] | (data[1] << 16), data[2], timestamp & 0xFFFFFFFF))
+
+
+def capture(tmp_path, start_us=1000000):
+    # 300 frames at 30 fps, frames 100 and 101 dropped, frame 200 late by 10 ms
+    counter = np.delete(np.arange(300), [100, 101])
+    hw = start_us + counter * FRAME_US
+    hw[counter >= 200] += 10000
+    records = np.zeros(len(counter), md.EXT_MIPI_DEPTH_IR)
+    records['size'] = md.EXT_MIPI_DEPTH_IR.itemsize
+    records['Frame_counter'] = counter
+    records['hwTimestamp'] = hw & 0xFFFFFFFF
+    metadata_link = tmp_path / 'frames.bin'
+    records.tofile(metadata_link)
+
+    # OTF status event at the drop, ROI events every 500 ms, log timestamps in 10 us ticks
+    events = [(7, (start_us + i * 500000) // 10) for i in range(20)]
+    events.append((577, (start_us + 101 * FRAME_US) // 10))
+    events.sort(key=lambda event: event[1])
+    log = b''.join(log_record(event_id, timestamp, i) for i, (event_id, timestamp) in enumerate(events))
+    log_link = tmp_path / 'fw.log'
+    log_link.write_bytes(log_text(log))
+
+    xml_link = tmp_path / 'HWLoggerEventsDS5.xml'
+    xml_link.write_text(EVENTS_XML)
+    return str(xml_link), str(log_link), str(metadata_link)
+
+
+def test_frame_times_wrap():
+    cols = {'hwTimestamp': np.array([0xFFFFFFF0, 0xFFFFFFFF, 0x10, 0x20], np.uint32)}
+    times = frame_events.frame_times(cols, tick=1, offset=-0xFFFFFFF0)
+    assert times.tolist() == [0, 15, 32, 48]
+
+
+def test_frame_anomalies_out_of_order():
+    cols = {'frameCounter': np.array([0, 1, 2, 2, 1, 3, 5], np.uint32)}
+    times = np.arange(7) / 30
+    anomalies = frame_events.frame_anomalies(cols, times, fps=30)
+    assert anomalies['index'].tolist() == [3, 4, 5, 6]
+    assert [frame_events.ANOMALIES[kind] for kind in anomalies['kind']] == ['repeated', 'out_of_order', 'dropped',
+                                                                            'dropped']
+
+
+def test_first_record_offset(tmp_path):
+    xml_link, log_link, metadata_link = capture(tmp_path, start_us=5000000)
+    events = frame_events.LogEvents.read(log_link)
+    cols = md.decode(metadata_link)
+    # log timestamps start at 5 s too, the metadata clock is shifted by 2 s
+    cols['hwTimestamp'] = cols['hwTimestamp'] + 2000000
+    offset = frame_events.first_record_offset(events, cols)
+    assert offset == pytest.approx(-2.0)
+    assert frame_events.frame_times(cols, offset=offset)[0] == pytest.approx(events.times[0])
+    assert frame_events.first_record_offset(events, {'hwTimestamp': np.empty(0, np.uint32)}) == 0.0
+
+
+def test_anomaly_report(tmp_path):
+    xml_link, log_link, metadata_link = capture(tmp_path)
+    event_dictionary = EventDictionary.from_xml(xml_link)
+    events = frame_events.LogEvents.read(log_link)
+    cols = md.decode(metadata_link)
+    times = frame_events.frame_times(cols)
+    anomalies = frame_events.frame_anomalies(cols, times, fps=30)
+
+    assert len(events) == 21
+    assert np.all(np.diff(events.times) >= 0)
+    assert [frame_events.ANOMALIES[kind] for kind in anomalies['kind']] == ['dropped', 'late']
+
+    report = frame_events.anomaly_report(events, cols, times, anomalies, 0.05, event_dictionary)
+    json.dumps(report)
+    assert report['anomalies'] == {'dropped': 1, 'repeated': 0, 'late': 1, 'out_of_order': 0}
+    dropped, late = report['details']
+    assert dropped['frameCounter'] == 102
+    assert [event['event_id'] for event in dropped['listed']] == [577]
+    assert dropped['listed'][0]['offset_ms'] == pytest.approx(-33.333, abs=0.01)
+    assert dropped['listed'][0]['description'].startswith('HW config - OTF status inconsistent')
+    assert late['frameCounter'] == 200 and late['events'] == 0
+    assert report['frequent_events'][0]['event_id'] == 577
+
+    rows = list(frame_events.merged_rows(events, cols, times, anomalies, event_dictionary))
+    assert len(rows) == 21 + 298
+    assert [float(row.split()[0]) for row in rows] == sorted(float(row.split()[0]) for row in rows)
+    otf = next(i for i, row in enumerate(rows) if 'OTF' in row)
+    assert rows[otf - 1].split()[2] == '99' and rows[otf + 1].split()[2:] == ['102', 'DROPPED']
+
+
+def test_frame_events_main(tmp_path):
+    xml_link, log_link, metadata_link = capture(tmp_path)
+    timeline_link = tmp_path / 'timeline.txt'
+    result = subprocess.run([sys.executable, os.path.join(METADATA_DIR, 'frame_events.py'), '-x', xml_link,
+                             '-f', log_link, '-m', metadata_link, '-p', '30', '-w', '100', '-t', str(timeline_link)],
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout)
+    assert report['window_ms'] == 100
+    assert report['anomalies_with_events'] == 1
+    assert len(timeline_link.read_text().splitlines()) == 21 + 298
+    assert report['alignment'] == {'method': 'first_record', 'offset': pytest.approx(0.0, abs=1e-6)}
+
+    result = subprocess.run([sys.executable, os.path.join(METADATA_DIR, 'frame_events.py'), '-x', xml_link,
+                             '-f', log_link, '-m', metadata_link, '-p', '30', '--offset', '0.5'],
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout)
+    assert report['alignment'] == {'method': 'offset', 'offset': 0.5}
+    assert report['anomalies_with_events'] == 0
+
+    # the events dictionary is required
+    result = subprocess.run([sys.executable, os.path.join(METADATA_DIR, 'frame_events.py'), '-f', log_link,
+                             '-m', metadata_link], capture_output=True, text=True)
+    assert result.returncode == 1 and result.stdout.startswith('Usage: frame_events.py')
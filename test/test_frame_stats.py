@@ -0,0 +1,172 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from frame_stats import FrameKpiError, FrameStats, aggregate, interference, percentile, stream_concurrent, stream_frames
+
+FAKE_V4L2_CTL = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_v4l2_ctl.py')]
+
+# v4l2-ctl --stream-mmap --verbose output of a 30 fps capture, frame 4 dropped
+RECORDED = """VIDIOC_QUERYCAP: ok
+VIDIOC_REQBUFS returned 0 (Success)
+cap dqbuf: 0 seq:      0 bytesused: 1843200 ts: 100.000000 (ts-monotonic, ts-src-eof)
+cap dqbuf: 1 seq:      1 bytesused: 1843200 ts: 100.040000 delta: 40.000 ms fps: 25.00 (ts-monotonic, ts-src-eof)
+cap dqbuf: 2 seq:      2 bytesused: 1843200 ts: 100.073333 delta: 33.333 ms fps: 27.50 (ts-monotonic, ts-src-eof)
+cap dqbuf: 3 seq:      3 bytesused: 1843200 ts: 100.106000 delta: 32.667 ms fps: 28.30 (ts-monotonic, ts-src-eof)
+cap dqbuf: 0 seq:      5 bytesused: 1843200 ts: 100.140000 delta: 34.000 ms fps: 29.00 (ts-monotonic, ts-src-eof)
+cap dqbuf: 1 seq:      6 bytesused: 1843200 ts: 100.173333 delta: 33.333 ms fps: 29.40 (ts-monotonic, ts-src-eof)
+"""
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_recorded_capture():
+    stats = FrameStats(30).feed(RECORDED.splitlines())
+    s = stats.summary()
+
+    # first interval (40 ms) is skipped, the single dropped frame is within max_gap
+    assert stats.violations == []
+    assert s['frames'] == 6
+    assert s['dropped'] == 1
+    assert s['repeated'] == 0
+    assert s['interval_p50'] == pytest.approx(33.333)
+    assert s['interval_max'] == pytest.approx(34.0)
+    assert s['jitter_max'] == pytest.approx(34.0 - 1000 / 30)
+    assert s['fps'] == pytest.approx(5 / 0.173333)
+    assert s['throughput'] == pytest.approx(6 * 1843200 / 0.173333 / 1e6)
+    assert "6 frames, 1 dropped, 0 repeated" in stats.report()
+
+
+@pytest.mark.parametrize("line, message", [
+    ("cap dqbuf: 2 seq:      3 bytesused: 1843200 ts: 100.073333 delta: 33.333 ms", "Frames dropped between: 0 and 3"),
+    ("cap dqbuf: 2 seq:      0 bytesused: 1843200 ts: 100.073333 delta: 33.333 ms", "Repeated frame: 0"),
+    ("cap dqbuf: 2 seq:      1 bytesused: 1843200 ts: 100.073333 delta: 40.000 ms", "FPS too low: 25.00/30"),
+    ("cap dqbuf: 2 seq:      1 bytesused: 1843200 ts: 100.073333 delta: 30.000 ms", "FPS too high: 33.33/30"),
+])
+def test_violations(line, message):
+    first = "cap dqbuf: 0 seq:      0 bytesused: 1843200 ts: 100.000000 delta: 50.000 ms"
+
+    with pytest.raises(FrameKpiError, match=message):
+        FrameStats(30).feed([first, line])
+
+    stats = FrameStats(30, fail_fast=False).feed([first, line])
+    assert stats.violations == [message]
+    assert stats.summary()['violations'] == 1
+
+
+def test_stream_frames():
+    script = ("import sys\n"
+              "for seq in range(10):\n"
+              "    print(f'cap dqbuf: 0 seq: {seq} bytesused: 100 ts: {seq / 30:.6f} delta: 33.333 ms', file=sys.stderr)\n")
+    stats = stream_frames([sys.executable, '-c', script], FrameStats(30), timeout=30)
+    assert stats.frames == 10
+    assert stats.violations == []
+
+    # expected number of frames stops the capture
+    stats = stream_frames([sys.executable, '-c', script], FrameStats(30), timeout=30, frames=4)
+    assert stats.frames == 4
+
+
+def test_stream_frames_fail_fast():
+    # capture would run for a minute, the repeated frame stops it immediately
+    script = ("import sys, time\n"
+              "print('cap dqbuf: 0 seq: 1 bytesused: 100 ts: 1.000000', file=sys.stderr, flush=True)\n"
+              "print('cap dqbuf: 0 seq: 1 bytesused: 100 ts: 1.033333', file=sys.stderr, flush=True)\n"
+              "time.sleep(60)\n")
+    start = time.monotonic()
+    with pytest.raises(FrameKpiError, match="Repeated frame: 1"):
+        stream_frames([sys.executable, '-c', script], FrameStats(30), timeout=30)
+    assert time.monotonic() - start < 20
+
+
+def test_stream_frames_errors():
+    with pytest.raises(subprocess.CalledProcessError):
+        stream_frames([sys.executable, '-c', 'import sys; sys.exit(3)'], FrameStats(30), timeout=30)
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        stream_frames([sys.executable, '-c', 'import time; time.sleep(60)'], FrameStats(30), timeout=0.5)
+
+
+def fake_capture(device, frames, *options):
+    return [*FAKE_V4L2_CTL, f"-d{device}", "--stream-mmap", "--stream-count", f"{frames}", "--verbose", *options]
+
+
+def test_aggregate_interference():
+    first = FrameStats(30, fail_fast=False).feed(RECORDED.splitlines())
+    second = FrameStats(30, fail_fast=False).feed(line.replace("seq:      3", "seq:      2")
+                                                  for line in RECORDED.splitlines())
+    third = FrameStats(30, fail_fast=False).feed(line.replace("ts: 100.", "ts: 200.").replace("seq:      3", "seq:      2")
+                                                 for line in RECORDED.splitlines())
+    streams = {'0': first, '2': second}
+
+    s = aggregate(streams)
+    assert s['frames'] == 12
+    assert s['dropped'] == 1 + 2
+    assert s['repeated'] == 1
+    assert s['interval_max'] == pytest.approx(34.0)
+    assert s['fps'] == pytest.approx(first.summary()['fps'] + second.summary()['fps'])
+
+    # the repeated and the dropped frames are reported at the same capture time
+    assert second.violations == ["Repeated frame: 2", "Frames dropped between: 2 and 5"]
+    assert interference(streams) == []
+    assert interference({'2': second, '4': second}) == [('2', '4', 2)]
+    assert interference({'2': second, '4': third}) == []
+
+
+def test_stream_concurrent():
+    streams = {device: (fake_capture(device, 20, "--fake-fps", "50", "--fake-size", "1000"),
+                        FrameStats(50, kpi=50, fail_fast=False))
+               for device in ('0', '2')}
+    errors = stream_concurrent(streams, timeout=30, frames=20)
+    stats = {device: streams[device][1] for device in streams}
+
+    assert errors == {'0': None, '2': None}
+    s = aggregate(stats)
+    assert s['frames'] == 40
+    assert s['dropped'] == 0
+    assert s['fps'] == pytest.approx(100, rel=0.3)
+    assert s['throughput'] == pytest.approx(100 * 1000 / 1e6, rel=0.3)
+
+
+def test_stream_concurrent_errors():
+    def fail(stats):
+        raise ValueError("bad frame")
+
+    start = time.monotonic()
+    errors = stream_concurrent({'slow': (lambda stats: time.sleep(10), FrameStats(30)),
+                                'bad': (fail, FrameStats(30)),
+                                'ok': (lambda stats: stats.add_frame(0), FrameStats(30))}, timeout=0.5)
+    assert time.monotonic() - start < 5
+    assert isinstance(errors['slow'], TimeoutError)
+    assert isinstance(errors['bad'], ValueError)
+    assert errors['ok'] is None
+
+
+def test_stream_concurrent_interference():
+    # the same link stall delays both streams, frames dropped by one stream only are no interference,
+    # the window covers the start offset of the emulated streams and is shorter than the stall
+    streams = {'0': (fake_capture('0', 80, "--fake-fps", "50", "--fake-stall", "10:1000", "--fake-drop", "70,71"),
+                     FrameStats(50, kpi=50, fail_fast=False)),
+               '2': (fake_capture('2', 80, "--fake-fps", "50", "--fake-stall", "10:1000"),
+                     FrameStats(50, kpi=50, fail_fast=False)),
+               '4': (fake_capture('4', 3, "--fake-missing-option"), FrameStats(50))}
+    errors = stream_concurrent(streams, timeout=30, frames=80)
+    stats = {device: streams[device][1] for device in ('0', '2')}
+
+    assert errors['0'] is None and errors['2'] is None
+    assert isinstance(errors['4'], subprocess.CalledProcessError)
+    assert stats['0'].dropped == 2
+    assert stats['0'].violations == ["FPS too low: 0.98/50", "Frames dropped between: 69 and 72",
+                                     "FPS too low: 16.67/50"]
+    assert stats['2'].violations == ["FPS too low: 0.98/50"]
+    assert interference(stats, window=0.5) == [('0', '2', 1)]
@@ -0,0 +1,536 @@
+import io
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'fw_log_parser'))
+import firmware_log_parser as parser
+import event_dictionary
+from event_dictionary import EventDictionary
+import firmware_log_batch as batch
+
+np = pytest.importorskip("numpy")
+
+# two records from firmware_log_parser.md, log header already removed
+SAMPLE_LOG = bytes([160, 33, 38, 16, 7, 0, 228, 33, 224, 1, 80, 3, 0, 0, 0, 0, 87, 124, 108, 139,
+                    160, 35, 10, 16, 65, 2, 161, 49, 0, 0, 0, 0, 0, 0, 0, 0, 151, 130, 108, 139])
+
+EVENTS_XML = """<?xml version="1.0"?>
+<Format>
+    <Event id="7" numberOfArguments="2" format="Depth - ROI control set to left {0}, right {1}" />
+    <Event id="577" numberOfArguments="3" format="HW config - OTF status inconsistent {0}, {1}, 0x{2:x}" />
+    <Event id="8" numberOfArguments="0" format="Literal {braces}" />
+    <Event id="9" numberOfArguments="4" format="Too many" />
+    <File id="38" Name="AutoExposure.c" />
+    <File id="10" Name="HwConfig.c" />
+    <Thread id="1" Name="DEPTH" />
+</Format>
+"""
+
+
+@pytest.fixture
+def events_xml(tmp_path):
+    path = tmp_path / "HWLoggerEventsDS5.xml"
+    path.write_text(EVENTS_XML)
+    return str(path)
+
+
+def random_log(records, seed=0):
+    rnd = random.Random(seed)
+    log = bytearray()
+    for i in range(records):
+        if i % 7 == 3:
+            log += bytes(parser.RECORD_SIZE)
+        else:
+            log += bytes(rnd.randrange(256) for _ in range(parser.RECORD_SIZE))
+    # trailing incomplete record
+    log += bytes([1, 2, 3])
+    return bytes(log)
+
+
+def test_decode_sample():
+    records = parser.decode_log_numpy(SAMPLE_LOG)
+    assert len(records) == 2
+    first = dict(zip(parser.RECORD_FIELDS, records[0].tolist()))
+    assert first['magic_number'] == 160
+    assert first['severity'] == 1
+    assert first['file_id'] == 38
+    assert first['group_id'] == 2
+    assert first['event_id'] == 7
+    assert first['line_number'] == 484
+    assert first['sequence'] == 2
+    assert (first['data1'], first['data2'], first['data3']) == (480, 848, 0)
+    assert first['timestamp'] == 2339142743
+
+
+def test_engines_match():
+    log = random_log(1000)
+    expected = parser.decode_log_ctypes(log)
+    assert len(expected) == 1000 - len(range(3, 1000, 7))
+    assert parser.decode_log_numpy(log).tolist() == expected
+    assert parser.decode_log(log, 'numpy') == parser.decode_log(log, 'ctypes')
+
+
+def test_decode_empty():
+    assert parser.decode_log_numpy(b'').tolist() == []
+    assert parser.decode_log_ctypes(b'') == []
+
+
+def test_event_dictionary(events_xml):
+    dictionary = EventDictionary.from_xml(events_xml)
+    assert dictionary.file_name(38) == 'AutoExposure.c'
+    assert dictionary.file_name(39) == 'File not found'
+    assert dictionary.thread_name(1) == 'DEPTH'
+    assert dictionary.thread_name(2) == 'Thread not found'
+    assert dictionary.number_of_arguments(577) == 3
+    assert dictionary.description(7, 480, 848, 0) == 'Depth - ROI control set to left 480, right 848'
+    assert dictionary.description(577, 0, 0, 255) == 'HW config - OTF status inconsistent 0, 0, 0xff'
+    assert dictionary.description(8, 1, 2, 3) == 'Literal {braces}'
+    assert dictionary.description(9, 1, 2, 3) == 'Too many (Wrong number of arguments read from the log line!)'
+    assert dictionary.description(1000, 1, 2, 3) == 'Event not found'
+
+
+def test_event_dictionary_cache(events_xml, monkeypatch):
+    cache_link = events_xml + event_dictionary.CACHE_SUFFIX
+    dictionary = EventDictionary.load(events_xml)
+    assert os.path.isfile(cache_link)
+
+    # valid cache is used without parsing the xml
+    def fail(*args):
+        raise AssertionError("xml parsed")
+    monkeypatch.setattr(EventDictionary, 'from_xml', classmethod(fail))
+    cached = EventDictionary.load(events_xml)
+    assert (cached.events, cached.files, cached.threads) == (dictionary.events, dictionary.files, dictionary.threads)
+
+    # touched but unchanged xml is matched by content hash
+    stat = os.stat(events_xml)
+    os.utime(events_xml, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert EventDictionary.load(events_xml).files == dictionary.files
+    monkeypatch.undo()
+
+    # changed xml rebuilds the cache
+    with open(events_xml, 'w') as file:
+        file.write(EVENTS_XML.replace('HwConfig.c', 'HwConfig2.c'))
+    assert EventDictionary.load(events_xml).file_name(10) == 'HwConfig2.c'
+    assert event_dictionary.read_cache(cache_link)['tables'][1][10] == 'HwConfig2.c'
+
+
+def test_event_dictionary_cache_mode(events_xml):
+    umask = os.umask(0o022)
+    try:
+        EventDictionary.load(events_xml)
+    finally:
+        os.umask(umask)
+    assert os.stat(events_xml + event_dictionary.CACHE_SUFFIX).st_mode & 0o777 == 0o644
+
+
+def log_text(log_bytes, header=(15, 0, 0, 0)):
+    return ('logger: ' + ', '.join('{:4}'.format(byte) for byte in bytes(header) + log_bytes) + '\n').encode()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 16])
+def test_read_log_records_chunks(chunk_size):
+    log = random_log(200, seed=1)
+    text = log_text(log)
+    blocks = list(parser.read_log_records(io.BytesIO(text), chunk_size))
+    assert all(len(block) % parser.RECORD_SIZE == 0 for block in blocks)
+    assert parser.decode_log_ctypes(b''.join(blocks)) == parser.decode_log_ctypes(log)
+    assert len(b''.join(blocks)) == len(parser.decode_log_ctypes(log)) * parser.RECORD_SIZE
+
+
+def test_read_log_records_streaming():
+    text = log_text(SAMPLE_LOG * 100)
+    consumed = []
+
+    def chunks():
+        for offset in range(0, len(text), 100):
+            consumed.append(offset)
+            yield text[offset:offset + 100]
+
+    records = parser.split_records(parser.tokenize_log(chunks()))
+    first = next(records)
+    assert parser.decode_log_ctypes(first)[0][parser.RECORD_FIELDS.index('line_number')] == 484
+    assert len(consumed) < 3
+
+
+def test_read_log_records_wrong_value():
+    with pytest.raises(ValueError):
+        list(parser.read_log_records(io.BytesIO(b'logger: 15, 0, 0, 0, 256')))
+
+
+class SnapshotWriter:
+    """
+    Stand-in for `v4l2-ctl -C logger >> file`: appends overlapping logger snapshots to a file
+    """
+
+    def __init__(self, file_link, records, snapshot_size=10, step=4):
+        self.file_link = file_link
+        self.records = records
+        self.snapshot_size = snapshot_size
+        self.step = step
+        self.start = 0
+
+    def write_next(self, mode='a'):
+        snapshot = self.records[self.start:self.start + self.snapshot_size]
+        self.start += self.step
+        with open(self.file_link, mode + 'b') as file:
+            file.write(log_text(b''.join(snapshot)))
+
+
+def synthetic_records(count):
+    records = []
+    for i in range(count):
+        dword1 = 0xA0 | (1 << 8) | (1 << 13) | (38 << 16) | (2 << 27)
+        dword2 = 7 | (100 << 16) | ((i & 0xF) << 28)
+        records.append(b''.join(value.to_bytes(4, 'little') for value in (dword1, dword2, i, 0, 1000 + 50 * i)))
+    return records
+
+
+@pytest.mark.parametrize("mode", ['a', 'w'])
+def test_follow_log_file(tmp_path, mode):
+    records = synthetic_records(40)
+    log_link = str(tmp_path / "logger.log")
+    writer = SnapshotWriter(log_link, records)
+    follower = parser.LogFileFollower(log_link)
+
+    def read_snapshot():
+        if mode == 'w':
+            # rewritten file of the same size is detected by modification time
+            time.sleep(0.02)
+        writer.write_next(mode)
+        return follower()
+
+    polls = list(parser.follow_log(read_snapshot, 'ctypes', interval=0, max_polls=10))
+    followed = [record for poll in polls for record in poll]
+    expected = parser.decode_log_ctypes(b''.join(records))
+    assert followed == expected
+    assert len(polls[0]) == 10
+    assert all(len(poll) == 4 for poll in polls[1:-1])
+
+
+def test_follow_log_background_writer(tmp_path):
+    records = synthetic_records(30)
+    log_link = str(tmp_path / "logger.log")
+    writer = SnapshotWriter(log_link, records, snapshot_size=8, step=3)
+
+    def write():
+        while writer.start < len(records):
+            writer.write_next()
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    followed = []
+    for poll in parser.follow_log(parser.LogFileFollower(log_link), 'ctypes', interval=0.002, max_polls=5000):
+        followed += poll
+        if len(followed) >= len(records):
+            break
+    thread.join()
+    assert followed == parser.decode_log_ctypes(b''.join(records))
+
+
+def test_parse_files_parallel(tmp_path, events_xml):
+    records = synthetic_records(60)
+    log_links = []
+    for i in range(3):
+        log_link = tmp_path / f"node{i}.log"
+        log_link.write_bytes(log_text(b''.join(records[i::3])))
+        log_links.append(str(log_link))
+    dictionary = EventDictionary.load(events_xml)
+
+    outputs = {}
+    for jobs in (1, 2):
+        output_dir = tmp_path / f"out{jobs}"
+        output_dir.mkdir()
+        assert batch.parse_files(log_links, dictionary, 'ctypes', jobs, str(output_dir)) == 60
+        outputs[jobs] = sorted((path.name, path.read_text()) for path in output_dir.iterdir())
+    assert outputs[1] == outputs[2]
+    assert [name for name, _ in outputs[1]] == ['node0.log.txt', 'node1.log.txt', 'node2.log.txt']
+
+    merge_link = tmp_path / "merged.txt"
+    assert batch.parse_files(log_links, dictionary, 'ctypes', 2, merge_link=str(merge_link)) == 60
+    lines = [line for line in merge_link.read_text().splitlines() if line][1:]
+    timestamps = [int(line.split()[7]) for line in lines]
+    assert timestamps == [1000 + 50 * i for i in range(60)]
+    assert [line.split()[0] for line in lines[:4]] == ['node0.log', 'node1.log', 'node2.log', 'node0.log']
+
+
+def test_parse_files_same_names(tmp_path, events_xml):
+    # logs with equal names in different directories keep their relative paths
+    records = synthetic_records(4)
+    log_links = []
+    for node in ('a', 'b'):
+        (tmp_path / node).mkdir()
+        log_link = tmp_path / node / "fw.log"
+        log_link.write_bytes(log_text(b''.join(records)))
+        log_links.append(str(log_link))
+    dictionary = EventDictionary.load(events_xml)
+    output_dir = tmp_path / "out"
+    assert batch.parse_files(log_links, dictionary, 'ctypes', 1, str(output_dir)) == 8
+    assert (output_dir / "a" / "fw.log.txt").is_file() and (output_dir / "b" / "fw.log.txt").is_file()
+
+
+def test_merge_logs_wrap():
+    # the first log wraps its 32-bit timestamp counter, its later records stay after the second log
+    def row(timestamp, sequence):
+        return (sequence, 'file.c', 0, 'thread', 1, 1, timestamp, 'event')
+    first = [row(0xFFFFFF00, 1), row(0x00000010, 2), row(0x00000100, 3)]
+    second = [row(0xFFFFFF80, 1)]
+    merged = batch.merge_logs([first, second], ['first', 'second'])
+    assert [(source, merged_row[6]) for source, _, merged_row in merged] == \
+        [('first', 0xFFFFFF00), ('second', 0xFFFFFF80), ('first', 0x10), ('first', 0x100)]
+
+
+@pytest.mark.parametrize("file_format", ['csv', 'jsonl', 'npz', 'parquet'])
+def test_sinks(tmp_path, events_xml, file_format):
+    if file_format == 'parquet':
+        pytest.importorskip("pyarrow")
+    import log_sinks
+    import log_timeline
+
+    records = parser.decode_log_numpy(b''.join(synthetic_records(50)))
+    dictionary = EventDictionary.load(events_xml)
+    columns = parser.parse_columns('sequence,file_name,timestamp,delta_timestamp,description,data1')
+    output_link = str(tmp_path / f"events.{file_format}")
+
+    sink = log_sinks.open_sink(file_format, output_link, columns)
+    timeline = log_timeline.Timeline()
+    for batch_records in (records[:20], records[20:]):
+        times = timeline.update(batch_records['timestamp'], batch_records['sequence'])
+        sink.write(log_sinks.build_columns(batch_records, dictionary, columns, times))
+    sink.close()
+
+    if file_format == 'csv':
+        import csv
+        with open(output_link, newline='') as file:
+            rows = list(csv.DictReader(file))
+        timestamps = [int(row['timestamp']) for row in rows]
+        descriptions = [row['description'] for row in rows]
+        file_names = [row['file_name'] for row in rows]
+        deltas = [float(row['delta_timestamp']) for row in rows]
+    elif file_format == 'jsonl':
+        import json
+        with open(output_link) as file:
+            rows = [json.loads(line) for line in file]
+        timestamps = [row['timestamp'] for row in rows]
+        descriptions = [row['description'] for row in rows]
+        file_names = [row['file_name'] for row in rows]
+        deltas = [row['delta_timestamp'] for row in rows]
+    elif file_format == 'npz':
+        data = np.load(output_link)
+        assert list(data.keys()) == list(columns)
+        timestamps = data['timestamp'].tolist()
+        descriptions = data['description'].tolist()
+        file_names = data['file_name'].tolist()
+        deltas = data['delta_timestamp'].tolist()
+    else:
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(output_link).to_pydict()
+        assert list(table) == list(columns)
+        timestamps = table['timestamp']
+        descriptions = table['description']
+        file_names = table['file_name']
+        deltas = table['delta_timestamp']
+
+    assert timestamps == [1000 + 50 * i for i in range(50)]
+    assert descriptions[3] == 'Depth - ROI control set to left 3, right 0'
+    assert file_names == ['AutoExposure.c'] * 50
+    assert deltas[0] == 0 and deltas[1:] == pytest.approx([0.0005] * 49)
+
+
+@pytest.mark.parametrize("file_format", ['csv', 'jsonl', 'npz', 'parquet', 'arrow'])
+def test_sinks_empty(tmp_path, file_format):
+    if file_format in ('parquet', 'arrow'):
+        pytest.importorskip("pyarrow")
+    import log_sinks
+
+    columns = parser.parse_columns('sequence,file_name,timestamp,description')
+    output_link = tmp_path / "events.out"
+    log_sinks.open_sink(file_format, str(output_link), columns).close()
+    # every format writes the requested file even without records
+    assert [path.name for path in tmp_path.iterdir()] == ["events.out"]
+
+    if file_format == 'npz':
+        assert list(np.load(output_link).keys()) == list(columns)
+    elif file_format == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(output_link)
+        assert table.num_rows == 0 and table.column_names == list(columns)
+        assert str(table.schema.field('description').type) == 'string'
+
+
+def test_npz_fallback_name(tmp_path, monkeypatch, capsys):
+    import log_sinks
+    monkeypatch.setattr(log_sinks, 'pa', None)
+    output_link = str(tmp_path / "events.parquet")
+    log_sinks.open_sink('parquet', output_link, ('timestamp',)).close()
+    assert os.listdir(tmp_path) == ["events.parquet"]
+    assert output_link in capsys.readouterr().err
+
+
+def test_parse_columns():
+    assert parser.parse_columns('sequence, data3') == ('sequence', 'data3')
+    with pytest.raises(ValueError):
+        parser.parse_columns('sequence,unknown')
+    assert parser.text_columns(('sequence',))['print_sequence_id']
+    assert not parser.text_columns(('sequence',))['print_description']
+
+
+def test_text_renderer_layout(capsys):
+    import benchmark_renderer
+    rows = benchmark_renderer.synthetic_rows(100)
+    benchmark_renderer.print_per_column(rows)
+    expected = capsys.readouterr().out
+
+    renderer = parser.TextRenderer(io.StringIO())
+    assert renderer.render(rows[:30]) + renderer.render(rows[30:]) == expected
+
+    columns = parser.text_columns(('sequence', 'delta_timestamp'))
+    assert parser.TextRenderer(columns=columns).render(rows[:2]) == '0         0            \n\n1         0.0016       \n\n'
+
+
+def test_timeline_wrap_drops_and_order():
+    pytest.importorskip("numpy")
+    import log_timeline
+
+    timestamps = [0xFFFFFF00, 0xFFFFFF80, 0x00000010, 0x00000005, 0x00000100]
+    sequences = [1, 2, 3, 4, 8]
+    timeline = log_timeline.Timeline()
+    first = timeline.update(timestamps[:2], sequences[:2])
+    second = timeline.update(timestamps[2:], sequences[2:])
+
+    assert first['time'].tolist() + second['time'].tolist() == [0xFFFFFF00, 0xFFFFFF80, 0x100000010,
+                                                                0x100000005, 0x100000100]
+    assert first['delta'].tolist() + second['delta'].tolist() == pytest.approx([0, 0.00128, 0.00144,
+                                                                                -0.00011, 0.00251])
+    assert second['out_of_order'].tolist() == [False, True, False]
+    assert second['dropped'].tolist() == [0, 0, 3]
+
+    report = timeline.report()
+    assert (report['records'], report['dropped'], report['out_of_order'], report['wraps']) == (5, 3, 1, 1)
+    assert timeline.report_lines()[0].startswith('Timeline: 5 records, 3 dropped, 1 out of order')
+    assert parser.calculate_delta_timestamp(0x10, 0xFFFFFF80) == pytest.approx(0.00144)
+    assert parser.calculate_delta_timestamp(0x10, None) == 0
+
+
+def test_event_store(tmp_path, events_xml):
+    import event_store
+
+    records = parser.decode_log_ctypes(b''.join(synthetic_records(40)))
+    store_link = str(tmp_path / 'events.db')
+    store = event_store.EventStore(store_link)
+    store.add_dictionary(EventDictionary.load(events_xml))
+    source_id = store.add_source('first.log', 'hash1')
+    assert store.add(source_id, records[:25]) == 25
+    store.add(source_id, records[25:], [record[-1] + (1 << 32) for record in records[25:]])
+    store.complete_source(source_id)
+    store.close()
+
+    store = event_store.EventStore(store_link)
+    assert store.count() == 40
+    file_ids = store.resolve_ids('files', ['AutoExposure.c'])
+    assert file_ids == [38]
+    assert store.count({'file_id': file_ids, 'event_id': [7]}, first_time=1 << 32) == 15
+    assert store.count({'thread_id': store.resolve_ids('threads', ['unknown'])}) == 0
+
+    rows = [row[:-1] for row in store.query({'severity': [records[0][1]]}, last_time=1000 + 50 * 9, limit=4)]
+    assert rows == records[:4]
+    described = parser.describe_records(rows, store.dictionary())
+    assert described[3][-1] == 'Depth - ROI control set to left 3, right 0'
+
+    # the same content is skipped or replaced
+    assert store.add_source('copy.log', 'hash1') is None
+    source_id = store.add_source('copy.log', 'hash1', replace=True)
+    store.add(source_id, records[:10])
+    store.complete_source(source_id)
+    other_id = store.add_source('/dev/video0')
+    store.add(other_id, records[:5])
+    assert [source[:2] + source[-2:] for source in store.sources()] == [(2, 'copy.log', 1, 10),
+                                                                        (3, '/dev/video0', 0, 5)]
+    assert store.count({'source_id': [other_id]}) == 5
+    with pytest.raises(event_store.sqlite3.IntegrityError):
+        store.add(1, records[:1])
+
+    # an interrupted ingestion is repeated, its records are replaced
+    source_id = store.add_source('third.log', 'hash3')
+    store.add(source_id, records[:20])
+    store.close()
+    store = event_store.EventStore(store_link)
+    source_id = store.add_source('third.log', 'hash3')
+    assert source_id is not None
+    assert store.count({'source_id': store.resolve_ids('sources', ['third.log'])}) == 0
+    store.add(source_id, records)
+    store.complete_source(source_id)
+    assert store.add_source('third.log', 'hash3') is None
+    assert store.count({'source_id': [source_id]}) == 40
+    store.close()
+
+
+def test_event_store_interrupted(tmp_path, events_xml, monkeypatch):
+    import runpy
+    import event_store
+
+    scripts = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'fw_log_parser')
+    log_link = tmp_path / 'first.log'
+    log_link.write_bytes(log_text(b''.join(synthetic_records(40))))
+    store_link = str(tmp_path / 'events.db')
+    ingest = [os.path.join(scripts, 'firmware_log_parser.py'), '-x', events_xml, '-f', str(log_link),
+              '--store', store_link]
+
+    # Ctrl-C while the first batch is stored
+    add = event_store.EventStore.add
+
+    def interrupted_add(self, source_id, records, times=None):
+        add(self, source_id, records[:5], None if times is None else times[:5])
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(event_store.EventStore, 'add', interrupted_add)
+    monkeypatch.setattr(sys, 'argv', ingest)
+    runpy.run_path(ingest[0], run_name='__main__')
+    monkeypatch.setattr(event_store.EventStore, 'add', add)
+
+    store = event_store.EventStore(store_link)
+    assert [source[-2:] for source in store.sources()] == [(0, 5)]
+    store.close()
+
+    # the incomplete log is ingested again instead of being reported as already ingested
+    result = subprocess.run([sys.executable, *ingest], capture_output=True, text=True, check=True)
+    assert 'already ingested' not in result.stdout
+    store = event_store.EventStore(store_link)
+    assert [source[-2:] for source in store.sources()] == [(1, 40)]
+    assert store.count() == 40
+    store.close()
+
+
+def test_event_store_cli(tmp_path, events_xml):
+    scripts = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'fw_log_parser')
+    log_link = tmp_path / 'first.log'
+    log_link.write_bytes(log_text(b''.join(synthetic_records(40))))
+    store_link = str(tmp_path / 'events.db')
+
+    def run(script, *args):
+        return subprocess.run([sys.executable, os.path.join(scripts, script), *args],
+                              capture_output=True, text=True, check=True).stdout
+
+    ingest = ('firmware_log_parser.py', '-x', events_xml, '-f', str(log_link), '--store', store_link)
+
+    run(*ingest)
+    # the same log is not ingested twice
+    assert 'already ingested' in run(*ingest)
+
+    assert run('event_store.py', '-s', store_link, '--count').startswith('40 records')
+    assert run('event_store.py', '-s', store_link, '-S', str(log_link), '-f', 'AutoExposure.c',
+               '--count').startswith('40 records')
+    assert run('event_store.py', '-s', store_link, '-S', '2', '--count').startswith('0 records')
+    sources = run('event_store.py', '-s', store_link, '--sources').splitlines()
+    assert len(sources) == 1 and sources[0].endswith(f'40 records  {log_link}')
+
+    lines = [line for line in run('event_store.py', '-s', store_link, '-e', '7', '-n', '3').splitlines() if line]
+    assert len(lines) == 1 + 3
+    assert lines[1].split()[:2] == ['0', 'AutoExposure.c']
+    assert lines[3].rstrip().endswith('Depth - ROI control set to left 2, right 0')
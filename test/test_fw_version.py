@@ -1,20 +1,16 @@
-import subprocess
+import os
 import pytest
 
+from v4l2 import Device
+
 @pytest.mark.d457
 @pytest.mark.parametrize("device", {'0'})
 def test_fw_version(device):
     try:
-        key = "fw_version"
-        result = subprocess.check_call(["v4l2-ctl", "-d"+device, "-C", key])
-        assert result == 0
-
-        std_output = subprocess.check_output(["v4l2-ctl", "-d"+device, "-C", key])
-        key += ": "
-        assert key in std_output.decode(), "Couldn't fetch FW version"
-
-        # Remove the 'fw version: ' string from std output
-        fw_version = int(std_output.decode().replace(key, ""))
+        # read once with VIDIOC_G_EXT_CTRLS, no v4l2-ctl output parsing
+        with Device(device) as dev:
+            fw_version = dev.get_control("fw_version")
+        assert isinstance(fw_version, int), "Couldn't fetch FW version"
 
         fw_version_str = str(fw_version>>24 & 0xFF) + "." + str(fw_version>>16 & 0xFF) + "." + str(fw_version>>8 & 0xFF)  + "." + str(fw_version & 0xFF)
         print ("fw_version:", fw_version_str)
@@ -23,14 +19,15 @@ def test_fw_version(device):
         assert fw_version == (fw_version & 0x05FFFFFF), "Expected FW version is 5.x.x.x, but received {}".format(fw_version_str)
 
         # Get DFU device name
-        dfu_device = subprocess.check_output(["ls", "/sys/class/d4xx-class/"]).decode()
-        assert "d4xx-dfu-" in dfu_device, "D4xx DFU device not found"
+        dfu_devices = [name for name in os.listdir("/sys/class/d4xx-class/") if "d4xx-dfu-" in name]
+        assert dfu_devices, "D4xx DFU device not found"
 
         # Get FW version from DFU device info
-        dfu_device_info = subprocess.check_output(["cat", "/dev/"+dfu_device.strip()]).decode()
+        with open("/dev/" + dfu_devices[0]) as dfu:
+            dfu_device_info = dfu.read()
 
         # Check whether the DFU info also has same FW version
-        assert fw_version_str in dfu_device_info, "FW versions read through v4l2-ctl utility and DFU device info doesn't match"
+        assert fw_version_str in dfu_device_info, "FW versions read through VIDIOC_G_EXT_CTRLS and DFU device info doesn't match"
 
     except Exception as e:
         assert False, "Exception caught during test: {}".format(e)
@@ -0,0 +1,290 @@
+import os
+import sys
+
+import pytest
+
+JSON_TO_BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utilities', 'JsonToBin')
+sys.path.insert(0, JSON_TO_BIN_DIR)
+from RegisterIndex import RegisterIndex
+from Presets import Preset, compilePreset
+from PresetLayout import PresetLayout
+from PresetManifest import PresetManifest
+import PresetDiff
+import main as json_to_bin
+
+REGISTERS_HEADER = os.path.join(JSON_TO_BIN_DIR, 'Input', 'Registers_B0.h')
+PRESET_HEADER = os.path.join(JSON_TO_BIN_DIR, 'Input', 'Preset.h')
+SCP_HEADER = os.path.join(JSON_TO_BIN_DIR, 'Input', 'Scp.h')
+EXAMPLE_JSON = os.path.join(JSON_TO_BIN_DIR, 'Input', 'Jsons', 'AmazonExample.json')
+EXAMPLE_BIN = os.path.join(JSON_TO_BIN_DIR, 'Output', 'AmazonExample.bin')
+
+
+@pytest.fixture(scope='module')
+def reg_index():
+    return RegisterIndex(REGISTERS_HEADER)
+
+
+def test_register_index_fields(reg_index):
+    assert reg_index.fieldGet('Minwest') == (0, 4, 0xF)
+    assert reg_index.fieldGet('Minwesum') == (8, 4, 0xF)
+    assert reg_index.fieldGet('ScoreThreshB') == (10, 12, 0xFFF)
+    assert reg_index.fieldGet('Vshrink') == (28, 4, 0xF)
+
+
+def test_register_index_exact_match(reg_index):
+    assert reg_index.fieldGet('RsmBypass') == (23, 1, 1)
+    assert reg_index.fieldGet('K1penalty') == reg_index.fieldGet('K1penaltymod1')
+    assert 'Minwes' not in reg_index
+    with pytest.raises(KeyError):
+        reg_index.fieldGet('Minwes')
+
+
+def test_preset_json_keys(tmp_path, capsys):
+    json_link = tmp_path / 'Prefix.json'
+    json_link.write_text('{"param-scanlinep1onediscon": 1, "Param-ScanlineP1": 44, "controls-laserstate": "laserOn", '
+                         '"aux-param-colorcorrection10": -0.5, "aux-param-colorcorrection1": 0.5, "param-unknown": 3}')
+    preset = Preset()
+    preset.JsonFileName = str(json_link)
+    preset.presetJsonLoad()
+
+    assert preset.presetJsonSearch('scanlinep1', 0) == 44
+    assert preset.presetJsonSearch('colorcorrection1', 0.0) == 0.5
+    assert preset.presetVarValueGet('et_laserState') == 1
+    assert preset.presetVarValueGet('et_gain') == 16
+
+    unknown_keys, missing_keys = preset.presetValidationSummary('Prefix')
+    assert unknown_keys == ['unknown']
+    assert missing_keys == ['gain']
+    output = capsys.readouterr().out
+    assert '1 unknown keys ignored: unknown' in output
+    assert 'missing keys' not in output
+
+    preset.verbose = True
+    preset.presetValidationSummary('Prefix')
+    assert '1 missing keys use defaults: gain' in capsys.readouterr().out
+
+
+def test_preset_layout_matches_example(reg_index, tmp_path, monkeypatch):
+    layout = PresetLayout(PRESET_HEADER, SCP_HEADER)
+    assert layout.size == 324
+    assert layout.fields[0] == ('name', 'TPresetName', '20s')
+    assert layout.fields[-1] == ('exposure24', 'uint32_t', 'I')
+
+    (tmp_path / 'Output').mkdir()
+    monkeypatch.chdir(tmp_path)
+    preset = Preset()
+    preset.regIndex = reg_index
+    preset.layout = layout
+    preset.JsonFileName = EXAMPLE_JSON
+    assert preset.PresetJsonFileParse() == 0
+
+    with open(EXAMPLE_BIN, 'rb') as expected:
+        assert (tmp_path / 'Output' / 'AmazonExample.bin').read_bytes() == expected.read()
+
+
+def test_presets_convert_pool(tmp_path):
+    json_dir = tmp_path / 'jsons'
+    json_dir.mkdir()
+    with open(EXAMPLE_JSON) as example:
+        text = example.read()
+    json_names = []
+    for index in range(4):
+        json_names.append(str(json_dir / f'Preset{index}.json'))
+        with open(json_names[-1], 'w') as json_file:
+            json_file.write(text)
+    (json_dir / 'Broken.json').write_text('{"param-zunits": ')
+    json_names.append(str(json_dir / 'Broken.json'))
+    (json_dir / 'WrongType.json').write_text('{"param-zunits": [1000], "param-scanlinep1": {"value": 1}}')
+    json_names.append(str(json_dir / 'WrongType.json'))
+
+    preset = Preset()
+    preset.RegsFileName = REGISTERS_HEADER
+    preset.layout = PresetLayout(PRESET_HEADER, SCP_HEADER)
+    preset.OutputDir = str(tmp_path / 'out')
+    os.mkdir(preset.OutputDir)
+
+    umask = os.umask(0o022)
+    try:
+        results = json_to_bin.presetsConvert(json_names, preset, 2)
+    finally:
+        os.umask(umask)
+
+    assert [status for _, status, _, _, _ in results] == [0, 0, 0, 0, -1, -1]
+    assert [size for _, _, size, _, _ in results] == [324, 324, 324, 324, 0, 0]
+    assert 'not a valid preset json' in results[-2][4]
+    assert 'WrongType.json: wrong value of scanlinep1: {"value": 1}' in results[-1][4]
+    assert sorted(os.listdir(preset.OutputDir)) == [f'Preset{index}.bin' for index in range(4)]
+    # presets get the permissions of a regular new file, not the owner only mode of the temporary file
+    assert os.stat(os.path.join(preset.OutputDir, 'Preset0.bin')).st_mode & 0o777 == 0o644
+    with open(EXAMPLE_BIN, 'rb') as expected:
+        assert (tmp_path / 'out' / 'Preset3.bin').read_bytes()[20:] == expected.read()[20:]
+
+
+def test_preset_manifest(tmp_path):
+    headers = []
+    for name in ('Registers_B0.h', 'Preset.h'):
+        headers.append(tmp_path / name)
+        headers[-1].write_text('// ' + name)
+    jsons = []
+    for name in ('A.json', 'B.json'):
+        jsons.append(str(tmp_path / name))
+        with open(jsons[-1], 'w') as json_file:
+            json_file.write('{"param-zunits": 1000}')
+
+    manifest = PresetManifest(str(tmp_path), headers)
+    assert manifest.presetStaleGet(jsons) == (jsons, [])
+    for json_name in jsons:
+        (tmp_path / os.path.basename(json_name).replace('.json', '.bin')).write_bytes(bytes(324))
+        manifest.presetUpdate(json_name, 324)
+    umask = os.umask(0o022)
+    try:
+        manifest.save(jsons)
+    finally:
+        os.umask(umask)
+    assert os.stat(manifest.fileName).st_mode & 0o777 == 0o644
+
+    assert PresetManifest(str(tmp_path), headers).presetStaleGet(jsons) == ([], jsons)
+
+    # entries of deleted jsons are pruned
+    manifest = PresetManifest(str(tmp_path), headers)
+    manifest.save(jsons[:1])
+    assert list(PresetManifest(str(tmp_path), headers).presets) == ['A.bin']
+    manifest.presetUpdate(jsons[1], 324)
+    manifest.save(jsons)
+
+    # a changed converter rebuilds all presets
+    converter = tmp_path / 'Presets.py'
+    converter.write_text('# converter')
+    assert PresetManifest(str(tmp_path), headers, [converter]).presetStaleGet(jsons) == (jsons, [])
+
+    with open(jsons[1], 'w') as json_file:
+        json_file.write('{"param-zunits": 100}')
+    assert PresetManifest(str(tmp_path), headers).presetStaleGet(jsons) == ([jsons[1]], [jsons[0]])
+
+    headers[1].write_text('// Preset.h changed')
+    assert PresetManifest(str(tmp_path), headers).presetStaleGet(jsons) == (jsons, [])
+
+
+def test_compile_preset_in_memory(reg_index, monkeypatch):
+    import builtins
+    import json
+
+    layout = PresetLayout(PRESET_HEADER, SCP_HEADER)
+    with open(EXAMPLE_JSON) as json_file:
+        json_obj = json.load(json_file)
+    with open(EXAMPLE_BIN, 'rb') as expected:
+        expected_bin = expected.read()
+
+    def no_open(*args, **kwargs):
+        raise AssertionError('compilePreset must not open files')
+
+    monkeypatch.setattr(builtins, 'open', no_open)
+    assert compilePreset(json_obj, layout, reg_index, 'AmazonExample') == expected_bin
+
+    json_obj['controls-laserpower'] = 240
+    second = compilePreset(json_obj, layout, reg_index, 'Camera2')
+    assert second[:20] == b'Camera2'.ljust(20, b'\0')
+    assert second[20:] != expected_bin[20:]
+
+
+def test_compile_preset_matches_cli(reg_index, tmp_path):
+    import json
+    import subprocess
+    from Presets import presetCompilerGet
+
+    output_dir = tmp_path / 'out'
+    subprocess.run([sys.executable, 'main.py', '-f', '-o', str(output_dir)], cwd=JSON_TO_BIN_DIR,
+                   capture_output=True, check=True)
+
+    layout = PresetLayout(PRESET_HEADER, SCP_HEADER)
+    json_dir = os.path.join(JSON_TO_BIN_DIR, 'Input', 'Jsons')
+    json_names = sorted(name for name in os.listdir(json_dir) if name.endswith('.json'))
+    assert json_names
+    for json_name in json_names:
+        with open(os.path.join(json_dir, json_name)) as json_file:
+            json_obj = json.load(json_file)
+        preset_name = os.path.splitext(json_name)[0]
+        expected = (output_dir / (preset_name + '.bin')).read_bytes()
+        assert compilePreset(json_obj, layout, reg_index, preset_name) == expected
+    # the key map is built once per layout and register index
+    assert presetCompilerGet(layout, reg_index) is presetCompilerGet(layout, reg_index)
+
+
+def test_preset_decode_and_diff(reg_index, tmp_path):
+    import json
+
+    layout = PresetLayout(PRESET_HEADER, SCP_HEADER)
+    with open(EXAMPLE_BIN, 'rb') as example:
+        decoded = PresetDiff.presetDecode(example.read(), layout, reg_index)
+    assert decoded['name'] == 'AmazonExample'
+    assert decoded['scoreThrld.ScoreThreshB'] == 914
+    assert decoded['rauThrld.Raudiffthresholdred'] == int(0.7341154 * 1022)
+    assert decoded['colorCorrection5'] == pytest.approx(-0.405273)
+    assert decoded['laserState'] == 1
+
+    with open(EXAMPLE_JSON) as json_file:
+        json_obj = json.load(json_file)
+    file_names = []
+    for index in range(4):
+        json_obj['controls-laserpower'] = 180 + index % 2
+        json_obj['param-rauminw'] = 3 if index == 2 else 1
+        file_names.append(str(tmp_path / f'P{index}.bin'))
+        with open(file_names[-1], 'wb') as preset_file:
+            preset_file.write(compilePreset(json_obj, layout, reg_index, 'Same'))
+
+    expected = [('rauVectorMinima.Minwest', [1, 1, 3, 1]), ('laserPower', [180, 181, 180, 181])]
+    decoded = [PresetDiff.presetDecode((tmp_path / f'P{index}.bin').read_bytes(), layout, reg_index) for index in range(4)]
+    assert PresetDiff.presetsDiff(decoded, layout, reg_index) == expected
+    if PresetDiff.np is not None:
+        presets = PresetDiff.presetsLoad(file_names, layout)
+        assert PresetDiff.presetsDiff(presets, layout, reg_index) == expected
+        assert len(PresetDiff.presetsDiff(presets, layout, reg_index, True)) == len(decoded[0])
+
+
+def test_preset_decode_signed_nan(reg_index, tmp_path):
+    import json
+    import struct
+
+    layout = PresetLayout(PRESET_HEADER, SCP_HEADER)
+    with open(EXAMPLE_JSON) as json_file:
+        json_obj = json.load(json_file)
+    json_obj['aux-param-depthclampmin'] = -5
+    data = bytearray(compilePreset(json_obj, layout, reg_index, 'Signed'))
+    index = [field[0] for field in layout.fields].index('lambdaCensus')
+    offset = struct.calcsize('<' + ''.join(field[2] for field in layout.fields[:index]))
+    struct.pack_into('<f', data, offset, float('nan'))
+    file_names = [str(tmp_path / 'A.bin'), str(tmp_path / 'B.bin')]
+    for file_name in file_names:
+        with open(file_name, 'wb') as preset_file:
+            preset_file.write(data)
+
+    decoded = [PresetDiff.presetDecode(bytes(data), layout, reg_index) for _ in file_names]
+    assert decoded[0]['minZ'] == -5
+    assert decoded[0]['lambdaCensus'] != decoded[0]['lambdaCensus']
+    # identical presets with a NaN field do not differ
+    assert PresetDiff.presetsDiff(decoded, layout, reg_index) == []
+    if PresetDiff.np is not None:
+        presets = PresetDiff.presetsLoad(file_names, layout)
+        assert presets['minZ'].tolist() == [-5, -5]
+        assert PresetDiff.presetsDiff(presets, layout, reg_index) == []
+
+
+def test_benchmark_outputs_identical(tmp_path, monkeypatch):
+    monkeypatch.chdir(JSON_TO_BIN_DIR)
+    import benchmark
+
+    report = benchmark.benchmarkRun(str(tmp_path), 5, 1, 0)
+
+    assert report['identical'] and report['mismatches'] == [] and report['golden_mismatches'] == []
+    assert {'layout_parse', 'register_index', 'json_parse', 'json_lookup', 'register_lookup', 'pack_write',
+            'end_to_end'} <= set(report['stages'])
+    assert report['stages']['pack_write']['count'] == 5
+    assert report['peak_rss_kib'] > 0 and 'peak_rss_children_kib' in report
+
+    golden = tmp_path / 'Golden.bin'
+    data = bytearray(open(benchmark.GOLDEN_FILE_NAME, 'rb').read())
+    data[-1] ^= 1
+    golden.write_bytes(bytes(data))
+    layout = PresetLayout(PRESET_HEADER, SCP_HEADER)
+    assert benchmark.goldenMismatchesGet(str(tmp_path), layout, RegisterIndex(REGISTERS_HEADER), 1,
+                                         goldenFileName=str(golden)) == ['pack_write', 'compile_in_memory', 'end_to_end']
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Firmware log events and frame metadata on a common time axis: combined timeline
+and report of the events around every dropped, repeated, late or out of order frame.
+The frames are aligned to the log by the given offset, by default the first frame is aligned with the first log record.
+Events and frames are joined with binary searches on the sorted time axes, so hours-long captures are handled in
+O((events + frames) log events).
+"""
+import getopt
+import json
+import os
+import sys
+from typing import Dict, Iterator, Optional, TextIO
+
+import numpy as np
+
+import metadata_analytics
+import metadata_decoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scripts', 'fw_log_parser'))
+import firmware_log_parser as parser
+import log_timeline
+
+# duration of one metadata hwTimestamp tick (RegVdfStcCount) in seconds
+FRAME_TICK = 0.000001
+
+# events reported around one anomaly at most, all are counted
+MAX_EVENTS_PER_ANOMALY = 20
+
+ANOMALIES = ('dropped', 'repeated', 'late', 'out_of_order')
+
+
+class LogEvents:
+    """
+    Decoded firmware log records sorted by their unwrapped time
+    """
+
+    def __init__(self, records, times: np.ndarray):
+        """
+        :param records: array of parser.RECORD_DTYPE
+        :param times: record times [s]
+        """
+        order = np.argsort(times, kind='stable')
+        self.records = records[order]
+        self.times = times[order]
+
+    @classmethod
+    def read(cls, file_link: str) -> 'LogEvents':
+        """
+        Read firmware log file, record timestamps are unwrapped by log_timeline.Timeline
+        """
+        timeline = log_timeline.Timeline()
+        batches = []
+        times = []
+        with parser.open_log_file(file_link) as log_file:
+            for log_bytes in parser.read_log_records(log_file):
+                records = parser.decode_log(log_bytes, 'numpy', True)
+                if len(records):
+                    batches.append(records)
+                    times.append(timeline.update(records['timestamp'], records['sequence'])['time'])
+        if not batches:
+            return cls(np.empty(0, parser.RECORD_DTYPE), np.empty(0))
+        return cls(np.concatenate(batches), np.concatenate(times) * log_timeline.TIMESTAMP_FACTOR)
+
+    def __len__(self):
+        return len(self.times)
+
+    def describe(self, index: int, event_dictionary) -> Dict[str, object]:
+        record = self.records[index]
+        return {'time': float(self.times[index]),
+                'event_id': int(record['event_id']),
+                'file': event_dictionary.file_name(int(record['file_id'])),
+                'thread': event_dictionary.thread_name(int(record['thread_id'])),
+                'description': event_dictionary.description(int(record['event_id']), int(record['data1']),
+                                                            int(record['data2']), int(record['data3']))}
+
+
+def frame_times(cols: Dict[str, np.ndarray], tick: float = FRAME_TICK, offset: float = 0.0) -> np.ndarray:
+    """
+    Unwrapped 32-bit hardware timestamps of the frames on the log time axis
+    :param cols: metadata_decoder.columns() of valid records
+    :param tick: duration of one hwTimestamp tick [s]
+    :param offset: log time of hwTimestamp 0 [s]
+    :return: frame times [s]
+    """
+    timestamps = cols['hwTimestamp']
+    if not len(timestamps):
+        return np.empty(0)
+    steps = metadata_analytics.counter_steps(timestamps)
+    ticks = int(timestamps[0]) + np.concatenate(([0], np.cumsum(steps)))
+    return ticks * tick + offset
+
+
+def first_record_offset(events: LogEvents, cols: Dict[str, np.ndarray], tick: float = FRAME_TICK) -> float:
+    """
+    Offset aligning the first frame with the first log record, for captures started together with the log
+    :return: log time of hwTimestamp 0 [s], 0 without events or frames
+    """
+    if not len(events) or not len(cols['hwTimestamp']):
+        return 0.0
+    return float(events.times[0]) - int(cols['hwTimestamp'][0]) * tick
+
+
+def frame_anomalies(cols: Dict[str, np.ndarray], times: np.ndarray, fps: Optional[float] = None,
+                    kpi: float = 5) -> Dict[str, np.ndarray]:
+    """
+    Frames following a counter gap, repeated frames, frames with a lower counter than the previous one
+    and frames later than the KPI allows
+    :param fps: expected frame rate, taken from the FPS column when available, median interval otherwise
+    :param kpi: allowed frame interval deviation [%]
+    :return: 'index' - ascending frame indices, 'kind' - index into ANOMALIES
+    """
+    if len(times) < 2:
+        return {'index': np.empty(0, np.int64), 'kind': np.empty(0, np.int64)}
+    steps = metadata_analytics.counter_steps(cols['frameCounter'])
+    intervals = np.diff(times)
+    if fps is None and 'FPS' in cols:
+        fps = float(np.median(cols['FPS'])) or None
+    nominal = 1 / fps if fps else float(np.median(intervals[steps == 1])) if np.any(steps == 1) else 0.0
+
+    kinds = np.full(len(steps), -1)
+    kinds[(steps == 1) & (intervals > nominal * (1 + kpi / 100))] = ANOMALIES.index('late')
+    kinds[steps == 0] = ANOMALIES.index('repeated')
+    kinds[steps < 0] = ANOMALIES.index('out_of_order')
+    kinds[steps > 1] = ANOMALIES.index('dropped')
+    index = np.flatnonzero(kinds >= 0)
+    return {'index': index + 1, 'kind': kinds[index]}
+
+
+def events_around(event_times: np.ndarray, times: np.ndarray, window: float):
+    """
+    Ranges of sorted event times within window around every time
+    :return: first and past the last event index per time
+    """
+    return (np.searchsorted(event_times, times - window, 'left'),
+            np.searchsorted(event_times, times + window, 'right'))
+
+
+def anomaly_report(events: LogEvents, cols: Dict[str, np.ndarray], times: np.ndarray, anomalies, window: float,
+                   event_dictionary) -> Dict[str, object]:
+    """
+    Events within window of every anomaly and event ids most frequent around anomalies
+    :param window: [s]
+    """
+    index = anomalies['index']
+    first, last = events_around(events.times, times[index], window)
+    counts = last - first
+
+    # events ids around anomalies compared with their share of the whole log
+    near = np.zeros(len(events), bool)
+    if len(index):
+        marks = np.zeros(len(events) + 1, np.int64)
+        np.add.at(marks, first, 1)
+        np.add.at(marks, last, -1)
+        near = np.cumsum(marks[:-1]) > 0
+    ids, near_counts = np.unique(events.records['event_id'][near], return_counts=True)
+    all_ids, all_counts = np.unique(events.records['event_id'], return_counts=True)
+    totals = dict(zip(all_ids.tolist(), all_counts.tolist()))
+    frequent = sorted(zip(ids.tolist(), near_counts.tolist()), key=lambda item: -item[1])[:20]
+
+    report = {'frames': int(len(times)),
+              'events': int(len(events)),
+              'window_ms': window * 1000,
+              'anomalies': {kind: int(np.count_nonzero(anomalies['kind'] == idx))
+                            for idx, kind in enumerate(ANOMALIES)},
+              'anomalies_with_events': int(np.count_nonzero(counts)),
+              'frequent_events': [{'event_id': event_id, 'near': count, 'total': totals[event_id],
+                                   'format': event_dictionary.format_string(event_id)}
+                                  for event_id, count in frequent],
+              'details': []}
+
+    for frame, kind, start, end in zip(index.tolist(), anomalies['kind'].tolist(), first.tolist(), last.tolist()):
+        details = []
+        for event in range(start, min(end, start + MAX_EVENTS_PER_ANOMALY)):
+            described = events.describe(event, event_dictionary)
+            described['offset_ms'] = round((described.pop('time') - float(times[frame])) * 1000, 3)
+            details.append(described)
+        report['details'].append({'frameCounter': int(cols['frameCounter'][frame]), 'kind': ANOMALIES[kind],
+                                  'time': float(times[frame]), 'events': end - start, 'listed': details})
+    return report
+
+
+def merged_rows(events: LogEvents, cols: Dict[str, np.ndarray], times: np.ndarray, anomalies,
+                event_dictionary) -> Iterator[str]:
+    """
+    Combined timeline, one line per event or frame in time order
+    """
+    order = np.argsort(np.concatenate((events.times, times)), kind='stable')
+    kinds = dict(zip(anomalies['index'].tolist(), anomalies['kind'].tolist()))
+    counter = cols['frameCounter']
+    for position in order.tolist():
+        if position < len(events):
+            event = events.describe(position, event_dictionary)
+            yield f"{event['time']:14.6f}  EVENT  {event['file']}/{event['thread']}  {event['description']}"
+        else:
+            frame = position - len(events)
+            mark = f"  {ANOMALIES[kinds[frame]].upper()}" if frame in kinds else ''
+            yield f"{times[frame]:14.6f}  FRAME  {int(counter[frame])}{mark}"
+
+
+def write_timeline(file: TextIO, rows: Iterator[str]) -> None:
+    for row in rows:
+        file.write(row + '\n')
+
+
+def usage():
+    print('Usage: frame_events.py -x events.xml -f fw_log.bin -m frames.bin [options]')
+    print('  -x, --xml-events   firmware events dictionary')
+    print('  -f, --log-file     firmware log file')
+    print('  -m, --metadata     metadata dump of test_metadata')
+    print('  -l, --layout       metadata layout normal or mipi, detected by default')
+    print('  -s, --record-size  bytes per frame in the metadata dump')
+    print('  -w, --window       report events within window around anomalies [ms], default 50')
+    print('  -p, --fps          expected frame rate, default from the metadata')
+    print('  --offset           log time of metadata hwTimestamp 0 [s], by default the first frame is aligned')
+    print('                     with the first log record')
+    print('  --tick             duration of metadata hwTimestamp tick [s], default 1e-6')
+    print('  -t, --timeline     write combined timeline to file')
+    print('  -o, --output       write report to file instead of standard output')
+
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hx:f:m:l:s:w:p:t:o:',
+                                   ['help', 'xml-events=', 'log-file=', 'metadata=', 'layout=', 'record-size=',
+                                    'window=', 'fps=', 'offset=', 'tick=', 'timeline=', 'output='])
+    except getopt.GetoptError as err:
+        print(f'Error: {err}')
+        usage()
+        exit(1)
+
+    xml_link = log_link = metadata_link = timeline_link = output_link = ''
+    layout = None
+    record_size = None
+    window = 50.0
+    fps = None
+    offset = None
+    tick = FRAME_TICK
+    try:
+        for opt, arg in opts:
+            if opt in ('-h', '--help'):
+                usage()
+                exit(0)
+            elif opt in ('-x', '--xml-events'):
+                xml_link = arg
+            elif opt in ('-f', '--log-file'):
+                log_link = arg
+            elif opt in ('-m', '--metadata'):
+                metadata_link = arg
+            elif opt in ('-l', '--layout'):
+                layout = arg
+            elif opt in ('-s', '--record-size'):
+                record_size = int(arg)
+            elif opt in ('-w', '--window'):
+                window = float(arg)
+            elif opt in ('-p', '--fps'):
+                fps = float(arg)
+            elif opt == '--offset':
+                offset = float(arg)
+            elif opt == '--tick':
+                tick = float(arg)
+            elif opt in ('-t', '--timeline'):
+                timeline_link = arg
+            elif opt in ('-o', '--output'):
+                output_link = arg
+    except ValueError as err:
+        print(f'Error: {err}')
+        exit(1)
+
+    if not (xml_link and log_link and metadata_link) or (layout is not None and layout not in metadata_decoder.LAYOUTS):
+        usage()
+        exit(1)
+
+    event_dictionary = parser.read_xml_file(xml_link)
+    try:
+        events = LogEvents.read(log_link)
+        cols = metadata_decoder.decode(metadata_link, layout, record_size)
+    except (OSError, ValueError) as err:
+        print(f'Error: {err}')
+        exit(1)
+
+    valid = cols.pop('valid')
+    cols = {name: column[valid] for name, column in cols.items()}
+    alignment = 'offset'
+    if offset is None:
+        alignment = 'first_record'
+        offset = first_record_offset(events, cols, tick)
+    times = frame_times(cols, tick, offset)
+    anomalies = frame_anomalies(cols, times, fps)
+
+    if timeline_link:
+        with open(timeline_link, 'w', encoding='utf-8') as f:
+            write_timeline(f, merged_rows(events, cols, times, anomalies, event_dictionary))
+
+    report = anomaly_report(events, cols, times, anomalies, window / 1000, event_dictionary)
+    report['alignment'] = {'method': alignment, 'offset': offset}
+    text = json.dumps(report, indent=2)
+    if output_link:
+        with open(output_link, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
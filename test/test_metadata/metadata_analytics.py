@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Latency, interval and exposure statistics of decoded frame metadata as JSON report,
+reports of two driver builds can be compared for regressions.
+"""
+import getopt
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metadata_decoder
+
+COUNTER_RANGE = 1 << 32
+
+PERCENTS = (50, 90, 99)
+
+# relative change of a latency statistic reported as regression [%]
+REGRESSION_THRESHOLD = 10
+# smallest increase of a latency statistic reported as regression [us], e.g. jitter p50 with a baseline near 0
+MIN_REGRESSION = 50
+
+# statistics compared between reports, larger values are worse
+COMPARED = ('pipeLatency', 'interval_jitter', 'readoutTime')
+
+
+def distribution(values: np.ndarray) -> Optional[Dict[str, float]]:
+    """
+    :return: count, min, mean, max and nearest rank percentiles of the values, None for no values
+    """
+    if not len(values):
+        return None
+    values = np.asarray(values, np.float64)
+    result = {'count': int(len(values)), 'min': float(values.min()), 'mean': float(values.mean()),
+              'max': float(values.max())}
+    for percent, value in zip(PERCENTS, np.percentile(values, PERCENTS, method='inverted_cdf')):
+        result[f'p{percent}'] = float(value)
+    return result
+
+
+def counter_steps(counter: np.ndarray) -> np.ndarray:
+    """
+    Steps of the 32-bit frame counter between consecutive frames, wraps give small positive steps
+    """
+    steps = np.diff(np.asarray(counter, np.int64)) % COUNTER_RANGE
+    return np.where(steps >= COUNTER_RANGE // 2, steps - COUNTER_RANGE, steps)
+
+
+def frame_drops(counter: np.ndarray) -> Dict[str, object]:
+    """
+    Dropped, repeated and out of order frames from the frame counter
+    :return: counts and frame indices of the drops
+    """
+    steps = counter_steps(counter)
+    gaps = np.flatnonzero(steps > 1)
+    return {'frames': int(len(counter)),
+            'dropped': int((steps[gaps] - 1).sum()),
+            'drop_events': int(len(gaps)),
+            'duplicates': int(np.count_nonzero(steps == 0)),
+            'out_of_order': int(np.count_nonzero(steps < 0)),
+            'first_drops': (gaps[:10] + 1).tolist()}
+
+
+def rolling(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean and maximum of every window of consecutive frames
+    :return: means, maxima, one per window start
+    """
+    values = np.asarray(values, np.float64)
+    if len(values) < window:
+        return np.empty(0), np.empty(0)
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    means = (sums[window:] - sums[:-window]) / window
+    maxima = np.lib.stride_tricks.sliding_window_view(values, window).max(axis=1)
+    return means, maxima
+
+
+def worst_window(values: np.ndarray, window: int, counter: np.ndarray) -> Optional[Dict[str, float]]:
+    means, maxima = rolling(values, window)
+    if not len(means):
+        return None
+    start = int(np.argmax(means))
+    return {'mean': float(means[start]), 'max': float(maxima[start]), 'frame': int(counter[start]),
+            'best_mean': float(means.min())}
+
+
+def analyze(cols: Dict[str, np.ndarray], window: int = 30, fps: Optional[float] = None) -> Dict[str, object]:
+    """
+    Statistics of one capture, times in microseconds.
+    opticalTimestamp (middle of the exposure) is in milliseconds on the firmware clock, not on the hwTimestamp
+    clock, so no latency is derived from it, only the interval between the exposures of consecutive frames
+    :param cols: metadata_decoder.columns(), records with wrong block ids are skipped
+    :param window: frames per rolling window
+    :param fps: configured frame rate, taken from the FPS column when available
+    """
+    valid = cols['valid']
+    cols = {name: column[valid] for name, column in cols.items() if name != 'valid'}
+    counter = cols['frameCounter']
+    report = {'frames': int(len(counter)), 'invalid': int(len(valid) - len(counter)), 'window': window}
+    report['drops'] = frame_drops(counter)
+
+    if fps is None and 'FPS' in cols and len(cols['FPS']):
+        fps = float(np.median(cols['FPS'])) or None
+    report['fps'] = fps
+
+    # frame interval reported by the firmware, from the hardware timestamps for layouts without it
+    if 'frameInterval' in cols:
+        interval = cols['frameInterval'].astype(np.float64)
+    else:
+        interval = (np.diff(cols['hwTimestamp'].astype(np.int64)) % COUNTER_RANGE).astype(np.float64)
+        interval = interval[counter_steps(counter) == 1]
+    nominal = 1e6 / fps if fps else (float(np.median(interval)) if len(interval) else None)
+    report['frameInterval'] = distribution(interval)
+    report['interval_jitter'] = distribution(np.abs(interval - nominal)) if nominal else None
+
+    exposure = cols['exposureTime'].astype(np.float64)
+    report['exposureTime'] = distribution(exposure)
+    if 'frameInterval' in cols and len(exposure):
+        # time left in the frame after exposure and readout
+        headroom = interval - exposure - cols.get('readoutTime', np.zeros(len(exposure)))
+        report['headroom'] = distribution(headroom)
+        report['headroom']['negative'] = int(np.count_nonzero(headroom < 0))
+        report['exposure_ratio'] = distribution(exposure / np.maximum(interval, 1))
+
+    for name in ('pipeLatency', 'readoutTime'):
+        if name in cols:
+            report[name] = distribution(cols[name])
+    if 'opticalTimestamp' in cols and len(counter) > 1:
+        optical = np.diff(cols['opticalTimestamp'].astype(np.int64)) % COUNTER_RANGE
+        report['opticalInterval'] = distribution(optical[counter_steps(counter) == 1] * 1000.0)
+
+    report['rolling'] = {name: worst_window(cols[name], window, counter)
+                         for name in ('pipeLatency', 'exposureTime') if name in cols}
+    if len(counter) > 1:
+        drops = np.concatenate(([0], np.maximum(counter_steps(counter) - 1, 0)))
+        means, _ = rolling(drops, window)
+        report['rolling']['dropped'] = ({'max': int(round(means.max() * window)),
+                                         'frame': int(counter[int(np.argmax(means))])} if len(means) else None)
+
+    return report
+
+
+def compare(baseline: Dict[str, object], report: Dict[str, object],
+            threshold: float = REGRESSION_THRESHOLD, min_increase: float = MIN_REGRESSION) -> List[Dict[str, object]]:
+    """
+    Latency statistics and drop counts worse in report than in baseline
+    :param threshold: allowed relative increase [%]
+    :param min_increase: allowed absolute increase of latency statistics [us]
+    :return: [{'name', 'baseline', 'value', 'change'}], change in %, None for zero baseline
+    :raise ValueError: baseline is not a report of analyze()
+    """
+    if not isinstance(baseline.get('frames'), int) or not isinstance(baseline.get('drops'), dict) \
+            or not all(key in baseline['drops'] for key in ('dropped', 'duplicates')):
+        raise ValueError('baseline is not a metadata_analytics report: frames or drops missing')
+    regressions = []
+
+    def check(name, old, new, floor=0.0):
+        if old is None or new is None or new - old <= floor:
+            return
+        change = (new - old) / old * 100 if old else None
+        if change is None or change > threshold:
+            regressions.append({'name': name, 'baseline': old, 'value': new, 'change': change})
+
+    for name in COMPARED:
+        old, new = baseline.get(name), report.get(name)
+        if old and new:
+            for key in ('p50', 'p90', 'p99', 'max'):
+                check(f'{name}.{key}', old[key], new[key], min_increase)
+    # drop rates per frame, captures of different length are comparable
+    for key in ('dropped', 'duplicates'):
+        check(f'drops.{key}', baseline['drops'][key] / max(baseline['frames'], 1),
+              report['drops'][key] / max(report['frames'], 1))
+    return regressions
+
+
+def usage():
+    print('Usage: metadata_analytics.py [-m normal|mipi] [-s record_size] [-w window] [-f fps] [-o report.json] '
+          '[-b baseline.json] frames.bin')
+    print('  -m, --layout       metadata layout, detected from the first record by default')
+    print('  -s, --record-size  bytes per frame in the dump')
+    print('  -w, --window       frames per rolling window, default 30')
+    print('  -f, --fps          configured frame rate, default from the metadata')
+    print('  -o, --output       write the report to file instead of standard output')
+    print('  -b, --baseline     compare with report of another build, exit code 2 on regression')
+    print('  -t, --threshold    allowed increase of latency statistics [%], default 10')
+    print('  -a, --min-increase allowed increase of latency statistics [us], default 50')
+
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hm:s:w:f:o:b:t:a:',
+                                   ['help', 'layout=', 'record-size=', 'window=', 'fps=', 'output=', 'baseline=',
+                                    'threshold=', 'min-increase='])
+    except getopt.GetoptError as err:
+        print(f'Error: {err}')
+        usage()
+        exit(1)
+
+    layout = None
+    record_size = None
+    window = 30
+    fps = None
+    output = None
+    baseline = None
+    threshold = REGRESSION_THRESHOLD
+    min_increase = MIN_REGRESSION
+    try:
+        for opt, arg in opts:
+            if opt in ('-h', '--help'):
+                usage()
+                exit(0)
+            elif opt in ('-m', '--layout'):
+                layout = arg
+            elif opt in ('-s', '--record-size'):
+                record_size = int(arg)
+            elif opt in ('-w', '--window'):
+                window = int(arg)
+            elif opt in ('-f', '--fps'):
+                fps = float(arg)
+            elif opt in ('-o', '--output'):
+                output = arg
+            elif opt in ('-b', '--baseline'):
+                baseline = arg
+            elif opt in ('-t', '--threshold'):
+                threshold = float(arg)
+            elif opt in ('-a', '--min-increase'):
+                min_increase = float(arg)
+    except ValueError as err:
+        print(f'Error: {err}')
+        exit(1)
+
+    if len(args) != 1 or window < 1 or (layout is not None and layout not in metadata_decoder.LAYOUTS):
+        usage()
+        exit(1)
+
+    try:
+        report = analyze(metadata_decoder.decode(args[0], layout, record_size), window, fps)
+        if baseline:
+            with open(baseline) as f:
+                report['regressions'] = compare(json.load(f), report, threshold, min_increase)
+    except (OSError, ValueError, KeyError, TypeError) as err:
+        print(f'Error: {err}')
+        exit(1)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    exit(2 if report.get('regressions') else 0)
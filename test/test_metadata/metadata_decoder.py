@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Decoder of recorded D457 frame metadata: NumPy structured dtypes matching metadata.h.
+A dump is a file of fixed-size metadata records, one per frame, as written by test_metadata to frames.bin.
+The dump is memory-mapped and viewed through one structured dtype, so columns are decoded in one pass without copies.
+"""
+import getopt
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+META_DATA_INTEL_DEPTH_CONTROL_ID = 0x80000000
+META_DATA_INTEL_CAPTURE_TIMING_ID = 0x80000001
+META_DATA_INTEL_CONFIGURATION_ID = 0x80000002
+META_DATA_INTEL_STAT_ID = 0x80000003
+META_DATA_CAPTURE_STATS_ID = 0x00000003
+
+# all structures of metadata.h are packed little-endian
+ID_HEADER = np.dtype([('metaDataID', '<u4'), ('size', '<u4')])
+
+INTEL_CAPTURE_TIMING = np.dtype([
+    ('metaDataIdHeader', ID_HEADER),
+    ('version', '<u4'),
+    ('flag', '<u4'),
+    ('frameCounter', '<u4'),
+    ('opticalTimestamp', '<u4'),    # [ms]
+    ('readoutTime', '<u4'),         # [us]
+    ('exposureTime', '<u4'),        # [us]
+    ('frameInterval', '<u4'),       # [us]
+    ('pipeLatency', '<u4'),         # start of frame to frame ready [us]
+])
+
+CAPTURE_STATS = np.dtype([
+    ('metaDataIdHeader', ID_HEADER),
+    ('Flags', '<u4'),
+    ('hwTimestamp', '<u4'),
+    ('ExposureTime', '<u8'),
+    ('ExposureCompensationFlags', '<u8'),
+    ('ExposureCompensationValue', '<i4'),
+    ('IsoSpeed', '<u4'),
+    ('FocusState', '<u4'),
+    ('LensPosition', '<u4'),
+    ('WhiteBalance', '<u4'),
+    ('Flash', '<u4'),
+    ('FlashPower', '<u4'),
+    ('ZoomFactor', '<u4'),
+    ('SceneMode', '<u8'),
+    ('SensorFramerate', '<u8'),
+])
+
+INTEL_DEPTH_CONTROL = np.dtype([
+    ('metaDataIdHeader', ID_HEADER),
+    ('version', '<u4'),
+    ('flag', '<u4'),
+    ('manualGain', '<u4'),
+    ('manualExposure', '<u4'),
+    ('laserPower', '<u4'),
+    ('autoExposureMode', '<u4'),
+    ('exposurePriority', '<u4'),
+    ('exposureROILeft', '<u4'),
+    ('exposureROIRight', '<u4'),
+    ('exposureROITop', '<u4'),
+    ('exposureROIBottom', '<u4'),
+    ('preset', '<u4'),
+    ('projectorMode', 'u1'),
+    ('reserved', 'u1'),
+    ('ledPower', '<u2'),
+])
+
+# STTriggerMode: bit 0 inSync, bit 1 extTrigger
+INTEL_CONFIGURATION = np.dtype([
+    ('metaDataIdHeader', ID_HEADER),
+    ('version', '<u4'),
+    ('flag', '<u4'),
+    ('HWType', 'u1'),
+    ('SKUsID', 'u1'),
+    ('cookie', '<u4'),
+    ('format', '<u2'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('FPS', '<u2'),
+    ('trigger', '<u2'),
+    ('calibrationCount', '<u2'),
+    ('Reserved', 'u1', (6,)),
+])
+
+# metadata block dtypes by id, META_DATA_INTEL_STAT_ID has no structure in metadata.h
+BLOCKS = {
+    META_DATA_INTEL_CAPTURE_TIMING_ID: ('intelCaptureTiming', INTEL_CAPTURE_TIMING),
+    META_DATA_CAPTURE_STATS_ID: ('captureStats', CAPTURE_STATS),
+    META_DATA_INTEL_DEPTH_CONTROL_ID: ('intelDepthControl', INTEL_DEPTH_CONTROL),
+    META_DATA_INTEL_CONFIGURATION_ID: ('intelConfiguration', INTEL_CONFIGURATION),
+}
+
+# STMetaDataDepthYNormalMode
+DEPTH_Y_NORMAL_MODE = np.dtype([
+    ('intelCaptureTiming', INTEL_CAPTURE_TIMING),
+    ('captureStats', CAPTURE_STATS),
+    ('intelDepthControl', INTEL_DEPTH_CONTROL),
+    ('intelConfiguration', INTEL_CONFIGURATION),
+    ('crc32', '<u4'),
+])
+
+# STMetaDataExtMipiDepthIR, metadata of the MIPI depth and IR streams
+# STSubPresetInfo: bits 0-3 id, 4-11 numOfItems, 12-19 itemIndex, 20-25 iteration, 26-31 itemIteration
+EXT_MIPI_DEPTH_IR = np.dtype([
+    ('res', '<u4', (3,)),
+    ('Frame_counter', '<u4'),
+    ('metaDataID', '<u4'),
+    ('size', '<u4'),
+    ('version', 'u1'),
+    ('calibInfo', '<u2'),
+    ('reserved', 'u1', (1,)),
+    ('flags', '<u4'),
+    ('hwTimestamp', '<u4'),
+    ('opticalTimestamp', '<u4'),
+    ('exposureTime', '<u4'),
+    ('manualExposure', '<u4'),
+    ('laserPower', '<u2'),
+    ('trigger', '<u2'),
+    ('projectorMode', 'u1'),
+    ('preset', 'u1'),
+    ('manualGain', 'u1'),
+    ('autoExposureMode', 'u1'),
+    ('inputWidth', '<u2'),
+    ('inputHeight', '<u2'),
+    ('subpresetInfo', '<u4'),
+    ('crc32', '<u4'),
+])
+
+LAYOUTS = {'normal': DEPTH_Y_NORMAL_MODE, 'mipi': EXT_MIPI_DEPTH_IR}
+
+# per-frame columns of the layouts: column name -> path of the field in the record
+COLUMNS = {
+    'normal': {
+        'frameCounter': ('intelCaptureTiming', 'frameCounter'),
+        'opticalTimestamp': ('intelCaptureTiming', 'opticalTimestamp'),
+        'readoutTime': ('intelCaptureTiming', 'readoutTime'),
+        'exposureTime': ('intelCaptureTiming', 'exposureTime'),
+        'frameInterval': ('intelCaptureTiming', 'frameInterval'),
+        'pipeLatency': ('intelCaptureTiming', 'pipeLatency'),
+        'hwTimestamp': ('captureStats', 'hwTimestamp'),
+        'manualGain': ('intelDepthControl', 'manualGain'),
+        'manualExposure': ('intelDepthControl', 'manualExposure'),
+        'laserPower': ('intelDepthControl', 'laserPower'),
+        'autoExposureMode': ('intelDepthControl', 'autoExposureMode'),
+        'preset': ('intelDepthControl', 'preset'),
+        'width': ('intelConfiguration', 'width'),
+        'height': ('intelConfiguration', 'height'),
+        'FPS': ('intelConfiguration', 'FPS'),
+        'crc32': ('crc32',),
+    },
+    'mipi': {
+        'frameCounter': ('Frame_counter',),
+        'opticalTimestamp': ('opticalTimestamp',),
+        'exposureTime': ('exposureTime',),
+        'hwTimestamp': ('hwTimestamp',),
+        'manualGain': ('manualGain',),
+        'manualExposure': ('manualExposure',),
+        'laserPower': ('laserPower',),
+        'autoExposureMode': ('autoExposureMode',),
+        'preset': ('preset',),
+        'width': ('inputWidth',),
+        'height': ('inputHeight',),
+        'crc32': ('crc32',),
+    },
+}
+
+
+def block_ids(data: bytes, offset: int = 0) -> List[int]:
+    """
+    Ids of the metadata blocks at the start of one record, found by walking the block headers
+    :param data: record bytes
+    :param offset: start of the record
+    :return: ids of known blocks in the order of the record
+    """
+    ids = []
+    header = ID_HEADER.itemsize
+    while offset + header <= len(data):
+        block_id, size = np.frombuffer(data, ID_HEADER, 1, offset)[0]
+        if int(block_id) not in BLOCKS or size < header:
+            break
+        ids.append(int(block_id))
+        offset += int(size)
+    return ids
+
+
+def detect_layout(data: bytes) -> str:
+    """
+    :param data: bytes of the dump, at least the first record
+    :return: 'normal' when the record starts with the Intel capture timing block, 'mipi' otherwise
+    """
+    ids = block_ids(data)
+    if ids and ids[0] == META_DATA_INTEL_CAPTURE_TIMING_ID:
+        return 'normal'
+    return 'mipi'
+
+
+def record_dtype(layout: str, record_size: Optional[int] = None) -> np.dtype:
+    """
+    :param layout: 'normal' or 'mipi'
+    :param record_size: bytes per frame in the dump when the records are padded, e.g. whole metadata buffers
+    :return: structured dtype of one record
+    """
+    dtype = LAYOUTS[layout]
+    if record_size is None or record_size == dtype.itemsize:
+        return dtype
+    if record_size < dtype.itemsize:
+        raise ValueError(f"record size {record_size} is smaller than the {layout} metadata {dtype.itemsize}")
+    return np.dtype({'names': dtype.names, 'formats': [dtype.fields[name][0] for name in dtype.names],
+                     'offsets': [dtype.fields[name][1] for name in dtype.names], 'itemsize': record_size})
+
+
+def load(file_name: str, layout: Optional[str] = None, record_size: Optional[int] = None) -> np.ndarray:
+    """
+    Memory-map a metadata dump as structured array, one row per frame, a trailing partial record is ignored
+    :param layout: 'normal', 'mipi' or None to detect it from the first record
+    :param record_size: bytes per frame, default is the size of the layout
+    """
+    if not os.path.getsize(file_name):
+        return np.empty(0, record_dtype(layout or 'mipi', record_size))
+    data = np.memmap(file_name, np.uint8, 'r')
+    if layout is None:
+        layout = detect_layout(data[:LAYOUTS['normal'].itemsize].tobytes())
+    dtype = record_dtype(layout, record_size)
+    return np.ndarray((len(data) // dtype.itemsize,), dtype, data, 0)
+
+
+def layout_of(records: np.ndarray) -> str:
+    return 'normal' if 'intelCaptureTiming' in records.dtype.names else 'mipi'
+
+
+def valid(records: np.ndarray) -> np.ndarray:
+    """
+    :return: True for records whose block ids match the layout
+    """
+    if layout_of(records) == 'mipi':
+        return records['size'] != 0
+    result = np.ones(len(records), bool)
+    for block_id, (name, _) in BLOCKS.items():
+        result &= records[name]['metaDataIdHeader']['metaDataID'] == block_id
+    return result
+
+
+def columns(records: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-frame columns of the records, strided views into the records without copies
+    :return: column name -> array, 'valid' marks the records with correct block ids
+    """
+    result = {}
+    for name, path in COLUMNS[layout_of(records)].items():
+        column = records
+        for field in path:
+            column = column[field]
+        result[name] = column
+    result['valid'] = valid(records)
+    return result
+
+
+def decode(file_name: str, layout: Optional[str] = None, record_size: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Decode a metadata dump into per-frame columns
+    """
+    return columns(load(file_name, layout, record_size))
+
+
+def write_csv(file, cols: Dict[str, np.ndarray]):
+    """
+    Write the columns as CSV, one line per frame
+    """
+    names = list(cols)
+    file.write(','.join(names) + '\n')
+    table = np.column_stack([cols[name].astype(np.int64) for name in names]) if len(cols[names[0]]) else []
+    np.savetxt(file, table, fmt='%d', delimiter=',')
+
+
+def usage():
+    print('Usage: metadata_decoder.py [-m normal|mipi] [-s record_size] [-o frames.csv] frames.bin')
+    print('  -m, --layout       metadata layout, detected from the first record by default')
+    print('  -s, --record-size  bytes per frame in the dump')
+    print('  -o, --output       write per-frame columns as CSV')
+
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hm:s:o:', ['help', 'layout=', 'record-size=', 'output='])
+    except getopt.GetoptError as err:
+        print(f'Error: {err}')
+        usage()
+        exit(1)
+
+    layout = None
+    record_size = None
+    output = None
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage()
+            exit(0)
+        elif opt in ('-m', '--layout'):
+            if arg not in LAYOUTS:
+                print(f'Error: unknown layout {arg}')
+                exit(1)
+            layout = arg
+        elif opt in ('-s', '--record-size'):
+            record_size = int(arg)
+        elif opt in ('-o', '--output'):
+            output = arg
+
+    if len(args) != 1:
+        usage()
+        exit(1)
+
+    try:
+        cols = decode(args[0], layout, record_size)
+    except (OSError, ValueError) as err:
+        print(f'Error: {err}')
+        exit(1)
+
+    frames = len(cols['frameCounter'])
+    print(f'{frames} frames, {frames - int(np.count_nonzero(cols["valid"]))} invalid')
+    if output:
+        with open(output, 'w') as f:
+            write_csv(f, cols)
@@ -127,12 +127,14 @@ static int streamFrames(int videoNode_fd, int md_fd, void* metaDataBuffers[SIZE_
             return -1;
         }
 
-        FILE *f;
+        FILE *f, *md;
         if (first_write) {
             f = fopen("frames.txt", "w"); // Truncate on first write
+            md = fopen("frames.bin", "wb");
             first_write = 0;
         } else {
             f = fopen("frames.txt", "a"); // Append for subsequent writes
+            md = fopen("frames.bin", "ab");
         }
 
         if (FirstFrameArr)
@@ -155,6 +157,13 @@ static int streamFrames(int videoNode_fd, int md_fd, void* metaDataBuffers[SIZE_
         } else {
             fprintf(stderr, "Error opening frames.txt for writing\n");
         }
+        // raw metadata records for metadata_decoder.py
+        if (md) {
+            fwrite(ptr, sizeof(STMetaDataExtMipiDepthIR), 1, md);
+            fclose(md);
+        } else {
+            fprintf(stderr, "Error opening frames.bin for writing\n");
+        }
 
         Number_of_frames_collected++;
 
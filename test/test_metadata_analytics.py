@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from test_metadata_decoder import METADATA_DIR, md, normal_records
+import metadata_analytics as analytics
+
+
+def capture(count=300):
+    records = normal_records(count)
+    timing = records['intelCaptureTiming']
+    timing['frameInterval'] = 33333 + np.arange(count) % 3 * 100    # jitter 0..200 us
+    timing['readoutTime'] = 10000
+    timing['pipeLatency'][200:230] = 5000                            # latency burst
+    timing['exposureTime'][50] = 30000                               # no headroom
+    timing['opticalTimestamp'] = 5000 + np.arange(count) * 100 // 3   # 33 or 34 ms between exposures
+    return records
+
+
+def test_frame_drops():
+    counter = np.array([0xFFFFFFFE, 0xFFFFFFFF, 0, 1, 4, 4, 5, 3], np.uint32)
+    drops = analytics.frame_drops(counter)
+
+    # counter wrap is no drop
+    assert drops['dropped'] == 2
+    assert drops['drop_events'] == 1
+    assert drops['first_drops'] == [4]
+    assert drops['duplicates'] == 1
+    assert drops['out_of_order'] == 1
+
+
+def test_rolling():
+    means, maxima = analytics.rolling(np.array([1, 2, 3, 10, 1]), 3)
+    assert means.tolist() == pytest.approx([2, 5, 14 / 3])
+    assert maxima.tolist() == [3, 10, 10]
+    assert len(analytics.rolling(np.arange(2), 3)[0]) == 0
+
+
+def test_analyze():
+    records = capture()
+    keep = np.ones(len(records), bool)
+    keep[100:103] = False
+    report = analytics.analyze(md.columns(records[keep]), window=30)
+    json.dumps(report, allow_nan=False)
+
+    assert report['frames'] == 297
+    assert report['fps'] == 30
+    assert report['drops']['dropped'] == 3
+    assert report['frameInterval']['p50'] == 33433
+    assert report['interval_jitter']['max'] == pytest.approx(33533 - 1e6 / 30)
+    assert 1000 <= report['pipeLatency']['p50'] <= 1006
+    assert report['pipeLatency']['max'] == 5000
+    assert report['headroom']['negative'] == 1
+    assert report['headroom']['min'] == pytest.approx(33333 + 200 - 30000 - 10000)
+    assert report['rolling']['pipeLatency']['mean'] == 5000
+    assert report['rolling']['pipeLatency']['frame'] == 300
+    assert report['rolling']['dropped']['max'] == 3
+    # consecutive frames only, in us
+    assert report['opticalInterval']['count'] == 295
+    assert (report['opticalInterval']['min'], report['opticalInterval']['max']) == (33000, 34000)
+
+
+def test_analyze_mipi():
+    records = np.zeros(100, md.EXT_MIPI_DEPTH_IR)
+    records['size'] = md.EXT_MIPI_DEPTH_IR.itemsize
+    records['Frame_counter'] = np.arange(100)
+    records['hwTimestamp'] = np.arange(100) * 33333
+    records['exposureTime'] = 8000
+    report = analytics.analyze(md.columns(records), fps=30)
+
+    assert report['frameInterval']['count'] == 99
+    assert report['interval_jitter']['max'] == pytest.approx(1e6 / 30 - 33333)
+    assert 'headroom' not in report and 'pipeLatency' not in report
+
+
+def test_compare(tmp_path):
+    baseline = analytics.analyze(md.columns(normal_records(300)))
+    assert analytics.compare(baseline, baseline) == []
+
+    report = analytics.analyze(md.columns(capture()))
+    names = [regression['name'] for regression in analytics.compare(baseline, report)]
+    assert 'pipeLatency.max' in names and 'pipeLatency.p50' not in names
+
+    # increases below the absolute floor are no regressions, e.g. jitter p50 with a baseline near 0
+    jitter = {'p50': 0.5, 'p90': 2.0, 'p99': 10.0, 'max': 20.0}
+    slower = dict(baseline, interval_jitter=jitter)
+    worse = dict(baseline, interval_jitter={'p50': 3.0, 'p90': 4.0, 'p99': 30.0, 'max': 120.0})
+    assert [regression['name'] for regression in analytics.compare(slower, worse)] == ['interval_jitter.max']
+    assert analytics.compare(slower, worse, min_increase=0) != []
+    with pytest.raises(ValueError):
+        analytics.compare({'pipeLatency': baseline['pipeLatency']}, report)
+
+    # command line: exit code 2 on regression
+    dump = tmp_path / 'frames.bin'
+    capture().tofile(dump)
+    baseline_file = tmp_path / 'baseline.json'
+    baseline_file.write_text(json.dumps(baseline))
+    script = os.path.join(METADATA_DIR, 'metadata_analytics.py')
+    result = subprocess.run([sys.executable, script, '-b', str(baseline_file), str(dump)],
+                            capture_output=True, text=True)
+    assert result.returncode == 2
+    assert json.loads(result.stdout)['regressions']
+
+    baseline_file.write_text(json.dumps({'frames': 300}))
+    result = subprocess.run([sys.executable, script, '-b', str(baseline_file), str(dump)],
+                            capture_output=True, text=True)
+    assert result.returncode == 1 and result.stdout.startswith('Error: baseline is not')
@@ -0,0 +1,119 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+METADATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_metadata')
+sys.path.insert(0, METADATA_DIR)
+import metadata_decoder as md
+
+
+def normal_records(count):
+    records = np.zeros(count, md.DEPTH_Y_NORMAL_MODE)
+    for block_id, (name, dtype) in md.BLOCKS.items():
+        records[name]['metaDataIdHeader']['metaDataID'] = block_id
+        records[name]['metaDataIdHeader']['size'] = dtype.itemsize
+    timing = records['intelCaptureTiming']
+    timing['frameCounter'] = np.arange(count) + 100
+    timing['exposureTime'] = 8000
+    timing['frameInterval'] = 33333
+    timing['pipeLatency'] = np.arange(count) % 7 + 1000
+    records['intelConfiguration']['FPS'] = 30
+    records['crc32'] = 0xDEADBEEF
+    return records
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None, reason="gcc not found")
+@pytest.mark.parametrize("struct, dtype", [
+    ('STMetaDataIntelCaptureTiming', md.INTEL_CAPTURE_TIMING),
+    ('STMetaDataCaptureStats', md.CAPTURE_STATS),
+    ('STMetaDataIntelDepthControl', md.INTEL_DEPTH_CONTROL),
+    ('STMetaDataIntelConfiguration', md.INTEL_CONFIGURATION),
+    ('STMetaDataDepthYNormalMode', md.DEPTH_Y_NORMAL_MODE),
+    ('STMetaDataExtMipiDepthIR', md.EXT_MIPI_DEPTH_IR),
+])
+def test_dtype_matches_header(tmp_path, struct, dtype):
+    # sizes and offsets of the dtypes as compiled from metadata.h
+    source = tmp_path / 'layout.c'
+    source.write_text('#include <stdio.h>\n#include <stddef.h>\n#include <stdint.h>\n#include "metadata.h"\n'
+                      'int main(void) {\n'
+                      f'    printf("%zu\\n", sizeof({struct}));\n'
+                      + ''.join(f'    printf("%zu\\n", offsetof({struct}, {name}));\n' for name in dtype.names)
+                      + '    return 0;\n}\n')
+    binary = tmp_path / 'layout'
+    subprocess.check_call(['gcc', f'-I{METADATA_DIR}', str(source), '-o', str(binary)])
+    sizes = [int(line) for line in subprocess.check_output([str(binary)], text=True).split()]
+
+    assert sizes == [dtype.itemsize] + [dtype.fields[name][1] for name in dtype.names]
+
+
+def test_decode_normal(tmp_path):
+    dump = tmp_path / 'frames.bin'
+    records = normal_records(1000)
+    records[10]['intelConfiguration']['metaDataIdHeader']['metaDataID'] = 0
+    records.tofile(dump)
+    with open(dump, 'ab') as f:
+        f.write(b'\0' * 10)    # partial record of an interrupted recording
+
+    assert md.block_ids(records[:1].tobytes()) == list(md.BLOCKS)
+    cols = md.decode(str(dump))
+
+    assert len(cols['frameCounter']) == 1000
+    assert cols['frameCounter'][0] == 100 and cols['frameCounter'][-1] == 1099
+    assert (cols['exposureTime'] == 8000).all()
+    assert (cols['frameInterval'] == 33333).all()
+    assert (cols['pipeLatency'] == records['intelCaptureTiming']['pipeLatency']).all()
+    assert (cols['FPS'] == 30).all()
+    assert (cols['crc32'] == 0xDEADBEEF).all()
+    assert np.flatnonzero(~cols['valid']).tolist() == [10]
+
+
+def test_decode_padded_records(tmp_path):
+    # whole 256 byte metadata buffers recorded per frame
+    dump = tmp_path / 'frames.bin'
+    padded = np.zeros((20, 256), np.uint8)
+    padded[:, :md.DEPTH_Y_NORMAL_MODE.itemsize] = normal_records(20).view(np.uint8).reshape(20, -1)
+    padded.tofile(dump)
+
+    cols = md.decode(str(dump), record_size=256)
+    assert cols['frameCounter'].tolist() == list(range(100, 120))
+    assert cols['valid'].all()
+
+    with pytest.raises(ValueError):
+        md.decode(str(dump), 'normal', record_size=100)
+
+
+def test_decode_mipi(tmp_path):
+    dump = tmp_path / 'frames.bin'
+    records = np.zeros(5, md.EXT_MIPI_DEPTH_IR)
+    records['Frame_counter'] = [1, 2, 4, 5, 6]
+    records['size'] = md.EXT_MIPI_DEPTH_IR.itemsize
+    records['exposureTime'] = 1500
+    records['inputWidth'] = 848
+    records['crc32'] = 7
+    records.tofile(dump)
+
+    cols = md.decode(str(dump))
+    assert md.layout_of(md.load(str(dump))) == 'mipi'
+    assert cols['frameCounter'].tolist() == [1, 2, 4, 5, 6]
+    assert (cols['exposureTime'] == 1500).all()
+    assert (cols['width'] == 848).all()
+    assert cols['valid'].all()
+
+    out = io.StringIO()
+    md.write_csv(out, cols)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('frameCounter,opticalTimestamp,exposureTime')
+    assert lines[1].startswith('1,0,1500,')
+    assert len(lines) == 6
+
+
+def test_decode_empty(tmp_path):
+    dump = tmp_path / 'frames.bin'
+    dump.write_bytes(b'')
+    assert len(md.decode(str(dump))['frameCounter']) == 0
@@ -0,0 +1,105 @@
+import pytest
+
+import run_ci
+
+TESTS = [('test_fps.py::test_fps[0-150]', frozenset({'0'})),
+         ('test_fps.py::test_fps[2-150]', frozenset({'2'})),
+         ('test_fps.py::test_fps_concurrent[devices0-150]', frozenset({'0', '2'})),
+         ('test_fw_version.py::test_fw_version[0]', frozenset({'0'})),
+         ('test_json_to_bin.py::test_roundtrip', frozenset()),
+         ('test_json_to_bin.py::test_options', frozenset())]
+
+JUNIT = '''<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" errors="0" failures="1" skipped="1" tests="4" time="62.1">
+<testcase classname="test_fps" name="test_fps[0-150]" time="55.0" />
+<testcase classname="test_fps" name="test_fps[2-150]" time="5.0"><failure message="Missing frames" /></testcase>
+<testcase classname="test_fw_version" name="test_fw_version[0]" time="2.1" />
+<testcase classname="test_fw_version" name="test_dfu[0]" time="0.0"><skipped message="no dfu" /></testcase>
+</testsuite></testsuites>
+'''
+
+
+def test_command():
+    cmd = run_ci.command('d457', tests=['test_fps.py::test_fps[0-150]'], shard='video0')
+    assert cmd[:4] == ['pytest', '-vs', '-m', 'd457']
+    assert cmd[4].endswith('/test/test_fps.py::test_fps[0-150]')
+    assert cmd[-1] == f'--junit-xml={run_ci.logdir}/D457_video0_pytest.xml'
+    assert run_ci.command('d457', 'fw')[-1] == f'--junit-xml={run_ci.logdir}/D457_pytest.xml'
+
+
+def test_junit_name():
+    assert run_ci.junit_name('test_fps.py::test_fps[0-150]') == 'test_fps::test_fps[0-150]'
+    assert run_ci.junit_name('sub/test_a.py::TestA::test_b') == 'sub.test_a.TestA::test_b'
+
+
+def test_shard():
+    history = {'test_fw_version::test_fw_version[0]': [30.0, 40.0, 35.0],
+               'test_fps::test_fps[0-150]': [20.0],
+               'test_json_to_bin::test_roundtrip': [1.0],
+               'test_json_to_bin::test_options': [2.0]}
+    shards, shared = run_ci.shard(TESTS, history)
+    # slowest first, tests without a video node on the least loaded worker
+    assert shards == {'video0': ['test_fw_version.py::test_fw_version[0]', 'test_fps.py::test_fps[0-150]'],
+                      'video2': ['test_fps.py::test_fps[2-150]', 'test_json_to_bin.py::test_options',
+                                 'test_json_to_bin.py::test_roundtrip']}
+    assert shared == ['test_fps.py::test_fps_concurrent[devices0-150]']
+
+    shards, shared = run_ci.shard(TESTS[4:], history, jobs=2)
+    assert shards == {'worker0': ['test_json_to_bin.py::test_options'],
+                      'worker1': ['test_json_to_bin.py::test_roundtrip']}
+    assert run_ci.shard([], history) == ({}, [])
+
+    # jobs caps the workers, the tests of one video node stay on one worker
+    shards, shared = run_ci.shard(TESTS, history, jobs=1)
+    assert shards == {'worker0': ['test_fw_version.py::test_fw_version[0]', 'test_fps.py::test_fps[0-150]',
+                                  'test_fps.py::test_fps[2-150]', 'test_json_to_bin.py::test_options',
+                                  'test_json_to_bin.py::test_roundtrip']}
+    assert shared == ['test_fps.py::test_fps_concurrent[devices0-150]']
+    shards, _ = run_ci.shard(TESTS + [('test_fps.py::test_fps[4-150]', frozenset({'4'}))], history, jobs=2)
+    assert shards == {'worker0': ['test_fw_version.py::test_fw_version[0]', 'test_fps.py::test_fps[0-150]'],
+                      'worker1': ['test_fps.py::test_fps[2-150]', 'test_fps.py::test_fps[4-150]',
+                                  'test_json_to_bin.py::test_options', 'test_json_to_bin.py::test_roundtrip']}
+    shards, _ = run_ci.shard(TESTS, history, jobs=3)
+    assert sorted(shards) == ['video0', 'video2', 'worker0']
+
+
+def test_collect_quiet(monkeypatch, capsys):
+    def main(args, plugins):
+        print('test_fps.py: 3')
+        return exit_code
+
+    monkeypatch.setattr(run_ci.pytest, 'main', main)
+    exit_code = pytest.ExitCode.OK
+    assert run_ci.collect('d457') == []
+    assert capsys.readouterr().out == ''
+
+    exit_code = pytest.ExitCode.INTERRUPTED
+    run_ci.collect('d457')
+    assert 'test_fps.py: 3' in capsys.readouterr().out
+
+
+def test_history(tmp_path):
+    report = tmp_path / 'D457_video0_pytest.xml'
+    report.write_text(JUNIT)
+    results = run_ci.read_junit(str(report))
+    assert results == {'test_fps::test_fps[0-150]': (55.0, 'passed'),
+                       'test_fps::test_fps[2-150]': (5.0, 'failed'),
+                       'test_fw_version::test_fw_version[0]': (2.1, 'passed'),
+                       'test_fw_version::test_dfu[0]': (0.0, 'skipped')}
+
+    history_file = str(tmp_path / 'durations.json')
+    assert run_ci.read_history(history_file) == {}
+    history = {'test_fps::test_fps[0-150]': [30.0] * 25,
+               'test_fps::test_fps[2-150]': [1.0] * 5,
+               'test_fw_version::test_fw_version[0]': [1.5, 1.9, 2.0]}
+    # failed and short tests are not regressions
+    assert run_ci.regressions(history, results) == [('test_fps::test_fps[0-150]', 30.0, 55.0)]
+    assert run_ci.regressions(history, results, threshold=100) == []
+    assert run_ci.regressions({'test_fps::test_fps[0-150]': [30.0, 30.0]}, results) == []
+
+    run_ci.write_history(history_file, run_ci.update_history(history, results))
+    history = run_ci.read_history(history_file)
+    assert len(history['test_fps::test_fps[0-150]']) == run_ci.HISTORY_LENGTH
+    assert history['test_fps::test_fps[0-150]'][-1] == pytest.approx(55.0)
+    assert history['test_fps::test_fps[2-150]'] == [1.0] * 5
+    assert 'test_fw_version::test_dfu[0]' not in history
@@ -0,0 +1,139 @@
+import ctypes
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import v4l2
+from frame_stats import FrameKpiError, FrameStats, stream_concurrent
+from test_fps import capture, get_formats, set_format
+from v4l2 import Device, FakeBackend, FakeCamera
+
+FW_VERSION_ID = 0x009A0000 | 0x4000 | 7
+
+STRUCTS = ('v4l2_fmtdesc', 'v4l2_frmsizeenum', 'v4l2_frmivalenum', 'v4l2_format', 'v4l2_streamparm',
+           'v4l2_requestbuffers', 'v4l2_buffer', 'v4l2_ext_control', 'v4l2_ext_controls', 'v4l2_query_ext_ctrl')
+IOCTLS = ('VIDIOC_ENUM_FMT', 'VIDIOC_G_FMT', 'VIDIOC_S_FMT', 'VIDIOC_REQBUFS', 'VIDIOC_QUERYBUF', 'VIDIOC_QBUF',
+          'VIDIOC_DQBUF', 'VIDIOC_STREAMON', 'VIDIOC_STREAMOFF', 'VIDIOC_G_PARM', 'VIDIOC_S_PARM',
+          'VIDIOC_G_EXT_CTRLS', 'VIDIOC_S_EXT_CTRLS', 'VIDIOC_ENUM_FRAMESIZES', 'VIDIOC_ENUM_FRAMEINTERVALS',
+          'VIDIOC_QUERY_EXT_CTRL')
+
+
+@pytest.fixture
+def camera():
+    return FakeCamera(controls={FW_VERSION_ID: ('fw version', v4l2.V4L2_CTRL_TYPE_U32, [0x05100F01]),
+                                0x009A0901: ('Exposure, Absolute', 1, 33)})
+
+
+@pytest.fixture
+def backend(camera):
+    return FakeBackend({'/dev/video0': camera, '/dev/video2': FakeCamera(drops=[5, 6])})
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None or not os.path.exists('/usr/include/linux/videodev2.h'),
+                    reason="gcc or kernel headers not found")
+def test_abi(tmp_path):
+    # structure sizes and ioctl numbers as compiled from linux/videodev2.h
+    source = tmp_path / 'abi.c'
+    source.write_text('#include <stdio.h>\n#include <linux/videodev2.h>\nint main(void) {\n'
+                      + ''.join(f'    printf("%zu\\n", sizeof(struct {name}));\n' for name in STRUCTS)
+                      + ''.join(f'    printf("%lu\\n", (unsigned long){name});\n' for name in IOCTLS)
+                      + '    return 0;\n}\n')
+    binary = tmp_path / 'abi'
+    subprocess.check_call(['gcc', str(source), '-o', str(binary)])
+    values = [int(line) for line in subprocess.check_output([str(binary)], text=True).split()]
+
+    assert values[:len(STRUCTS)] == [ctypes.sizeof(getattr(v4l2, name)) for name in STRUCTS]
+    assert values[len(STRUCTS):] == [getattr(v4l2, name) for name in IOCTLS]
+
+
+def test_formats(backend):
+    with Device('0', backend) as dev:
+        assert dev.pixel_formats() == [('Z16 ', 'fake Z16')]
+        assert dev.frame_sizes('Z16 ') == [(1280, 720), (640, 480)]
+        assert dev.frame_rates('Z16 ', 640, 480) == [5.0, 30.0, 60.0, 90.0]
+        assert dev.formats() == {(1280, 720): {5.0, 15.0, 30.0}, (640, 480): {5.0, 30.0, 60.0, 90.0}}
+
+        pix = dev.set_format(640, 480)
+        assert (pix.width, pix.height, v4l2.fourcc_str(pix.pixelformat)) == (640, 480, 'Z16 ')
+        assert dev.get_format().sizeimage == 640 * 480 * 2
+        assert dev.set_fps(60) == 60
+        with pytest.raises(OSError):
+            dev.set_format(320, 240)
+
+    assert get_formats('0', backend)[(1280, 720)] == {5.0, 15.0, 30.0}
+    with pytest.raises(FileNotFoundError):
+        Device('4', backend)
+
+
+def test_controls(backend):
+    with Device('/dev/video0', backend) as dev:
+        assert dev.get_control('fw_version') == 0x05100F01
+        assert dev.get_control('exposure_absolute') == 33
+        assert dev.get_control(0x009A0901) == 33
+        with pytest.raises(KeyError):
+            dev.get_control('laser_power')
+
+
+def test_stream(backend, camera):
+    with Device('0', backend) as dev:
+        dev.set_format(640, 480)
+        dev.set_fps(30)
+        camera.drops = {3}
+        frames = []
+        views = []
+        for frame in dev.stream(6, buffers=4):
+            # zero-copy view of the mapped buffer
+            assert frame.data.obj is camera.buffers[frame.index]
+            assert int.from_bytes(frame.data[:8], 'little') == frame.sequence
+            frames.append(frame[:5])
+            views.append(frame.data)
+
+    assert [frame[1] for frame in frames] == [0, 1, 2, 4, 5, 6]
+    assert [frame[0] for frame in frames] == [0, 1, 2, 3, 0, 1]
+    assert frames[3][2] == pytest.approx(100 + 4 / 30, abs=1e-6)
+    assert all(frame[3] == 640 * 480 * 2 for frame in frames)
+    # views are released when the buffer is queued again
+    with pytest.raises(ValueError):
+        views[0][0]
+    assert not camera.streaming and camera.buffers == []
+    assert camera.calls.count(v4l2.VIDIOC_QBUF) == 4 + 6
+
+
+def test_stream_closed_early(backend, camera):
+    with Device('0', backend) as dev:
+        frames = dev.stream()
+        assert next(frames).sequence == 0
+        assert next(frames).sequence == 1
+        frames.close()
+        assert not camera.streaming
+
+
+def test_stream_timeout(backend, camera, monkeypatch):
+    monkeypatch.setattr(backend, 'wait', lambda fd, timeout: False)
+    with Device('0', backend) as dev:
+        with pytest.raises(TimeoutError):
+            list(dev.stream(3, timeout=0.1))
+    assert not camera.streaming
+    assert camera.calls[-1] == v4l2.VIDIOC_REQBUFS
+
+
+def test_capture_frame_stats(backend):
+    set_format('0', 640, 480, 90, backend)
+    stats = capture('0', FrameStats(90), 100, backend=backend)
+    assert stats.frames == 100
+    assert stats.violations == []
+    assert stats.summary()['fps'] == pytest.approx(90)
+
+    with pytest.raises(FrameKpiError, match="Frames dropped between: 4 and 7"):
+        capture('2', FrameStats(30), 100, backend=backend)
+
+    streams = {device: (lambda stats, device=device: capture(device, stats, 20, backend=backend),
+                        FrameStats(30, fail_fast=False))
+               for device in ('0', '2')}
+    set_format('0', 640, 480, 30, backend)
+    errors = stream_concurrent(streams, timeout=10)
+    assert errors == {'0': None, '2': None}
+    assert streams['0'][1].violations == []
+    assert streams['2'][1].dropped == 2
@@ -0,0 +1,658 @@
+"""
+Minimal V4L2 capture layer on fcntl.ioctl and mmap: format enumeration, format and frame rate setup,
+extended controls and mmap streaming with zero-copy access to the dequeued buffers.
+All device access goes through a backend, FakeBackend emulates a camera for tests without hardware.
+"""
+import ctypes
+import fcntl
+import mmap
+import os
+import select
+from collections import namedtuple
+
+# ioctl request encoding of asm-generic/ioctl.h
+_IOC_WRITE = 1
+_IOC_READ = 2
+
+
+def _ioc(direction, nr, struct):
+    return (direction << 30) | (ctypes.sizeof(struct) << 16) | (ord('V') << 8) | nr
+
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_BUF_TYPE_META_CAPTURE = 13
+V4L2_MEMORY_MMAP = 1
+V4L2_FIELD_ANY = 0
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+V4L2_CTRL_FLAG_NEXT_CTRL = 0x80000000
+V4L2_CTRL_FLAG_NEXT_COMPOUND = 0x40000000
+V4L2_CTRL_FLAG_HAS_PAYLOAD = 0x0100
+V4L2_CTRL_WHICH_CUR_VAL = 0
+V4L2_CTRL_TYPE_INTEGER64 = 5
+V4L2_CTRL_TYPE_U8 = 0x0100
+V4L2_CTRL_TYPE_U16 = 0x0101
+V4L2_CTRL_TYPE_U32 = 0x0102
+
+
+def fourcc(code):
+    return int.from_bytes(code.encode().ljust(4), 'little')
+
+
+def fourcc_str(value):
+    return value.to_bytes(4, 'little').decode(errors='replace')
+
+
+def control_name(name):
+    """
+    Control name as used by v4l2-ctl, e.g. "Exposure, Absolute" -> "exposure_absolute"
+    """
+    return '_'.join(''.join(c if c.isalnum() else ' ' for c in name.lower()).split())
+
+
+class v4l2_fmtdesc(ctypes.Structure):
+    _fields_ = [('index', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('flags', ctypes.c_uint32),
+                ('description', ctypes.c_char * 32),
+                ('pixelformat', ctypes.c_uint32),
+                ('mbus_code', ctypes.c_uint32),
+                ('reserved', ctypes.c_uint32 * 3)]
+
+
+class v4l2_frmsize_discrete(ctypes.Structure):
+    _fields_ = [('width', ctypes.c_uint32),
+                ('height', ctypes.c_uint32)]
+
+
+class v4l2_frmsizeenum(ctypes.Structure):
+    class _u(ctypes.Union):
+        _fields_ = [('discrete', v4l2_frmsize_discrete),
+                    ('stepwise', ctypes.c_uint32 * 6)]
+    _anonymous_ = ('u',)
+    _fields_ = [('index', ctypes.c_uint32),
+                ('pixel_format', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('u', _u),
+                ('reserved', ctypes.c_uint32 * 2)]
+
+
+class v4l2_fract(ctypes.Structure):
+    _fields_ = [('numerator', ctypes.c_uint32),
+                ('denominator', ctypes.c_uint32)]
+
+
+class v4l2_frmivalenum(ctypes.Structure):
+    class _u(ctypes.Union):
+        _fields_ = [('discrete', v4l2_fract),
+                    ('stepwise', v4l2_fract * 3)]
+    _anonymous_ = ('u',)
+    _fields_ = [('index', ctypes.c_uint32),
+                ('pixel_format', ctypes.c_uint32),
+                ('width', ctypes.c_uint32),
+                ('height', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('u', _u),
+                ('reserved', ctypes.c_uint32 * 2)]
+
+
+class v4l2_pix_format(ctypes.Structure):
+    _fields_ = [('width', ctypes.c_uint32),
+                ('height', ctypes.c_uint32),
+                ('pixelformat', ctypes.c_uint32),
+                ('field', ctypes.c_uint32),
+                ('bytesperline', ctypes.c_uint32),
+                ('sizeimage', ctypes.c_uint32),
+                ('colorspace', ctypes.c_uint32),
+                ('priv', ctypes.c_uint32),
+                ('flags', ctypes.c_uint32),
+                ('ycbcr_enc', ctypes.c_uint32),
+                ('quantization', ctypes.c_uint32),
+                ('xfer_func', ctypes.c_uint32)]
+
+
+class v4l2_format(ctypes.Structure):
+    class _u(ctypes.Union):
+        # the kernel union contains pointers (struct v4l2_window), hence the pointer alignment
+        _fields_ = [('pix', v4l2_pix_format),
+                    ('raw_data', ctypes.c_uint8 * 200),
+                    ('align', ctypes.c_void_p)]
+    _fields_ = [('type', ctypes.c_uint32),
+                ('fmt', _u)]
+
+
+class v4l2_captureparm(ctypes.Structure):
+    _fields_ = [('capability', ctypes.c_uint32),
+                ('capturemode', ctypes.c_uint32),
+                ('timeperframe', v4l2_fract),
+                ('extendedmode', ctypes.c_uint32),
+                ('readbuffers', ctypes.c_uint32),
+                ('reserved', ctypes.c_uint32 * 4)]
+
+
+class v4l2_streamparm(ctypes.Structure):
+    class _u(ctypes.Union):
+        _fields_ = [('capture', v4l2_captureparm),
+                    ('raw_data', ctypes.c_uint8 * 200)]
+    _fields_ = [('type', ctypes.c_uint32),
+                ('parm', _u)]
+
+
+class v4l2_requestbuffers(ctypes.Structure):
+    _fields_ = [('count', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('memory', ctypes.c_uint32),
+                ('capabilities', ctypes.c_uint32),
+                ('reserved', ctypes.c_uint32)]
+
+
+class timeval(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long),
+                ('tv_usec', ctypes.c_long)]
+
+
+class v4l2_timecode(ctypes.Structure):
+    _fields_ = [('type', ctypes.c_uint32),
+                ('flags', ctypes.c_uint32),
+                ('frames', ctypes.c_uint8),
+                ('seconds', ctypes.c_uint8),
+                ('minutes', ctypes.c_uint8),
+                ('hours', ctypes.c_uint8),
+                ('userbits', ctypes.c_uint8 * 4)]
+
+
+class v4l2_buffer(ctypes.Structure):
+    class _m(ctypes.Union):
+        _fields_ = [('offset', ctypes.c_uint32),
+                    ('userptr', ctypes.c_ulong),
+                    ('planes', ctypes.c_void_p),
+                    ('fd', ctypes.c_int32)]
+    _fields_ = [('index', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('bytesused', ctypes.c_uint32),
+                ('flags', ctypes.c_uint32),
+                ('field', ctypes.c_uint32),
+                ('timestamp', timeval),
+                ('timecode', v4l2_timecode),
+                ('sequence', ctypes.c_uint32),
+                ('memory', ctypes.c_uint32),
+                ('m', _m),
+                ('length', ctypes.c_uint32),
+                ('reserved2', ctypes.c_uint32),
+                ('request_fd', ctypes.c_int32)]
+
+
+class v4l2_ext_control(ctypes.Structure):
+    class _u(ctypes.Union):
+        _fields_ = [('value', ctypes.c_int32),
+                    ('value64', ctypes.c_int64),
+                    ('ptr', ctypes.c_void_p)]
+    _pack_ = 1
+    _anonymous_ = ('u',)
+    _fields_ = [('id', ctypes.c_uint32),
+                ('size', ctypes.c_uint32),
+                ('reserved2', ctypes.c_uint32),
+                ('u', _u)]
+
+
+class v4l2_ext_controls(ctypes.Structure):
+    _fields_ = [('which', ctypes.c_uint32),
+                ('count', ctypes.c_uint32),
+                ('error_idx', ctypes.c_uint32),
+                ('request_fd', ctypes.c_int32),
+                ('reserved', ctypes.c_uint32),
+                ('controls', ctypes.POINTER(v4l2_ext_control))]
+
+
+class v4l2_query_ext_ctrl(ctypes.Structure):
+    _fields_ = [('id', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('name', ctypes.c_char * 32),
+                ('minimum', ctypes.c_int64),
+                ('maximum', ctypes.c_int64),
+                ('step', ctypes.c_uint64),
+                ('default_value', ctypes.c_int64),
+                ('flags', ctypes.c_uint32),
+                ('elem_size', ctypes.c_uint32),
+                ('elems', ctypes.c_uint32),
+                ('nr_of_dims', ctypes.c_uint32),
+                ('dims', ctypes.c_uint32 * 4),
+                ('reserved', ctypes.c_uint32 * 32)]
+
+
+VIDIOC_ENUM_FMT = _ioc(_IOC_READ | _IOC_WRITE, 2, v4l2_fmtdesc)
+VIDIOC_G_FMT = _ioc(_IOC_READ | _IOC_WRITE, 4, v4l2_format)
+VIDIOC_S_FMT = _ioc(_IOC_READ | _IOC_WRITE, 5, v4l2_format)
+VIDIOC_REQBUFS = _ioc(_IOC_READ | _IOC_WRITE, 8, v4l2_requestbuffers)
+VIDIOC_QUERYBUF = _ioc(_IOC_READ | _IOC_WRITE, 9, v4l2_buffer)
+VIDIOC_QBUF = _ioc(_IOC_READ | _IOC_WRITE, 15, v4l2_buffer)
+VIDIOC_DQBUF = _ioc(_IOC_READ | _IOC_WRITE, 17, v4l2_buffer)
+VIDIOC_STREAMON = _ioc(_IOC_WRITE, 18, ctypes.c_int)
+VIDIOC_STREAMOFF = _ioc(_IOC_WRITE, 19, ctypes.c_int)
+VIDIOC_G_PARM = _ioc(_IOC_READ | _IOC_WRITE, 21, v4l2_streamparm)
+VIDIOC_S_PARM = _ioc(_IOC_READ | _IOC_WRITE, 22, v4l2_streamparm)
+VIDIOC_G_EXT_CTRLS = _ioc(_IOC_READ | _IOC_WRITE, 71, v4l2_ext_controls)
+VIDIOC_S_EXT_CTRLS = _ioc(_IOC_READ | _IOC_WRITE, 72, v4l2_ext_controls)
+VIDIOC_ENUM_FRAMESIZES = _ioc(_IOC_READ | _IOC_WRITE, 74, v4l2_frmsizeenum)
+VIDIOC_ENUM_FRAMEINTERVALS = _ioc(_IOC_READ | _IOC_WRITE, 75, v4l2_frmivalenum)
+VIDIOC_QUERY_EXT_CTRL = _ioc(_IOC_READ | _IOC_WRITE, 103, v4l2_query_ext_ctrl)
+
+# one dequeued buffer: data is a zero-copy view of the mmap buffer, valid until the next frame is requested
+Frame = namedtuple('Frame', 'index sequence timestamp bytesused flags data')
+
+
+class SystemBackend:
+    """
+    Real device access
+    """
+
+    def open(self, path):
+        return os.open(path, os.O_RDWR)
+
+    def close(self, fd):
+        os.close(fd)
+
+    def ioctl(self, fd, request, arg):
+        fcntl.ioctl(fd, request, arg)
+
+    def mmap(self, fd, length, offset):
+        return mmap.mmap(fd, length, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=offset)
+
+    def wait(self, fd, timeout):
+        """
+        :return: True when a buffer can be dequeued within timeout [s]
+        """
+        return bool(select.select([fd], [], [], timeout)[0])
+
+
+class Device:
+    """
+    V4L2 video node, e.g. Device('0') or Device('/dev/video0')
+    """
+
+    def __init__(self, device, backend=None, buffer_type=V4L2_BUF_TYPE_VIDEO_CAPTURE):
+        self.path = device if str(device).startswith('/') else f'/dev/video{device}'
+        self.backend = backend or SystemBackend()
+        self.type = buffer_type
+        self.fd = self.backend.open(self.path)
+
+    def close(self):
+        if self.fd is not None:
+            self.backend.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ioctl(self, request, arg):
+        self.backend.ioctl(self.fd, request, arg)
+        return arg
+
+    def _enumerate(self, request, arg):
+        """
+        Repeat enumeration ioctl with increasing index until the driver returns EINVAL
+        """
+        while True:
+            try:
+                self.ioctl(request, arg)
+            except OSError as e:
+                if e.errno == 22:
+                    return
+                raise
+            yield arg
+            arg.index += 1
+
+    def pixel_formats(self):
+        """
+        :return: [(fourcc, description)]
+        """
+        return [(fourcc_str(desc.pixelformat), desc.description.decode())
+                for desc in self._enumerate(VIDIOC_ENUM_FMT, v4l2_fmtdesc(type=self.type))]
+
+    def frame_sizes(self, pixelformat):
+        """
+        :return: [(width, height)] of the discrete frame sizes
+        """
+        return [(size.discrete.width, size.discrete.height)
+                for size in self._enumerate(VIDIOC_ENUM_FRAMESIZES, v4l2_frmsizeenum(pixel_format=fourcc(pixelformat)))
+                if size.type == V4L2_FRMSIZE_TYPE_DISCRETE]
+
+    def frame_rates(self, pixelformat, width, height):
+        """
+        :return: [fps] of the discrete frame intervals
+        """
+        arg = v4l2_frmivalenum(pixel_format=fourcc(pixelformat), width=width, height=height)
+        return [round(interval.discrete.denominator / interval.discrete.numerator, 3)
+                for interval in self._enumerate(VIDIOC_ENUM_FRAMEINTERVALS, arg)
+                if interval.type == V4L2_FRMIVAL_TYPE_DISCRETE and interval.discrete.numerator]
+
+    def formats(self):
+        """
+        :return: {(width, height): {fps}} of all pixel formats, like v4l2-ctl --list-formats-ext
+        """
+        formats = {}
+        for pixelformat, _ in self.pixel_formats():
+            for width, height in self.frame_sizes(pixelformat):
+                formats.setdefault((width, height), set()).update(self.frame_rates(pixelformat, width, height))
+        return formats
+
+    def get_format(self):
+        return self.ioctl(VIDIOC_G_FMT, v4l2_format(type=self.type)).fmt.pix
+
+    def set_format(self, width, height, pixelformat=None):
+        """
+        Set frame size, the pixel format is kept when not given
+        :return: format applied by the driver
+        """
+        arg = self.ioctl(VIDIOC_G_FMT, v4l2_format(type=self.type))
+        arg.fmt.pix.width = width
+        arg.fmt.pix.height = height
+        arg.fmt.pix.field = V4L2_FIELD_ANY
+        if pixelformat:
+            arg.fmt.pix.pixelformat = fourcc(pixelformat)
+        return self.ioctl(VIDIOC_S_FMT, arg).fmt.pix
+
+    def set_fps(self, fps):
+        """
+        :return: frame rate applied by the driver
+        """
+        arg = v4l2_streamparm(type=self.type)
+        arg.parm.capture.timeperframe.numerator = 1000
+        arg.parm.capture.timeperframe.denominator = round(fps * 1000)
+        frame = self.ioctl(VIDIOC_S_PARM, arg).parm.capture.timeperframe
+        return frame.denominator / frame.numerator if frame.numerator else 0
+
+    def query_control(self, name):
+        """
+        Find control by its name, "fw version" and "fw_version" are the same control
+        """
+        arg = v4l2_query_ext_ctrl(id=V4L2_CTRL_FLAG_NEXT_CTRL | V4L2_CTRL_FLAG_NEXT_COMPOUND)
+        while True:
+            try:
+                self.ioctl(VIDIOC_QUERY_EXT_CTRL, arg)
+            except OSError as e:
+                if e.errno == 22:
+                    raise KeyError(f"control {name} not found on {self.path}")
+                raise
+            if control_name(arg.name.decode()) == control_name(name):
+                return arg
+            arg.id |= V4L2_CTRL_FLAG_NEXT_CTRL | V4L2_CTRL_FLAG_NEXT_COMPOUND
+
+    def get_control(self, control):
+        """
+        Read control with VIDIOC_G_EXT_CTRLS
+        :param control: control id or name
+        :return: value, list of values for array controls with more elements
+        """
+        query = self.query_control(control) if isinstance(control, str) else None
+        ctrl = v4l2_ext_control(id=query.id if query else control)
+        payload = None
+        if query is not None and query.flags & V4L2_CTRL_FLAG_HAS_PAYLOAD:
+            element = {V4L2_CTRL_TYPE_U8: ctypes.c_uint8, V4L2_CTRL_TYPE_U16: ctypes.c_uint16,
+                       V4L2_CTRL_TYPE_U32: ctypes.c_uint32}.get(query.type, ctypes.c_uint8)
+            payload = (element * max(1, query.elems))()
+            ctrl.size = ctypes.sizeof(payload)
+            ctrl.ptr = ctypes.addressof(payload)
+        arg = v4l2_ext_controls(which=V4L2_CTRL_WHICH_CUR_VAL, count=1, controls=ctypes.pointer(ctrl))
+        self.ioctl(VIDIOC_G_EXT_CTRLS, arg)
+        if payload is not None:
+            return payload[0] if len(payload) == 1 else list(payload)
+        if query is not None and query.type == V4L2_CTRL_TYPE_INTEGER64:
+            return ctrl.value64
+        return ctrl.value
+
+    def stream(self, count=None, buffers=4, timeout=5.0):
+        """
+        Capture with mmap buffers, every dequeued buffer is queued again when the next frame is requested
+        :param count: number of frames, None streams until the generator is closed
+        :param buffers: number of requested buffers
+        :param timeout: maximal wait for one frame [s]
+        :raise TimeoutError: no frame within timeout
+        :return: generator of Frame
+        """
+        request = self.ioctl(VIDIOC_REQBUFS, v4l2_requestbuffers(count=buffers, type=self.type,
+                                                                  memory=V4L2_MEMORY_MMAP))
+        maps = []
+        views = []
+        streaming = False
+        try:
+            for index in range(request.count):
+                buf = self.ioctl(VIDIOC_QUERYBUF, v4l2_buffer(index=index, type=self.type, memory=V4L2_MEMORY_MMAP))
+                maps.append(self.backend.mmap(self.fd, buf.length, buf.m.offset))
+                views.append(memoryview(maps[-1]))
+                self.ioctl(VIDIOC_QBUF, buf)
+            self.ioctl(VIDIOC_STREAMON, ctypes.c_int(self.type))
+            streaming = True
+
+            frames = 0
+            while count is None or frames < count:
+                if not self.backend.wait(self.fd, timeout):
+                    raise TimeoutError(f"no frame from {self.path} within {timeout} s")
+                buf = self.ioctl(VIDIOC_DQBUF, v4l2_buffer(type=self.type, memory=V4L2_MEMORY_MMAP))
+                data = views[buf.index][:buf.bytesused]
+                try:
+                    yield Frame(buf.index, buf.sequence, buf.timestamp.tv_sec + buf.timestamp.tv_usec / 1e6,
+                                buf.bytesused, buf.flags, data)
+                finally:
+                    data.release()
+                frames += 1
+                self.ioctl(VIDIOC_QBUF, buf)
+        finally:
+            if streaming:
+                self.ioctl(VIDIOC_STREAMOFF, ctypes.c_int(self.type))
+            for view in views:
+                view.release()
+            for buffer in maps:
+                if hasattr(buffer, 'close'):
+                    buffer.close()
+            self.ioctl(VIDIOC_REQBUFS, v4l2_requestbuffers(count=0, type=self.type, memory=V4L2_MEMORY_MMAP))
+
+
+class FakeCamera:
+    """
+    Camera emulated at the ioctl level: formats, frame rates, controls and frames with virtual timestamps
+    """
+
+    def __init__(self, formats=None, controls=None, drops=(), start=100.0):
+        """
+        :param formats: {fourcc: {(width, height): [fps]}}
+        :param controls: {id: (name, type, value)}, array controls have list values
+        :param drops: sequence numbers of frames lost before they reach the buffer queue
+        :param start: timestamp of the first frame [s]
+        """
+        self.formats = formats or {'Z16 ': {(1280, 720): [5.0, 15.0, 30.0], (640, 480): [5.0, 30.0, 60.0, 90.0]}}
+        self.controls = controls or {}
+        self.drops = set(drops)
+        self.start = start
+        pixelformat = next(iter(self.formats))
+        self.format = (pixelformat, *next(iter(self.formats[pixelformat])))
+        self.fps = 30.0
+        self.buffers = []
+        self.queued = []
+        self.streaming = False
+        self.sequence = 0
+        self.calls = []
+
+    def frame_size(self):
+        return self.format[1] * self.format[2] * 2
+
+    def ioctl(self, request, arg):
+        self.calls.append(request)
+        handler = self.HANDLERS.get(request)
+        if handler is None:
+            raise OSError(25, 'Inappropriate ioctl for device')
+        handler(self, arg)
+
+    @staticmethod
+    def _einval():
+        return OSError(22, 'Invalid argument')
+
+    def _enum_fmt(self, arg):
+        if arg.index >= len(self.formats):
+            raise self._einval()
+        arg.pixelformat = fourcc(list(self.formats)[arg.index])
+        arg.description = b'fake ' + list(self.formats)[arg.index].strip().encode()
+
+    def _enum_framesizes(self, arg):
+        sizes = list(self.formats.get(fourcc_str(arg.pixel_format), {}))
+        if arg.index >= len(sizes):
+            raise self._einval()
+        arg.type = V4L2_FRMSIZE_TYPE_DISCRETE
+        arg.discrete.width, arg.discrete.height = sizes[arg.index]
+
+    def _enum_frameintervals(self, arg):
+        rates = self.formats.get(fourcc_str(arg.pixel_format), {}).get((arg.width, arg.height), [])
+        if arg.index >= len(rates):
+            raise self._einval()
+        arg.type = V4L2_FRMIVAL_TYPE_DISCRETE
+        arg.discrete.numerator = 1000
+        arg.discrete.denominator = round(rates[arg.index] * 1000)
+
+    def _g_fmt(self, arg):
+        pixelformat, width, height = self.format
+        arg.fmt.pix.pixelformat = fourcc(pixelformat)
+        arg.fmt.pix.width = width
+        arg.fmt.pix.height = height
+        arg.fmt.pix.bytesperline = width * 2
+        arg.fmt.pix.sizeimage = self.frame_size()
+
+    def _s_fmt(self, arg):
+        pixelformat = fourcc_str(arg.fmt.pix.pixelformat)
+        if self.streaming or (arg.fmt.pix.width, arg.fmt.pix.height) not in self.formats.get(pixelformat, {}):
+            raise self._einval()
+        self.format = (pixelformat, arg.fmt.pix.width, arg.fmt.pix.height)
+        self._g_fmt(arg)
+
+    def _s_parm(self, arg):
+        frame = arg.parm.capture.timeperframe
+        if not frame.numerator or self.streaming:
+            raise self._einval()
+        self.fps = frame.denominator / frame.numerator
+
+    def _query_ext_ctrl(self, arg):
+        ids = sorted(self.controls)
+        if arg.id & (V4L2_CTRL_FLAG_NEXT_CTRL | V4L2_CTRL_FLAG_NEXT_COMPOUND):
+            following = [i for i in ids if i > (arg.id & ~(V4L2_CTRL_FLAG_NEXT_CTRL | V4L2_CTRL_FLAG_NEXT_COMPOUND))]
+            if not following:
+                raise self._einval()
+            arg.id = following[0]
+        elif arg.id not in self.controls:
+            raise self._einval()
+        name, ctrl_type, value = self.controls[arg.id]
+        arg.name = name.encode()
+        arg.type = ctrl_type
+        arg.flags = V4L2_CTRL_FLAG_HAS_PAYLOAD if ctrl_type >= V4L2_CTRL_TYPE_U8 else 0
+        arg.elems = len(value) if isinstance(value, list) else 1
+
+    def _g_ext_ctrls(self, arg):
+        for idx in range(arg.count):
+            ctrl = arg.controls[idx]
+            if ctrl.id not in self.controls:
+                arg.error_idx = idx
+                raise self._einval()
+            _, ctrl_type, value = self.controls[ctrl.id]
+            values = value if isinstance(value, list) else [value]
+            if ctrl_type >= V4L2_CTRL_TYPE_U8:
+                element = {V4L2_CTRL_TYPE_U8: ctypes.c_uint8, V4L2_CTRL_TYPE_U16: ctypes.c_uint16}.get(ctrl_type,
+                                                                                                   ctypes.c_uint32)
+                if ctrl.size < ctypes.sizeof(element) * len(values):
+                    raise OSError(28, 'No space left on device')
+                (element * len(values)).from_address(ctrl.ptr)[:] = values
+            elif ctrl_type == V4L2_CTRL_TYPE_INTEGER64:
+                ctrl.value64 = value
+            else:
+                ctrl.value = value
+
+    def _reqbufs(self, arg):
+        if self.streaming:
+            raise OSError(16, 'Device or resource busy')
+        self.buffers = [bytearray(self.frame_size()) for _ in range(arg.count)]
+        self.queued = []
+
+    def _querybuf(self, arg):
+        if arg.index >= len(self.buffers):
+            raise self._einval()
+        arg.length = len(self.buffers[arg.index])
+        arg.m.offset = arg.index * 0x100000
+
+    def _qbuf(self, arg):
+        if arg.index >= len(self.buffers) or arg.index in self.queued:
+            raise self._einval()
+        self.queued.append(arg.index)
+
+    def _dqbuf(self, arg):
+        if not self.streaming or not self.queued:
+            raise OSError(11, 'Resource temporarily unavailable')
+        while self.sequence in self.drops:
+            self.sequence += 1
+        index = self.queued.pop(0)
+        timestamp = self.start + self.sequence / self.fps
+        buffer = self.buffers[index]
+        buffer[:8] = self.sequence.to_bytes(8, 'little')
+        arg.index = index
+        arg.sequence = self.sequence
+        arg.bytesused = len(buffer)
+        arg.timestamp.tv_sec = int(timestamp)
+        arg.timestamp.tv_usec = round((timestamp - int(timestamp)) * 1e6)
+        self.sequence += 1
+
+    def _streamon(self, arg):
+        self.streaming = True
+        self.sequence = 0
+
+    def _streamoff(self, arg):
+        self.streaming = False
+        self.queued = []
+
+    HANDLERS = {VIDIOC_ENUM_FMT: _enum_fmt,
+                VIDIOC_ENUM_FRAMESIZES: _enum_framesizes,
+                VIDIOC_ENUM_FRAMEINTERVALS: _enum_frameintervals,
+                VIDIOC_G_FMT: _g_fmt,
+                VIDIOC_S_FMT: _s_fmt,
+                VIDIOC_S_PARM: _s_parm,
+                VIDIOC_QUERY_EXT_CTRL: _query_ext_ctrl,
+                VIDIOC_G_EXT_CTRLS: _g_ext_ctrls,
+                VIDIOC_REQBUFS: _reqbufs,
+                VIDIOC_QUERYBUF: _querybuf,
+                VIDIOC_QBUF: _qbuf,
+                VIDIOC_DQBUF: _dqbuf,
+                VIDIOC_STREAMON: _streamon,
+                VIDIOC_STREAMOFF: _streamoff}
+
+
+class FakeBackend:
+    """
+    Backend of FakeCamera devices by path, buffers are mapped as bytearrays
+    """
+
+    def __init__(self, cameras):
+        """
+        :param cameras: {path: FakeCamera}
+        """
+        self.cameras = cameras
+        self.open_fds = {}
+
+    def open(self, path):
+        if path not in self.cameras:
+            raise FileNotFoundError(2, 'No such file or directory', path)
+        fd = len(self.open_fds) + 100
+        while fd in self.open_fds:
+            fd += 1
+        self.open_fds[fd] = self.cameras[path]
+        return fd
+
+    def close(self, fd):
+        del self.open_fds[fd]
+
+    def ioctl(self, fd, request, arg):
+        self.open_fds[fd].ioctl(request, arg)
+
+    def mmap(self, fd, length, offset):
+        return self.open_fds[fd].buffers[offset // 0x100000]
+
+    def wait(self, fd, timeout):
+        camera = self.open_fds[fd]
+        return camera.streaming and bool(camera.queued)
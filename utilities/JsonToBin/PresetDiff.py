@@ -0,0 +1,218 @@
+import getopt
+import math
+import os
+import re
+import struct
+import sys
+
+from PresetLayout import PresetLayout
+from RegisterIndex import RegisterIndex
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, presets are compared one by one without it
+    np = None
+
+# struct format -> numpy dtype of the preset field
+DTYPES = {'I': '<u4', 'H': '<u2', 'i': '<i4', 'h': '<i2', 'f': '<f4'}
+
+# signed C types, e.g. int32_t minZ, are written as raw bits with the unsigned format of the layout
+SIGNED_TYPE_PATTERN = re.compile(r'^int\d+_t$')
+SIGNED_FORMATS = {'I': 'i', 'H': 'h'}
+
+
+def usage():
+    scriptName = os.path.basename(sys.argv[0])
+
+    print("Decode preset binaries and report the differing fields.")
+    print("Syntax: " + scriptName + " [-i input_dir] [-a] <preset.bin | presets_dir> ...")
+    print("        -h, --help         prints help info")
+    print("        -i, --input-dir    folder of Preset.h, Scp.h and Registers_B0.h, default ." + os.sep + "Input")
+    print("        -a, --all          print all fields, not only the differing ones")
+    print("One preset is printed decoded, several presets are compared field by field.")
+    sys.exit(1)
+
+
+def presetColumnsGet(layout, regIndex):
+    # decoded columns of the layout: (column name, field index, register field or None)
+    # register words are split to their Registers_B0.h bitfields named word.field
+    columns = []
+
+    for index, (varName, varType, _) in enumerate(layout.fields):
+        registerFields = regIndex.registerFieldsGet(varType) if ("TRegScp" in varType) else []
+        if (registerFields):
+            columns += [(varName + "." + field[0], index, field) for field in registerFields]
+        else:
+            columns.append((varName, index, None))
+
+    return columns
+
+
+def fieldFormatGet(varType, fieldFormat):
+    # struct format decoding the field with its C type, signed integers get the signed format
+    if (SIGNED_TYPE_PATTERN.match(varType)):
+        return SIGNED_FORMATS.get(fieldFormat, fieldFormat)
+    return fieldFormat
+
+
+def presetStructGet(layout):
+    return struct.Struct('<' + ''.join(fieldFormatGet(varType, fieldFormat)
+                                       for _, varType, fieldFormat in layout.fields))
+
+
+def valuesEqual(value, other):
+    # NaN fields are equal to NaN
+    if (isinstance(value, float) and isinstance(other, float) and math.isnan(value) and math.isnan(other)):
+        return True
+    return value == other
+
+
+def presetDecode(data, layout, regIndex):
+    # one preset binary -> {column name: value} with struct.unpack_from
+    if (len(data) != layout.size):
+        raise ValueError("preset size " + str(len(data)) + " does not match layout size " + str(layout.size))
+
+    values = presetStructGet(layout).unpack_from(data)
+    decoded = {}
+
+    for columnName, index, registerField in presetColumnsGet(layout, regIndex):
+        value = values[index]
+        if (registerField is not None):
+            _, shiftBit, _, mask = registerField
+            value = (value >> shiftBit) & mask
+        elif (isinstance(value, bytes)):
+            value = value.rstrip(b"\0").decode(errors="replace")
+        decoded[columnName] = value
+
+    return decoded
+
+
+def presetDtypeGet(layout):
+    # numpy structured dtype of one preset, field names as in layout.fields
+    dtypes = []
+    for varName, varType, fieldFormat in layout.fields:
+        fieldFormat = fieldFormatGet(varType, fieldFormat)
+        dtypes.append((varName, DTYPES.get(fieldFormat, 'S' + fieldFormat[:-1])))
+    return np.dtype(dtypes)
+
+
+def presetsLoad(fileNames, layout):
+    # read presets into one numpy structured array, one row per file
+    data = bytearray()
+
+    for fileName in fileNames:
+        with open(fileName, "rb") as presetFile:
+            presetData = presetFile.read()
+        if (len(presetData) != layout.size):
+            raise ValueError(fileName + ": preset size " + str(len(presetData)) + " does not match layout size "
+                             + str(layout.size))
+        data += presetData
+
+    return np.frombuffer(bytes(data), dtype=presetDtypeGet(layout))
+
+
+def presetsDiff(presets, layout, regIndex, allFields = False):
+    # compare a library of presets column by column:
+    # presets - numpy structured array of presetsLoad or list of presetDecode dicts without numpy
+    # returns [(column name, [value per preset])] of columns that differ between the presets
+    diff = []
+
+    if (np is None) or (not isinstance(presets, np.ndarray)):
+        for columnName, _, _ in presetColumnsGet(layout, regIndex):
+            values = [preset[columnName] for preset in presets]
+            if (allFields or any(not valuesEqual(value, values[0]) for value in values)):
+                diff.append((columnName, values))
+        return diff
+
+    for columnName, index, registerField in presetColumnsGet(layout, regIndex):
+        column = presets[layout.fields[index][0]]
+        if (registerField is not None):
+            _, shiftBit, _, mask = registerField
+            column = (column >> shiftBit) & mask
+        differs = (column != column[0]) if len(column) else np.zeros(0, bool)
+        if (column.dtype.kind == 'f'):
+            differs &= ~(np.isnan(column) & np.isnan(column[0]))
+        if (allFields or bool(np.any(differs))):
+            if (column.dtype.kind == 'S'):
+                values = [value.rstrip(b"\0").decode(errors="replace") for value in column.tolist()]
+            else:
+                values = column.tolist()
+            diff.append((columnName, values))
+
+    return diff
+
+
+def presetFilesFind(paths):
+    fileNames = []
+
+    for path in paths:
+        if (os.path.isdir(path)):
+            fileNames += [os.path.join(path, fileName) for fileName in sorted(os.listdir(path))
+                          if fileName.endswith(".bin")]
+        else:
+            fileNames.append(path)
+
+    return fileNames
+
+
+def valueFormat(value):
+    if (isinstance(value, float)):
+        return "%.7g" % value
+    return str(value)
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hi:a", longopts=["help", "input-dir=", "all"])
+    except getopt.GetoptError as err:
+        print("error: " + str(err))
+        usage()
+
+    inputDir = "." + os.sep + "Input"
+    allFields = False
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+        elif opt in ("-i", "--input-dir"):
+            inputDir = arg
+        elif opt in ("-a", "--all"):
+            allFields = True
+
+    fileNames = presetFilesFind(args)
+    if (not fileNames):
+        usage()
+
+    try:
+        layout = PresetLayout(os.path.join(inputDir, "Preset.h"), os.path.join(inputDir, "Scp.h"))
+        regIndex = RegisterIndex(os.path.join(inputDir, "Registers_B0.h"))
+
+        if (np is not None):
+            presets = presetsLoad(fileNames, layout)
+        else:
+            presets = []
+            for fileName in fileNames:
+                with open(fileName, "rb") as presetFile:
+                    presets.append(presetDecode(presetFile.read(), layout, regIndex))
+    except (OSError, ValueError) as err:
+        print("error: " + str(err))
+        return 1
+
+    diff = presetsDiff(presets, layout, regIndex, allFields or (len(fileNames) == 1))
+
+    names = [os.path.splitext(os.path.basename(fileName))[0] for fileName in fileNames]
+    nameWidth = max(len(columnName) for columnName, _ in diff) if diff else 0
+    valueWidth = max([len(name) for name in names] + [12])
+
+    print("%-*s  %s" % (nameWidth, "field", "  ".join("%-*s" % (valueWidth, name) for name in names)))
+    for columnName, values in diff:
+        print("%-*s  %s" % (nameWidth, columnName,
+                            "  ".join("%-*s" % (valueWidth, valueFormat(value)) for value in values)))
+
+    if (len(fileNames) > 1):
+        print("%d fields differ between %d presets" % (len(diff) if not allFields else
+                                                       len(presetsDiff(presets, layout, regIndex)), len(fileNames)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
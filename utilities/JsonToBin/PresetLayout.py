@@ -0,0 +1,82 @@
+import os
+import re
+import struct
+
+# types and array sizes not declared in Preset.h/Scp.h
+PRESET_NAME_MAX_LEN = 20
+COLOR_CORRECTION_SIZE = 12
+ARRAY_SIZES = {'AE_FACE_NOF_PARAMS_MAX': 25}
+
+# struct member declaration, e.g. "uint32_t exposureList[AE_FACE_NOF_PARAMS_MAX];"
+MEMBER_PATTERN = re.compile(r'^\s*(\w+)\s+(\w+)\s*(?:\[\s*(\w+)\s*\])?\s*;')
+
+# field format -> mask of the written value, values are written as little-endian raw bits like the firmware reads them
+INT_MASKS = {'I': 0xFFFFFFFF, 'H': 0xFFFF}
+
+
+class PresetLayout():
+    # binary layout of STPreset compiled from Preset.h and Scp.h once per run:
+    # ordered field list of (varName, varType, format) and one struct.Struct packing the whole preset
+
+    def __init__(self, presetFileName = "." + os.sep + "Input" + os.sep + "Preset.h",
+                 scpFileName = "." + os.sep + "Input" + os.sep + "Scp.h"):
+        self.PresetFileName = presetFileName
+        self.ScpFileName = scpFileName
+        self.fields = []
+
+        for varType, varName, arraySize in self.membersRead(presetFileName):
+            if (varType == "TPresetName"):
+                self.fields.append((varName, varType, str(PRESET_NAME_MAX_LEN) + 's'))
+
+            elif (varType == "STScpParams"):
+                for scpType, scpName, _ in self.membersRead(scpFileName):
+                    if ((scpType == "float") or (scpType == "uint32_t") or (scpType == "int32_t")
+                        or ("TRegScp" in scpType) or ("ET" in scpType)):
+                        self.fields.append((scpName, scpType, self.formatGet(scpType)))
+
+            elif ("int" in varType):    #int32_t, uint16_t, uint32_t
+                if (arraySize is None):
+                    self.fields.append((varName, varType, self.formatGet(varType)))
+                elif (varName == "exposureList"):
+                    size = ARRAY_SIZES.get(arraySize) or int(arraySize)
+                    self.fields += [('exposure' + str(idx), varType, self.formatGet(varType)) for idx in range(size)]
+                else:
+                    raise ValueError("array " + varName + " is not supported")
+
+            elif (varType == "T_COLOR_CORRECTION_MATRIX_FLOAT"):
+                self.fields += [('colorCorrection' + str(idx), 'float', 'f')
+                                for idx in range(1, COLOR_CORRECTION_SIZE + 1)]
+
+        self.struct = struct.Struct('<' + ''.join(fieldFormat for _, _, fieldFormat in self.fields))
+        self.size = self.struct.size
+        self.buffer = bytearray(self.size)
+        self.masks = [INT_MASKS.get(fieldFormat) for _, _, fieldFormat in self.fields]
+
+    @staticmethod
+    def membersRead(fileName):
+        with open(fileName, "r") as headerFile:
+            for line in headerFile:
+                match = MEMBER_PATTERN.match(line)
+                if (match is not None):
+                    yield match.groups()
+
+    @staticmethod
+    def formatGet(varType):
+        if ('float' == varType):
+            return 'f'
+        if ('int16' in varType):
+            return 'H'
+        return 'I'
+
+    def valuesMask(self, values):
+        # values in self.fields order, integers are truncated to the field size
+        return [value if mask is None else int(value) & mask for value, mask in zip(values, self.masks)]
+
+    def pack(self, values):
+        # pack into the preallocated buffer, valid until the next pack
+        self.struct.pack_into(self.buffer, 0, *self.valuesMask(values))
+        return self.buffer
+
+    def toBytes(self, values):
+        # pack into new bytes object, safe to keep and to call from many threads
+        return self.struct.pack(*self.valuesMask(values))
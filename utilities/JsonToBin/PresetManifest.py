@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import tempfile
+from Presets import newFileMode
+
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+# converter sources with the json key map, factors, defaults and the binary layout, a change rebuilds all presets
+CONVERTER_FILE_NAMES = tuple(os.path.join(os.path.dirname(os.path.abspath(__file__)), fileName)
+                             for fileName in ("Presets.py", "PresetLayout.py", "RegisterIndex.py"))
+
+
+def fileHashGet(fileName):
+    digest = hashlib.sha256()
+    with open(fileName, "rb") as hashedFile:
+        for block in iter(lambda: hashedFile.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def presetOutputName(jsonFileName):
+    return os.path.splitext(os.path.basename(jsonFileName))[0] + ".bin"
+
+
+class PresetManifest():
+    # content hashes of the inputs of every preset in the output folder:
+    # a preset is rebuilt when its json changed, a header or converter change rebuilds all presets
+
+    def __init__(self, outputDir, headerFileNames, converterFileNames=CONVERTER_FILE_NAMES):
+        self.fileName = os.path.join(outputDir, MANIFEST_FILE_NAME)
+        self.outputDir = outputDir
+
+        digest = hashlib.sha256()
+        for inputFileName in tuple(headerFileNames) + tuple(converterFileNames):
+            digest.update(fileHashGet(inputFileName).encode())
+        self.inputsHash = digest.hexdigest()
+
+        self.presets = {}
+        self.jsonHashes = {}
+        try:
+            with open(self.fileName, "r") as manifestFile:
+                manifest = json.load(manifestFile)
+            if (manifest.get("version") == MANIFEST_VERSION) and (manifest.get("inputs") == self.inputsHash):
+                self.presets = manifest["presets"]
+        except (OSError, ValueError, AttributeError, KeyError):
+            pass
+
+    def presetStaleGet(self, jsonFileNames):
+        # split jsons to (stale, upToDate), json hashes of the stale ones are kept for presetUpdate
+        self.jsonHashes = {}
+        stale = []
+        upToDate = []
+
+        for jsonFileName in jsonFileNames:
+            outputName = presetOutputName(jsonFileName)
+            jsonHash = fileHashGet(jsonFileName)
+            entry = self.presets.get(outputName)
+            outputFileName = os.path.join(self.outputDir, outputName)
+
+            if (entry is not None) and (entry["json"] == jsonHash) and os.path.isfile(outputFileName) \
+                    and (os.path.getsize(outputFileName) == entry["size"]):
+                upToDate.append(jsonFileName)
+            else:
+                self.jsonHashes[jsonFileName] = jsonHash
+                stale.append(jsonFileName)
+
+        return stale, upToDate
+
+    def presetUpdate(self, jsonFileName, size):
+        outputName = presetOutputName(jsonFileName)
+        self.presets[outputName] = {"json": self.jsonHashes.get(jsonFileName) or fileHashGet(jsonFileName),
+                                    "size": size}
+
+    def presetRemove(self, jsonFileName):
+        outputName = presetOutputName(jsonFileName)
+        self.presets.pop(outputName, None)
+
+    def save(self, jsonFileNames=None):
+        # entries of jsons not in jsonFileNames (deleted jsons) are dropped, all entries are kept without the list
+        if (jsonFileNames is not None):
+            outputNames = set(presetOutputName(jsonFileName) for jsonFileName in jsonFileNames)
+            self.presets = {name: entry for name, entry in self.presets.items() if name in outputNames}
+
+        fd, tempFileName = tempfile.mkstemp(dir=self.outputDir, suffix=".tmp")
+        try:
+            os.fchmod(fd, newFileMode())
+            with os.fdopen(fd, "w") as manifestFile:
+                json.dump({"version": MANIFEST_VERSION, "inputs": self.inputsHash, "presets": self.presets},
+                          manifestFile, indent=2, sort_keys=True)
+            os.replace(tempFileName, self.fileName)
+        except OSError:
+            if (os.path.exists(tempFileName)):
+                os.remove(tempFileName)
+            raise
@@ -1,20 +1,40 @@
 import string
+import json
 import os
 import re
 import struct
+import tempfile
+import threading
 from operator import index
 from os.path import basename
+from RegisterIndex import RegisterIndex
+from PresetLayout import PresetLayout
+
+# json keys are matched without these prefixes, e.g. "aux-param-zunits" -> "zunits"
+JSON_KEY_PREFIXES = ('aux-param-', 'param-', 'controls-')
+
+# compilers of compilePreset per thread, keyed by the shared layout and register index
+compilers = threading.local()
+
+def newFileMode():
+    # permissions open() gives a new file under the current umask, mkstemp files are owner only
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
 
 class Preset():
     def __init__(self):
         self.JsonFileName = "." + os.sep + "Input" + os.sep + "JsonEx.json"
         self.RegsFileName = "." + os.sep + "Input" + os.sep + "Registers_B0.h"
-        self.outCurrBinFile = 0
-        self.jsonFile = 0
-        self.RegsFile = 0
-        self.offset = 0
-        self.PRESET_NAME_MAX_LEN = 20
-        self.StatesDict = { '"off"' : 0, '"laserOn"': 1, '"laserAuto"': 2, '"ledOn"': 3, '"False"' : 0, '"True"' : 1}
+        self.OutputDir = "." + os.sep + "Output"
+        self.outputFileName = None
+        self.jsonValues = {}
+        self.usedJsonFields = set()
+        self.regIndex = None
+        self.layout = None
+        # list json keys missing from the preset, their defaults are used
+        self.verbose = False
+        self.StatesDict = { 'off' : 0, 'on' : 1, 'laserOn': 1, 'laserAuto': 2, 'ledOn': 3, 'False' : 0, 'True' : 1}
         self.dict = {
 
             'et_id' : [{'regFieldName' : 'not_valid', 'jsonFieldName' : 'id', 'factor' : 1, 'default' : 0}],
@@ -142,56 +162,20 @@ class Preset():
             
         }
 
-    def presetWriteVar(self, var, varType, name):
-        
-        if ('float' == varType):
-            varFormat = "%lf"
-            varHex = self.float_to_hex(var);
-            varInt = int(varHex, 0)
-        else:
-            varFormat = "%d"
-            varInt = int(var) 
-
-        if ('int16' in varType):
-            listOffsets = (0,8)
-        else:
-            listOffsets = (0,8,16,24)
+    def presetValuesGet(self, presetName):
+        # values of all layout fields from the loaded json values
+        return [self.presetFieldValueGet(varName, varType, presetName) for varName, varType, _ in self.layout.fields]
 
-        tempList = [self.outCurrBinFile.write(chr(((varInt >> i) & 0xff))) for i in listOffsets]
-
-        return
-
-    def presetVarHandle(self, varType, varName):
-        #print varName
-
-        Val = self.presetVarValueGet('et_' + varName)
-        self.presetWriteVar(Val, varType, varName)
-
-        return
+    def presetFieldValueGet(self, varName, varType, presetName):
 
-    def presetScpWriteVar(self, varType, varName):
-
-        Val32 = 0xDEADBEEF
+        if (varType == "TPresetName"):
+            return presetName.encode()
 
         dicEntryIndex = 'et_' + varName;
         if (self.dict[dicEntryIndex][0]['regFieldName'] == 'not_valid'):
-            Val32 = self.presetVarValueGet('et_' + varName)
+            return self.presetVarValueGet(dicEntryIndex)
         else:
-            Val32 = self.presetRegValueGet('et_' + varName)
-
-        if (Val32 != 0xDEADBEEF):
-            self.presetWriteVar(Val32, varType, varName)
-
-        return
-
-    def regsFileSearch(self, fieldName):
-
-        for tempLine in self.RegsFileLines:
-            if (fieldName in tempLine):
-                #print tempLine
-                break
-        
-        return tempLine
+            return self.presetRegValueGet(dicEntryIndex)
 
     def regsFieldValueGet(self, entry):
 
@@ -199,11 +183,7 @@ class Preset():
         jsonFieldName = entry['jsonFieldName']
         factor = entry['factor']
 
-        fieldLine = self.regsFileSearch('uint32_t ' + regsFieldName)
-        bitsString = fieldLine.split("Bits :[")[1].split("]")[0]
-        shiftBit = int(bitsString.split(":")[0])
-        lastBit = int(bitsString.split(":")[1])
-        mask = ((1 << (lastBit - shiftBit + 1)) - 1)
+        shiftBit, width, mask = self.regIndex.fieldGet(regsFieldName)
 
         fieldFloat = float(self.presetJsonSearch(jsonFieldName, entry['default']))
         if (factor == -1):
@@ -220,8 +200,8 @@ class Preset():
         defaultVal = self.dict[varName][0]['default']
 
         res = self.presetJsonSearch(jsonFieldName, defaultVal)
-        if ((jsonFieldName ==  "laserstate") or (jsonFieldName ==  "autoexposure-auto")):
-            regVal = self.StatesDict[res]
+        if ((jsonFieldName ==  "laserstate") or (jsonFieldName ==  "autoexposure-auto")) and (str(res) in self.StatesDict):
+            regVal = self.StatesDict[str(res)]
         else:
             regVal = float(res)
         return regVal
@@ -233,110 +213,122 @@ class Preset():
             regVal = regVal | regFieldVal
         return regVal
     
-    def presetScpHandle(self):
-        with open("." + os.sep + "Input" + os.sep + "Scp.h", "r") as scpFile:
-            lines = scpFile.readlines()
-
-        for line in lines:
-            #print line            
-            line = line.strip()
-            varType = line.split(" ")[0].strip()
-
-            if ((varType == "float") or (varType == "uint32_t") or (varType == "int32_t") 
-                or ("TRegScp" in varType) or ("ET" in varType)):
-                size = len(line.split(" "))
-                varName = line.split(" ")[size - 1].split(";")[0]
-                self.presetScpWriteVar(varType, varName)
-        return
-
-    def float_to_hex(self, f):
-        return hex(struct.unpack('<I', struct.pack('<f', f))[0])
+    def presetJsonLoad(self):
+        with open(self.JsonFileName, "r") as jsonFile:
+            self.presetJsonValuesSet(json.load(jsonFile))
+
+    def presetJsonValuesSet(self, jsonObj):
+        # one pass over the json object, keys are lowercased and stripped of JSON_KEY_PREFIXES
+        self.jsonValues = {}
+        self.usedJsonFields = set()
+        for key, value in jsonObj.items():
+            key = key.strip().lower()
+            for prefix in JSON_KEY_PREFIXES:
+                if (key.startswith(prefix)):
+                    key = key[len(prefix):]
+                    break
+            self.jsonValues.setdefault(key, value)
 
     def presetJsonSearch(self, fieldName, defaultVal):
-        fieldVal = defaultVal
-
-        for tempLine in self.jsonFileLines:
-            if (fieldName in tempLine):
-                fieldVal = tempLine.split(":")[1].strip().split(",")[0]
-                break
-
-        return fieldVal
-
-    def presetColorCorrectionHandle(self):
-        for idx in range(1, 13):
-            self.presetVarHandle('float', 'colorCorrection' + str(idx))
-        
-        return
-
-    def presetExposureListHandle(self, varType, name):
-        if (name == 'exposureListSize'):
-            self.presetVarHandle(varType, name)
-        else:
-            for idx in range(0, 25):
-                self.presetVarHandle(varType, 'exposure' + str(idx))
-        return
-
-    def PresetNamePrint(self, presetName):
-
-        presetNameLen = len(presetName)
-        for i in range(0, presetNameLen):
-            self.outCurrBinFile.write(presetName[i])
-
-        for i in range(presetNameLen, self.PRESET_NAME_MAX_LEN):
-            self.outCurrBinFile.write('\0')
+        self.usedJsonFields.add(fieldName)
+        value = self.jsonValues.get(fieldName, defaultVal)
+        # json lists, objects and null can not be converted to a preset value
+        if (not isinstance(value, (int, float, str))):
+            raise ValueError("wrong value of " + fieldName + ": " + json.dumps(value))
+        return value
+
+    def presetValidationSummary(self, presetName):
+        knownFields = set(entry['jsonFieldName'] for entries in self.dict.values() for entry in entries)
+        unknownKeys = sorted(set(self.jsonValues) - knownFields)
+        missingKeys = sorted(self.usedJsonFields - set(self.jsonValues))
+
+        if (unknownKeys):
+            print("  " + presetName + ": " + str(len(unknownKeys)) + " unknown keys ignored: " + ", ".join(unknownKeys))
+        if (missingKeys and self.verbose):
+            print("  " + presetName + ": " + str(len(missingKeys)) + " missing keys use defaults: " + ", ".join(missingKeys))
+
+        return unknownKeys, missingKeys
+
+    def presetInputsLoad(self):
+        # registers header, Preset.h and Scp.h are parsed once and shared by all jsons
+        if (self.regIndex is None):
+            self.regIndex = RegisterIndex(self.RegsFileName)
+        if (self.layout is None):
+            self.layout = PresetLayout()
+
+    def presetFileWrite(self, fileName, data):
+        # atomic write, a failed or interrupted conversion never leaves a truncated preset behind
+        fd, tempFileName = tempfile.mkstemp(dir=os.path.dirname(fileName) or ".", suffix=".tmp")
+        try:
+            os.fchmod(fd, newFileMode())
+            with os.fdopen(fd, "wb") as outCurrBinFile:
+                outCurrBinFile.write(data)
+            os.replace(tempFileName, fileName)
+        except OSError:
+            if (os.path.exists(tempFileName)):
+                os.remove(tempFileName)
+            raise
 
     def PresetJsonFileParse(self):
 
-        self.jsonFile = open(self.JsonFileName,"r")
-        self.jsonFileLines = self.jsonFile.readlines()
-        self.RegsFile = open(self.RegsFileName,"r")
-        self.RegsFileLines = self.RegsFile.readlines()
+        try:
+            with open(self.JsonFileName, "r") as jsonFile:
+                jsonObj = json.load(jsonFile)
+            if (not isinstance(jsonObj, dict)):
+                raise ValueError("the top level value is not an object")
+        except ValueError as err:
+            print("error: " + self.JsonFileName + " is not a valid preset json: " + str(err))
+            return -1
+
+        self.presetInputsLoad()
 
         #print os.getcwd()
         presetName = os.path.splitext(basename(self.JsonFileName))[0]
         print(presetName)
         
-        currBinFilePath = "." + os.sep + "Output" + os.sep + presetName + ".bin"
-        self.outCurrBinFile = open(currBinFilePath,"wb+")
-
-        with open("." + os.sep + "Input" + os.sep + "Preset.h", "r") as f:
-            lines = f.readlines()
-
-        for line in lines:
-            #print line
-            
-            line = line.strip()
-            varType = line.split(" ")[0].strip()
-            
-            if (varType == "TPresetName"):
-                self.PresetNamePrint(presetName)
-
-            elif (varType == "STScpParams"):
-                self.presetScpHandle()
-
-            elif ("int" in varType):    #int32_t, uint16_t, uint32_t 
-                varName = line.split(" ")[1].split(";")[0].strip()
-                if ("exposureList" in varName):
-                    self.presetExposureListHandle(varType, varName)  # not supported yet
-                else:
-                    self.presetVarHandle(varType, varName)
-
-            elif ("T_COLOR_CORRECTION_MATRIX_FLOAT" in varType):
-                self.presetColorCorrectionHandle()
-
-
-        self.outCurrBinFile.close()
+        # the file conversion is the in memory compiler followed by one atomic write
+        self.outputFileName = os.path.join(self.OutputDir, presetName + ".bin")
+        data = compilePreset(jsonObj, self.layout, self.regIndex, presetName)
+        self.presetFileWrite(self.outputFileName, data)
+
+        compiler = presetCompilerGet(self.layout, self.regIndex)
+        compiler.verbose = self.verbose
+        compiler.presetValidationSummary(presetName)
         return 0
 
     def PresetHeaderFileGenerate(self, directory):
 
         print("input jsons folder: " + directory)
 
+        self.presetInputsLoad()
 
-        for filename in os.listdir(directory):
+        for filename in sorted(os.listdir(directory)):
             #print filename
             if (filename.endswith(".json")): 
-                self.JsonFileName = directory + os.sep + filename
+                self.JsonFileName = os.path.join(directory, filename)
                 self.PresetJsonFileParse()
 
-        return
\ No newline at end of file
+        return
+
+
+def presetCompilerGet(layout, regIndex):
+    # Preset with the json key map, factors and defaults built once per layout, regIndex and thread,
+    # it keeps the json values of the last compiled preset for presetValidationSummary
+    byInputs = compilers.__dict__.setdefault("byInputs", {})
+    compiler = byInputs.get((id(layout), id(regIndex)))
+    if (compiler is None) or (compiler.layout is not layout) or (compiler.regIndex is not regIndex):
+        compiler = Preset()
+        compiler.layout = layout
+        compiler.regIndex = regIndex
+        byInputs[(id(layout), id(regIndex))] = compiler
+    return compiler
+
+
+def compilePreset(jsonObj, layout, regIndex, presetName = ""):
+    # in memory preset compiler: parsed json object -> preset binary, no file is read or written.
+    # layout and regIndex are compiled once (PresetLayout, RegisterIndex) and shared by all calls,
+    # main.py converts every json file with it
+    compiler = presetCompilerGet(layout, regIndex)
+    compiler.presetJsonValuesSet(jsonObj)
+
+    return layout.toBytes(compiler.presetValuesGet(presetName))
@@ -0,0 +1,69 @@
+import os
+import re
+
+# register field declaration, e.g.
+#   uint32_t Minwest    :4    ; //Bits :[0:3], initial value: 0x1. ...
+FIELD_PATTERN = re.compile(r'^\s*uint32_t\s+(\w+)\s*:\s*\d+\s*;\s*//\s*Bits\s*:\[(\d+):(\d+)\]')
+# end of the field struct inside a register union, e.g. "     } fields_read;"
+FIELDS_END_PATTERN = re.compile(r'^\s*\}\s*fields_\w*\s*;')
+# end of the register union with its type names, e.g. "} RegScpRauThreshold, TRegScpRauThreshold, *PTRegScpRauThreshold;"
+REGISTER_END_PATTERN = re.compile(r'^\s*\}\s*(\w+(?:\s*,\s*\*?\s*\w+)*)\s*;')
+
+
+class RegisterIndex():
+    # register field name -> (shift, width, mask), built once from the registers header
+    # and shared by all presets converted in one run.
+    # Register type name -> [(field name, shift, width, mask)] is kept for decoding of the register words
+
+    def __init__(self, regsFileName = "." + os.sep + "Input" + os.sep + "Registers_B0.h"):
+        self.RegsFileName = regsFileName
+        self.fields = {}
+        self.registers = {}
+        registerFields = []
+        fieldsEnded = False
+
+        with open(regsFileName, "r") as regsFile:
+            for line in regsFile:
+                match = FIELD_PATTERN.match(line)
+                if (match is None):
+                    if (FIELDS_END_PATTERN.match(line)):
+                        fieldsEnded = True
+                    else:
+                        match = REGISTER_END_PATTERN.match(line)
+                        if (match is not None):
+                            for typeName in match.group(1).split(","):
+                                typeName = typeName.strip()
+                                if (not typeName.startswith("*")):
+                                    self.registers.setdefault(typeName, registerFields)
+                            registerFields = []
+                            fieldsEnded = False
+                    continue
+
+                fieldName = match.group(1)
+                shiftBit = int(match.group(2))
+                lastBit = int(match.group(3))
+                width = lastBit - shiftBit + 1
+
+                # field names repeat across registers (Reserved...), the first declaration is used
+                if (fieldName not in self.fields):
+                    self.fields[fieldName] = (shiftBit, width, (1 << width) - 1)
+                # read and write views of a register declare the same fields, the first view is used
+                if (not fieldsEnded):
+                    registerFields.append((fieldName, shiftBit, width, (1 << width) - 1))
+
+    def fieldGet(self, fieldName):
+        # exact match, a field name never matches a longer name sharing its prefix
+        if (fieldName not in self.fields):
+            raise KeyError("register field " + fieldName + " not found in " + self.RegsFileName)
+
+        return self.fields[fieldName]
+
+    def registerFieldsGet(self, typeName):
+        # fields of register type, e.g. TRegScpRauThreshold, empty list for unknown types
+        return self.registers.get(typeName, [])
+
+    def __contains__(self, fieldName):
+        return fieldName in self.fields
+
+    def __len__(self):
+        return len(self.fields)
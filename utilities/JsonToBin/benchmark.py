@@ -0,0 +1,284 @@
+import contextlib
+import getopt
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import main as jsonToBin
+from PresetLayout import PresetLayout
+from Presets import Preset, compilePreset
+from RegisterIndex import RegisterIndex
+
+# converter output checked in with the template, every path must reproduce it
+TEMPLATE_FILE_NAME = "." + os.sep + "Input" + os.sep + "Jsons" + os.sep + "AmazonExample.json"
+GOLDEN_FILE_NAME = "." + os.sep + "Output" + os.sep + "AmazonExample.bin"
+
+
+def usage():
+    scriptName = os.path.basename(sys.argv[0])
+
+    print("Benchmark of the JsonToBin converter stages, the report is printed as json.")
+    print("Syntax: " + scriptName + " [-n presets] [-j jobs] [-s seed] [-r reference_dir] [-o report.json]")
+    print("        -h, --help         prints help info")
+    print("        -n, --presets      number of synthetic presets, default 1000")
+    print("        -j, --jobs         worker processes of the end to end stage, default 1")
+    print("        -s, --seed         random seed of the synthetic presets, default 0")
+    print("        -k, --keep         keep the synthetic jsons and outputs in the given folder")
+    print("        -r, --reference    folder of .bin files of another implementation for the same presets")
+    print("Every path must reproduce ." + os.sep + "Output" + os.sep + "AmazonExample.bin from its json,")
+    print("peak_rss_children_kib is the peak of the largest worker process of -j.")
+    print("        -o, --output       write the report into file instead of standard output")
+    sys.exit(1)
+
+
+def presetJsonsGenerate(directory, count, seed, templateFileName = TEMPLATE_FILE_NAME):
+    # synthetic preset jsons: every numeric value of the template is randomly scaled, states are kept
+    with open(templateFileName, "r") as templateFile:
+        template = json.load(templateFile)
+
+    generator = random.Random(seed)
+    fileNames = []
+
+    for idx in range(count):
+        jsonObj = {}
+        for key, value in template.items():
+            if (isinstance(value, bool)) or (not isinstance(value, (int, float))):
+                jsonObj[key] = value
+            elif (isinstance(value, int)):
+                jsonObj[key] = max(0, int(value * generator.uniform(0.5, 1.5)))
+            else:
+                jsonObj[key] = value * generator.uniform(0.5, 1.5)
+
+        fileNames.append(os.path.join(directory, "Synthetic%05d.json" % idx))
+        with open(fileNames[-1], "w") as jsonFile:
+            json.dump(jsonObj, jsonFile, indent=2)
+
+    return fileNames
+
+
+def peakRssGet(who = resource.RUSAGE_SELF):
+    # peak resident set size in KiB, ru_maxrss is in bytes on macOS
+    # RUSAGE_CHILDREN is the largest of the terminated worker processes, not their sum
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if (sys.platform == "darwin") else peak
+
+
+def goldenMismatchesGet(workDir, layout, regIndex, jobs, templateFileName = TEMPLATE_FILE_NAME,
+                        goldenFileName = GOLDEN_FILE_NAME):
+    # the template converted by every path compared with the checked in output of the converter,
+    # returns names of the paths with different bytes
+    with open(goldenFileName, "rb") as goldenFile:
+        golden = goldenFile.read()
+    presetName = os.path.splitext(os.path.basename(goldenFileName))[0]
+    goldenDir = os.path.join(workDir, "golden")
+    os.makedirs(goldenDir, exist_ok=True)
+    jsonFileName = os.path.join(goldenDir, presetName + ".json")
+    shutil.copyfile(templateFileName, jsonFileName)
+    outputs = {}
+
+    preset = Preset()
+    preset.layout = layout
+    preset.regIndex = regIndex
+    preset.JsonFileName = jsonFileName
+    with contextlib.redirect_stdout(io.StringIO()):
+        preset.presetJsonLoad()
+    preset.presetFileWrite(os.path.join(goldenDir, "pack.bin"), layout.pack(preset.presetValuesGet(presetName)))
+    with open(os.path.join(goldenDir, "pack.bin"), "rb") as outputFile:
+        outputs["pack_write"] = outputFile.read()
+
+    with open(jsonFileName, "r") as jsonFile:
+        outputs["compile_in_memory"] = compilePreset(json.load(jsonFile), layout, regIndex, presetName)
+
+    converter = Preset()
+    converter.OutputDir = os.path.join(goldenDir, "output")
+    os.makedirs(converter.OutputDir, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        jsonToBin.presetsConvert([jsonFileName], converter, jobs)
+    outputFileName = os.path.join(converter.OutputDir, presetName + ".bin")
+    outputs["end_to_end"] = None
+    if (os.path.isfile(outputFileName)):
+        with open(outputFileName, "rb") as outputFile:
+            outputs["end_to_end"] = outputFile.read()
+
+    return [stageName for stageName, data in outputs.items() if (data != golden)]
+
+
+def stageReport(seconds, count):
+    return {"seconds": round(seconds, 6), "count": count,
+            "per_second": round(count / seconds, 1) if (seconds > 0) else None}
+
+
+def benchmarkRun(workDir, count, jobs, seed, referenceDir = None):
+    report = {"presets": count, "jobs": jobs, "seed": seed, "stages": {}}
+    stages = report["stages"]
+
+    jsonDir = os.path.join(workDir, "jsons")
+    os.makedirs(jsonDir, exist_ok=True)
+    start = time.perf_counter()
+    jsonFileNames = presetJsonsGenerate(jsonDir, count, seed)
+    stages["generate_jsons"] = stageReport(time.perf_counter() - start, count)
+
+    start = time.perf_counter()
+    layout = PresetLayout()
+    stages["layout_parse"] = stageReport(time.perf_counter() - start, 1)
+
+    start = time.perf_counter()
+    regIndex = RegisterIndex()
+    stages["register_index"] = stageReport(time.perf_counter() - start, 1)
+
+    preset = Preset()
+    preset.layout = layout
+    preset.regIndex = regIndex
+    registerFields = [varName for varName, varType, _ in layout.fields
+                      if (varType != "TPresetName") and (preset.dict['et_' + varName][0]['regFieldName'] != 'not_valid')]
+    valueFields = [varName for varName, varType, _ in layout.fields
+                   if (varType != "TPresetName") and (varName not in registerFields)]
+    presetNames = [os.path.splitext(os.path.basename(fileName))[0] for fileName in jsonFileNames]
+
+    # json parse: load and key normalization of every json
+    start = time.perf_counter()
+    jsonValues = []
+    for jsonFileName in jsonFileNames:
+        preset.JsonFileName = jsonFileName
+        preset.presetJsonLoad()
+        jsonValues.append(preset.jsonValues)
+    stages["json_parse"] = stageReport(time.perf_counter() - start, count)
+
+    # json lookups: values of the plain (not register) fields
+    start = time.perf_counter()
+    for values in jsonValues:
+        preset.jsonValues = values
+        for varName in valueFields:
+            preset.presetVarValueGet('et_' + varName)
+    stages["json_lookup"] = stageReport(time.perf_counter() - start, count * len(valueFields))
+
+    # register lookups: register words built from their bitfields
+    start = time.perf_counter()
+    for values in jsonValues:
+        preset.jsonValues = values
+        for varName in registerFields:
+            preset.presetRegValueGet('et_' + varName)
+    stages["register_lookup"] = stageReport(time.perf_counter() - start, count * sum(
+        len(preset.dict['et_' + varName]) for varName in registerFields))
+
+    # binary writes: pack and atomic write of every preset, values are resolved beforehand
+    allValues = []
+    for values, presetName in zip(jsonValues, presetNames):
+        preset.jsonValues = values
+        allValues.append(preset.presetValuesGet(presetName))
+
+    packDir = os.path.join(workDir, "pack")
+    os.makedirs(packDir, exist_ok=True)
+    start = time.perf_counter()
+    for values, presetName in zip(allValues, presetNames):
+        preset.presetFileWrite(os.path.join(packDir, presetName + ".bin"), layout.pack(values))
+    stages["pack_write"] = stageReport(time.perf_counter() - start, count)
+
+    # in memory compiler on the parsed json objects
+    jsonObjs = []
+    for jsonFileName in jsonFileNames:
+        with open(jsonFileName, "r") as jsonFile:
+            jsonObjs.append(json.load(jsonFile))
+    start = time.perf_counter()
+    compiled = [compilePreset(jsonObj, layout, regIndex, presetName)
+                for jsonObj, presetName in zip(jsonObjs, presetNames)]
+    stages["compile_in_memory"] = stageReport(time.perf_counter() - start, count)
+
+    # end to end conversion of main.py, messages of the presets are dropped
+    endToEndDir = os.path.join(workDir, "output")
+    os.makedirs(endToEndDir, exist_ok=True)
+    converter = Preset()
+    converter.OutputDir = endToEndDir
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = jsonToBin.presetsConvert(jsonFileNames, converter, jobs)
+    stages["end_to_end"] = stageReport(time.perf_counter() - start, count)
+
+    # the paths share presetValuesGet and the packing, the golden output of the template checks them against
+    # the converter output checked in with the repository, the synthetic presets are compared between the paths
+    goldenMismatches = goldenMismatchesGet(workDir, layout, regIndex, jobs)
+
+    # outputs of all implementations must be byte identical
+    mismatches = []
+    for presetName, compiledData, (_, status, _, _, _) in zip(presetNames, compiled, results):
+        outputs = {"compile_in_memory": compiledData}
+        for stageName, directory in (("pack_write", packDir), ("end_to_end", endToEndDir), ("reference", referenceDir)):
+            if (directory is None):
+                continue
+            fileName = os.path.join(directory, presetName + ".bin")
+            if (os.path.isfile(fileName)):
+                with open(fileName, "rb") as outputFile:
+                    outputs[stageName] = outputFile.read()
+            else:
+                outputs[stageName] = None
+        if (status != 0) or (len(set(outputs.values())) != 1):
+            mismatches.append(presetName)
+
+    report["identical"] = (not mismatches) and (not goldenMismatches)
+    report["mismatches"] = mismatches[:100]
+    report["golden_mismatches"] = goldenMismatches
+    report["peak_rss_kib"] = peakRssGet()
+    report["peak_rss_children_kib"] = peakRssGet(resource.RUSAGE_CHILDREN)
+
+    return report
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:j:s:k:r:o:",
+                                   longopts=["help", "presets=", "jobs=", "seed=", "keep=", "reference=", "output="])
+    except getopt.GetoptError as err:
+        print("error: " + str(err))
+        usage()
+
+    count = 1000
+    jobs = 1
+    seed = 0
+    keepDir = None
+    referenceDir = None
+    outputFileName = None
+
+    try:
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage()
+            elif opt in ("-n", "--presets"):
+                count = int(arg)
+            elif opt in ("-j", "--jobs"):
+                jobs = int(arg) or os.cpu_count() or 1
+            elif opt in ("-s", "--seed"):
+                seed = int(arg)
+            elif opt in ("-k", "--keep"):
+                keepDir = arg
+            elif opt in ("-r", "--reference"):
+                referenceDir = arg
+            elif opt in ("-o", "--output"):
+                outputFileName = arg
+    except ValueError as err:
+        print("error: " + str(err))
+        usage()
+
+    workDir = keepDir or tempfile.mkdtemp(prefix="json_to_bin_benchmark_")
+    try:
+        report = benchmarkRun(workDir, count, jobs, seed, referenceDir)
+    finally:
+        if (keepDir is None):
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if (outputFileName):
+        with open(outputFileName, "w") as outputFile:
+            outputFile.write(text + "\n")
+    else:
+        print(text)
+
+    return 0 if report["identical"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
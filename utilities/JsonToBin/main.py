@@ -1,25 +1,136 @@
+import contextlib
+import getopt
+import io
+import multiprocessing
 import sys
 import os
+import time
 from Presets import Preset
+from PresetManifest import PresetManifest
+
+# preset converter of the worker process, set by workerInit
+workerPreset = None
+
+
+def usage():
+    scriptName = os.path.basename(sys.argv[0])
+
+    print("Syntax: " + scriptName + " [-j jobs] [-o output_dir] [-v] [jsons_dir]")
+    print("        -h, --help         prints help info")
+    print("        -j, --jobs         number of worker processes, default 1, 0 - one per core")
+    print("        -o, --output-dir   output folder, default ." + os.sep + "Output")
+    print("        -f, --force        rebuild all presets, by default only presets with changed json,")
+    print("                           headers or converter are rebuilt")
+    print("        -v, --verbose      list json keys missing from every preset, their defaults are used")
+    sys.exit(1)
+
+
+def workerInit(preset):
+    # registers index and preset layout are loaded by the parent and sent once per worker
+    global workerPreset
+    workerPreset = preset
+
+
+def presetConvert(jsonFileName):
+    # convert one json, its messages are returned instead of printed so the summary is not interleaved
+    messages = io.StringIO()
+    start = time.perf_counter()
+
+    with contextlib.redirect_stdout(messages):
+        workerPreset.JsonFileName = jsonFileName
+        try:
+            status = workerPreset.PresetJsonFileParse()
+        except (OSError, KeyError, ValueError, TypeError) as err:
+            print("error: " + jsonFileName + ": " + str(err))
+            status = -1
+
+    size = os.path.getsize(workerPreset.outputFileName) if (status == 0) else 0
+    return jsonFileName, status, size, time.perf_counter() - start, messages.getvalue()
+
+
+def presetsConvert(jsonFileNames, preset, jobs):
+    # convert jsons in a process pool, jobs == 1 converts in this process
+    preset.presetInputsLoad()
+
+    if (jobs == 1):
+        workerInit(preset)
+        return list(map(presetConvert, jsonFileNames))
+
+    with multiprocessing.Pool(jobs, workerInit, (preset,)) as pool:
+        return pool.map(presetConvert, jsonFileNames)
 
 
 def main():
 
     print("Json to Preset H-file ...")
 
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hj:o:fv",
+                                   longopts=["help", "jobs=", "output-dir=", "force", "verbose"])
+    except getopt.GetoptError as err:
+        print("error: " + str(err))
+        usage()
+
     preset = Preset()
+    jobs = 1
+    force = False
 
-    paramsNum = len(sys.argv) 
-    if (paramsNum > 1):
-        directory = sys.argv[1]
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+        elif opt in ("-j", "--jobs"):
+            if (not arg.isdigit()):
+                print("error: wrong number of jobs " + arg)
+                usage()
+            jobs = int(arg) or os.cpu_count() or 1
+        elif opt in ("-o", "--output-dir"):
+            preset.OutputDir = arg
+        elif opt in ("-f", "--force"):
+            force = True
+        elif opt in ("-v", "--verbose"):
+            preset.verbose = True
+
+    if (len(args) > 0):
+        directory = args[0]
         #print directory
-        preset.PresetHeaderFileGenerate(directory)
     else:
         directory = "." + os.sep + "Input" + os.sep + "Jsons" + os.sep
-        preset.PresetHeaderFileGenerate(directory)
 
+    print("input jsons folder: " + directory)
+    jsonFileNames = [os.path.join(directory, fileName) for fileName in sorted(os.listdir(directory))
+                     if fileName.endswith(".json")]
+    os.makedirs(preset.OutputDir, exist_ok=True)
+
+    start = time.perf_counter()
+    preset.presetInputsLoad()
+    manifest = PresetManifest(preset.OutputDir,
+                              (preset.RegsFileName, preset.layout.PresetFileName, preset.layout.ScpFileName))
+    if (force):
+        staleFileNames, upToDateFileNames = jsonFileNames, []
+    else:
+        staleFileNames, upToDateFileNames = manifest.presetStaleGet(jsonFileNames)
+
+    results = presetsConvert(staleFileNames, preset, jobs)
+
+    failed = 0
+    for jsonFileName, status, size, fileElapsed, messages in results:
+        sys.stdout.write(messages)
+        if (status != 0):
+            failed += 1
+            manifest.presetRemove(jsonFileName)
+        else:
+            manifest.presetUpdate(jsonFileName, size)
+        print("  %-40s %6d bytes %8.2f ms%s" % (os.path.basename(jsonFileName), size, fileElapsed * 1000,
+                                                 "" if (status == 0) else "  FAILED"))
+
+    manifest.save(jsonFileNames)
+    elapsed = time.perf_counter() - start
+
+    print("%d presets converted, %d failed, %d up to date, %d jobs, %.3f s" % (len(results) - failed, failed,
+                                                                             len(upToDateFileNames), jobs, elapsed))
     print("Done")
 
+    return 1 if failed else 0
+
 if __name__ == "__main__":
-    main()
-                        
\ No newline at end of file
+    sys.exit(main())